@@ -1,7 +1,8 @@
-import json
 import logging
 
-from recommender.utils import split_dataset, evaluate, check_dataset
+from recommender.streaming import iter_interactions, split_interactions
+from recommender.evaluation import evaluate_ranking
+from recommender.utils import evaluate, check_dataset
 from recommender.baseline_recommender import Recommender
 # from recommender.recommender_exluded_history import Recommender
 # from recommender.normalized_recommender import Recommender
@@ -9,21 +10,30 @@ from recommender.baseline_recommender import Recommender
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s')
 
-dataset = json.load(open('data/dataset.json', 'r'))
-logging.info('Dataset size = %d', len(dataset))
+# The dataset is streamed (and split by a hash of each interaction), it is never loaded as a whole.
+dataset_filename = 'data/dataset.json'
 
-train_dataset, test_dataset = split_dataset(dataset)
-logging.info('Train set size = %d', len(train_dataset))
-logging.info('Test set size = %d', len(test_dataset))
 
-check_dataset(train_dataset, test_dataset)
+def train_dataset():
+    return split_interactions(iter_interactions(dataset_filename))
 
-recommender = Recommender()
-for n_interaction, interaction in enumerate(train_dataset):
-    recommender.put_interaction(**interaction, weight=1.0)
-logging.info('Inserted %d interactions', n_interaction + 1)
+
+def test_dataset():
+    return split_interactions(iter_interactions(dataset_filename), test=True)
+
+
+check_dataset(train_dataset(), test_dataset())
+
+recommender = Recommender()  # Use Recommender(sparse=True) to store the network in arrays, vectorized=True to score them by matrix products.
+# Recommender(max_neighbours=50, max_edges=20000) bounds the cost of each recommendation (for the path-based recommenders).
+# Recommender(item_index=ItemIndex(n_neighbours=100)) scores the paths by a precomputed item-item index (baseline, excluded history).
+n_interactions = recommender.put_interactions(train_dataset(), weight=1.0)
+logging.info('Inserted %d interactions', n_interactions)
 
 # recommender.detect_user_neighbours()
 
-performance = evaluate(recommender, test_dataset)
-logging.info('Recommender performance = %.2f%%', performance * 100)
\ No newline at end of file
+performance = evaluate(recommender, test_dataset())
+logging.info('Recommender performance = %.2f%%', performance * 100)
+
+# Precision, recall, NDCG, MAP@k, coverage and the slowest users, the users are split among n_jobs processes.
+# report = evaluate_ranking(recommender, test_dataset(), k=10, n_jobs=4)
@@ -0,0 +1,42 @@
+import logging
+import time
+
+from recommender.lsh import MinHashLSH
+from recommender.neighbours import NETWORK_ARRAYS, get_candidates
+from recommender.streaming import iter_interactions
+from recommender.utils import evaluate_neighbours
+from recommender.user_neighbours_recommender import Recommender
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s')
+
+# The dataset is streamed by each recommender, it is never loaded as a whole.
+dataset_filename = 'data/dataset.json'
+
+# The exact heuristic and the MinHash LSH candidates.
+recommenders = {'exact': Recommender(sparse=True), 'lsh': Recommender(sparse=True, candidate_generator=MinHashLSH())}
+build_times = {}
+query_times = {}
+
+for name, recommender in recommenders.items():
+    start = time.perf_counter()
+    n_interactions = recommender.put_interactions(iter_interactions(dataset_filename), weight=1.0)
+    recommender.detect_user_neighbours()
+    build_times[name] = time.perf_counter() - start
+    logging.info('%s: inserted %d interactions', name, n_interactions)
+
+    # Candidates of a sample of users.
+    graph = recommender.graph
+    arrays = {array_name: getattr(graph, array_name) for array_name in NETWORK_ARRAYS}
+    sample_ids = graph.user_offset2id[:1000]
+    start = time.perf_counter()
+    for user_id in sample_ids:
+        if recommender.candidate_generator is not None:
+            recommender.candidate_generator.query(user_id=user_id)
+        else:
+            get_candidates(arrays, graph.user_id2offset[user_id])
+    query_times[name] = (time.perf_counter() - start) / len(sample_ids)
+
+    logging.info('%s: build (ingestion and neighbours detection) %.2fs, candidates query %.3fms', name, build_times[name], query_times[name] * 1000)
+
+evaluate_neighbours(recommenders['exact'], recommenders['lsh'], recommenders['exact'].graph.user_offset2id)
+logging.info('Build speedup = %.2fx, query speedup = %.2fx', build_times['exact'] / build_times['lsh'], query_times['exact'] / query_times['lsh'])
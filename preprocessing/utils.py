@@ -1,7 +1,20 @@
-def load_dataset(filename):
-    """ Load specified dataset from CSV, provide some data postprocessing.
+import argparse
+import csv
+import io
+import json
+import locale
+import logging
+import os
+
+from array import array
+from multiprocessing import get_context
+
+import numpy as np
+
+
+def iter_dataset(filename):
+    """ Iterate interactions of the specified dataset in CSV, provide some data postprocessing.
     """
-    dataset = []
     with open(filename, 'r') as raw_data:
         for n_line, line in enumerate(raw_data):
             if not n_line:
@@ -16,12 +29,16 @@ def load_dataset(filename):
             if not rating:
                 continue
 
-            dataset.append({
+            yield {
                 'user_id': user_id,
                 'item_id': item_id
-            })
+            }
 
-    return dataset
+
+def load_dataset(filename):
+    """ Load specified dataset from CSV, provide some data postprocessing.
+    """
+    return list(iter_dataset(filename))
 
 
 def anonymize_dataset(dataset):
@@ -52,3 +69,153 @@ def anonymize_dataset(dataset):
         })
 
     return anonymized_dataset
+
+
+def get_blocks(filename, block_size=64 * 1024 * 1024, quote_char=b'"'):
+    """
+    Split the file into blocks (start, end) of about block_size bytes, the blocks end at record boundaries.
+    A line break ends a record only outside of the quoted fields, i.e. after an even number of the quote characters
+    of the block (an escaped quote is doubled, so it keeps the parity). Quoted fields may thus contain line breaks.
+    """
+    file_size = os.path.getsize(filename)
+    blocks = []
+    with open(filename, 'rb') as raw_data:
+        start = 0
+        while start < file_size:
+            data = raw_data.read(block_size) + raw_data.readline()
+            n_quotes = data.count(quote_char)
+            while n_quotes % 2 and raw_data.tell() < file_size:
+                n_quotes += raw_data.readline().count(quote_char)
+            end = min(raw_data.tell(), file_size)
+            blocks.append((start, end))
+            start = end
+    return blocks
+
+
+def parse_block(block):
+    """
+    Parse a block (filename, start, end, encoding) of the CSV ratings, skip the zero ratings and the header.
+    Return the tables of the block's user and item ids (in the order of the first occurrence) and the arrays
+    of the interactions' offsets into these tables.
+    """
+    filename, start, end, encoding = block
+    with open(filename, 'rb') as raw_data:
+        raw_data.seek(start)
+        records = csv.reader(io.StringIO(raw_data.read(end - start).decode(encoding), newline=''), delimiter=';')
+    if not start:
+        next(records, None)
+
+    user_id2offset = {}
+    item_id2offset = {}
+    user_offsets = array('i')
+    item_offsets = array('i')
+    for data_fields in records:
+        if not data_fields or not float(data_fields[2]):
+            continue
+
+        user_offsets.append(user_id2offset.setdefault(data_fields[0], len(user_id2offset)))
+        item_offsets.append(item_id2offset.setdefault(data_fields[1], len(item_id2offset)))
+
+    return list(user_id2offset), list(item_id2offset), np.frombuffer(user_offsets, dtype=np.int32), np.frombuffer(item_offsets, dtype=np.int32)
+
+
+def intern_ids(ids, id2offset):
+    """ Return the global offsets of the block's ids, new ids are appended to the id2offset table.
+    """
+    return np.fromiter((id2offset.setdefault(id_, len(id2offset)) for id_ in ids), dtype=np.int32, count=len(ids))
+
+
+def write_ids(filename, ids):
+    """ Write an id table, one id per line (the line number is the offset).
+    """
+    with open(filename, 'w') as ids_file:
+        ids_file.write('\n'.join(ids))
+
+
+def preprocess_dataset(filename, output, anonymize=True, n_jobs=1, block_size=64 * 1024 * 1024, encoding=None):
+    """
+    Convert the CSV ratings into the format read by recommender.streaming.iter_interactions, return the number of interactions.
+    The output is a directory with the binary format (see recommender.streaming.iter_binary), or JSON-lines if it ends with .jsonl.
+
+    The file is parsed in blocks of block_size bytes, with n_jobs > 1 by forked worker processes. Each id is interned
+    to an integer offset only once, the offsets are numbered by the first occurrence as in anonymize_dataset.
+    With anonymize, the ids are replaced by user_0000 and item_0000 and the original ids are saved in the tables
+    original_user_ids.txt and original_item_ids.txt (the line number is the offset, i.e. the number of the new id).
+    Only the interned ids and the int32 offsets are kept in the memory.
+    The file is read in the encoding of the locale by default, as by open (and load_dataset). The encoding must
+    keep the quotes and line breaks as single bytes (e.g. UTF-8 or Latin-1), as the blocks are split by them.
+    """
+    user_id2offset = {}
+    item_id2offset = {}
+    user_offsets = []
+    item_offsets = []
+
+    encoding = encoding if encoding is not None else locale.getpreferredencoding(False)
+    blocks = [(filename, start, end, encoding) for start, end in get_blocks(filename, block_size)]
+
+    def intern_blocks(parsed_blocks):
+        for n_block, (user_ids, item_ids, block_user_offsets, block_item_offsets) in enumerate(parsed_blocks):
+            # The offsets into the block's tables are mapped to the global offsets by an array lookup.
+            user_offsets.append(intern_ids(user_ids, user_id2offset)[block_user_offsets])
+            item_offsets.append(intern_ids(item_ids, item_id2offset)[block_item_offsets])
+            logging.info('Preprocessed %d (%d%%) blocks', n_block + 1, (n_block + 1) * 100 / len(blocks))
+
+    if n_jobs == 1:
+        intern_blocks(map(parse_block, blocks))
+    else:
+        # The with statement terminates the pool when a block fails, otherwise the workers are joined first.
+        with get_context('fork').Pool(n_jobs) as pool:
+            intern_blocks(pool.imap(parse_block, blocks))
+            pool.close()
+            pool.join()
+
+    user_offsets = np.concatenate(user_offsets) if user_offsets else np.zeros(0, dtype=np.int32)
+    item_offsets = np.concatenate(item_offsets) if item_offsets else np.zeros(0, dtype=np.int32)
+    user_ids, item_ids = list(user_id2offset), list(item_id2offset)
+    del user_id2offset, item_id2offset
+
+    if output.endswith('.jsonl'):
+        tables_prefix = output[:-len('.jsonl')] + '_'
+    else:
+        os.makedirs(output, exist_ok=True)
+        tables_prefix = output + os.sep
+
+    if anonymize:
+        write_ids(tables_prefix + 'original_user_ids.txt', user_ids)
+        write_ids(tables_prefix + 'original_item_ids.txt', item_ids)
+        user_ids = ['user_{:04}'.format(user_offset) for user_offset in range(len(user_ids))]
+        item_ids = ['item_{:04}'.format(item_offset) for item_offset in range(len(item_ids))]
+    write_ids(tables_prefix + 'user_ids.txt', user_ids)
+    write_ids(tables_prefix + 'item_ids.txt', item_ids)
+
+    if output.endswith('.jsonl'):
+        with open(output, 'w') as json_file:
+            for start in range(0, len(user_offsets), 1024 * 1024):
+                chunk = zip(user_offsets[start:start + 1024 * 1024].tolist(), item_offsets[start:start + 1024 * 1024].tolist())
+                json_file.writelines(json.dumps({'user_id': user_ids[user_offset], 'item_id': item_ids[item_offset]}) + '\n'
+                                     for user_offset, item_offset in chunk)
+    else:
+        np.save(os.path.join(output, 'user_offsets.npy'), user_offsets)
+        np.save(os.path.join(output, 'item_offsets.npy'), item_offsets)
+
+    logging.info('Preprocessed %d interactions of %d users and %d items', len(user_offsets), len(user_ids), len(item_ids))
+    return len(user_offsets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert the CSV ratings into the binary format or JSON-lines.')
+    parser.add_argument('filename', help='The CSV ratings ("user";"item";"rating" with a header line).')
+    parser.add_argument('output', help='A directory for the binary format, or a *.jsonl file.')
+    parser.add_argument('--keep-ids', action='store_true', help='Do not anonymize the ids.')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of the parsing processes.')
+    parser.add_argument('--block-size', type=int, default=64, help='Size of the parsed blocks in MB.')
+    parser.add_argument('--encoding', help='The encoding of the file, the locale encoding by default.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s')
+    preprocess_dataset(args.filename, args.output, anonymize=not args.keep_ids, n_jobs=args.jobs,
+                       block_size=args.block_size * 1024 * 1024, encoding=args.encoding)
+
+
+if __name__ == '__main__':
+    main()
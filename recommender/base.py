@@ -0,0 +1,366 @@
+"""Methods shared by the recommenders, built on their put_interaction and network."""
+
+import time
+
+from collections import defaultdict
+from math import sqrt
+
+from recommender import instrumentation
+from recommender.bounded import SAMPLINGS, NeighbourLists, get_dict_accessors, get_graph_accessors, walk_paths
+from recommender.path_cache import ItemPathsCache
+from recommender.scoring import recommend_each, recommend_offsets, recommend_many
+from recommender.sparse_graph import SparseGraph
+
+
+class InteractionsMixin(object):
+    """ Batch insertion of the interactions, a subclass (a recommender or a wrapper of one) implements put_interaction.
+    """
+    def put_interactions(self, interactions, weight=1.0):
+        """ Add all interactions (dicts with user_id and item_id) from an iterable, return their number.
+        """
+        n_interactions = 0
+        for interaction in interactions:
+            self.put_interaction(interaction['user_id'], interaction['item_id'], interaction.get('weight', weight))
+            n_interactions += 1
+
+        return n_interactions
+
+
+class SetInteractionsMixin(object):
+    """
+    Setting the weights of the edges for a recommender with users, items (its dict nodes) and graph (its SparseGraph,
+    or None). Unlike put_interaction, a lower weight replaces the higher one and the zero weight removes the edge.
+    The recommender updates the structures derived from its network (e.g. norms or indexes) by the after_set methods.
+
+    """
+    def set_interaction(self, user_id, item_id, weight):
+        """
+        Set the weight of an edge, unlike put_interaction a lower weight replaces the higher one.
+        The zero (or a negative) weight removes the edge, the user and the item are kept.
+        """
+        self.set_interactions([{'user_id': user_id, 'item_id': item_id, 'weight': weight}])
+
+    def set_interactions(self, interactions):
+        """ Set the weights of all edges (dicts with user_id, item_id and weight) from an iterable, return their number.
+        """
+        interactions = list(interactions)
+        if self.graph is not None:
+            self.graph.set_interactions([interaction['user_id'] for interaction in interactions],
+                                        [interaction['item_id'] for interaction in interactions],
+                                        [interaction['weight'] for interaction in interactions])
+            self.after_set_graph_interactions(interactions)
+            return len(interactions)
+
+        for interaction in interactions:
+            user_id, item_id, weight = interaction['user_id'], interaction['item_id'], interaction['weight']
+            user = self.users.get(user_id)
+            if user is None or item_id not in user.user_profile:
+                if weight > 0:
+                    self.put_interaction(user_id, item_id, weight)
+                continue
+
+            # A removed edge is zeroed first, so the derived structures see the profiles without it.
+            item = self.items[item_id]
+            old_weight = user.user_profile[item_id]
+            user.user_profile[item_id] = item.item_profile[user_id] = max(weight, 0.0)
+            self.after_set_interaction(user, item, old_weight, max(weight, 0.0))
+            if weight <= 0:
+                del user.user_profile[item_id]
+                del item.item_profile[user_id]
+
+        return len(interactions)
+
+    def after_set_graph_interactions(self, interactions):
+        """ Update the structures derived from the array-backed network after the interactions were set.
+        """
+
+    def after_set_interaction(self, user, item, old_weight, weight):
+        """ Update the structures derived from the dict network after an edge was set (a removed one has the zero weight).
+        """
+
+
+class NormMixin(object):
+    """
+    The norm of a node, i.e. the square root of the sum of the transformed weights (w ** w) of its profile, the profile
+    is the attribute named by profile_name. The norm and the sum (squared_norm) are stored in the node.
+
+    """
+    __slots__ = ()
+    profile_name = None
+
+    def update_norm(self):
+        """ Calculate the node's norm.
+        """
+        self.squared_norm = sum([weight ** weight for weight in getattr(self, self.profile_name).values()])
+        self.norm = sqrt(self.squared_norm)
+
+    def update_norm_online(self, old_weight, new_weight):
+        """
+        Update the norm in O(1) after one weight in the profile was changed
+        (old_weight is None for a new one, new_weight is None for a removed one).
+        """
+        self.squared_norm += (new_weight ** new_weight if new_weight is not None else 0.0) - (old_weight ** old_weight if old_weight is not None else 0.0)
+        # Removals may leave a tiny negative rounding error.
+        self.norm = sqrt(max(self.squared_norm, 0.0))
+
+
+@instrumentation.probed
+class PathsMixin(object):
+    """
+    The recommendation modes of a recommender scoring the paths of the length 3 (user, item, neighbour, neighbour's item):
+    the dict network (by get_item_scores, or by the item paths shared in recommend_many), the array-backed network
+    walked by the loops (sparse) or scored by the matrix products (vectorized), the bounded walks and the item index.
+    The recommender differs only by its scoring_options: exclude_history skips the items of the user's profile,
+    normalize divides the weights of the user and of the neighbour by their norms.
+
+    """
+    max_cached_paths = 1000000  # Entries of the item paths cached by recommend_many in one block.
+    scoring_options = {}  # How the vectorized scoring reproduces the recommend method.
+
+    def __init__(self, sparse=False, vectorized=False, max_neighbours=None, sampling='top', max_edges=None, item_index=None, compact=False):
+        self.users = dict()  # {user_id => User()}
+        self.items = dict()  # {item_id => Item()}
+        self.graph = SparseGraph() if sparse or vectorized else None  # The array-backed network used instead of the dicts.
+        self.vectorized = vectorized  # Score the paths by the sparse matrix products instead of the loops.
+
+        if compact and self.graph is not None:
+            raise ValueError('The compact nodes store the dict network, they cannot be used with sparse or vectorized')
+        self.compact = compact  # Store the users and items in the compact nodes (see recommender.nodes).
+
+        # Bounded cost of recommend (see bounded.walk_paths), the vectorized scoring is not used then.
+        if sampling not in SAMPLINGS:
+            raise ValueError('Unknown sampling {}, use one of {}'.format(sampling, ', '.join(SAMPLINGS)))
+        self.max_neighbours = max_neighbours  # At most max_neighbours users of each item are expanded.
+        self.sampling = sampling  # How the expanded users are selected: 'top' (the highest weights) or 'weighted' (a sample).
+        self.max_edges = max_edges  # At most max_edges edges are visited by one recommendation.
+        # The expanded users of each item (by item ids, or offsets in the array-backed network), kept by put_interaction.
+        self.neighbour_lists = NeighbourLists(max_neighbours, sampling) if max_neighbours is not None else None
+
+        if item_index is not None and self.graph is not None:
+            raise ValueError('The item index is built from the dict network, it cannot be used with sparse or vectorized')
+        if item_index is not None and self.bounded:
+            raise ValueError('The item index looks up all paths, it cannot be used with max_neighbours or max_edges')
+        self.item_index = item_index  # A precomputed ItemIndex scoring the paths by lookups, or None to walk the paths.
+
+    @property
+    def bounded(self):
+        """ Whether the cost of recommend is bounded.
+        """
+        return self.max_neighbours is not None or self.max_edges is not None
+
+    def after_set_graph_interactions(self, interactions):
+        """ Drop the neighbour lists of the changed items.
+        """
+        if self.neighbour_lists is not None:
+            for interaction in interactions:
+                # Removals of unknown edges are skipped by the graph, so their items may have no offsets.
+                if interaction['item_id'] in self.graph.item_id2offset:
+                    self.neighbour_lists.invalidate(self.graph.item_id2offset[interaction['item_id']])
+
+    def after_set_interaction(self, user, item, old_weight, weight):
+        """ Drop the neighbour list of the item and update the item index by the changed edge.
+        """
+        if self.neighbour_lists is not None:
+            self.neighbour_lists.invalidate(item.item_id)
+        if self.item_index is not None:
+            self.item_index.put_interaction(user.user_id, item.item_id, old_weight, weight, self.users, self.items)
+
+    @instrumentation.probe('recommend', instrumentation.count_paths)
+    def recommend(self, user_id):
+        """ Find all items on the path of the length 3 from the given user.
+        """
+        if self.bounded:
+            return self.recommend_bounded(user_id)
+        if self.vectorized:
+            return self.recommend_vectorized(user_id)
+        if self.graph is not None:
+            return self.recommend_sparse(user_id)
+        if self.item_index is not None:
+            return self.recommend_indexed(user_id)
+
+        # Return top 10 items with the best score.
+        scores = self.get_item_scores(user_id)
+        return sorted(scores.keys(), key=lambda item_id: scores[item_id], reverse=True)[:10]
+
+    def recommend_sparse(self, user_id):
+        """ The same as recommend, but the paths are walked in the array-backed network.
+        """
+        graph = self.graph
+        if user_id not in graph.user_id2offset:
+            return []
+        graph.compact()
+
+        normalize = self.scoring_options.get('normalize', False)
+        scores = defaultdict(float)  # {item offset => score}
+        user_offset = graph.user_id2offset[user_id]
+        user_items, user_weights = graph.user_items(user_offset)
+        excluded = set(user_items.tolist()) if self.scoring_options.get('exclude_history', False) else ()
+        user_norm = float(graph.user_norms[user_offset]) if normalize else 1.0
+        for user_item, user_item_weight in zip(user_items.tolist(), user_weights.tolist()):
+            neighbours, neighbours_weights = graph.item_users(user_item)
+            for neighbour, neighbour_weight in zip(neighbours.tolist(), neighbours_weights.tolist()):
+                neighbour_norm = float(graph.user_norms[neighbour]) if normalize else 1.0
+                neighbour_items, neighbour_items_weights = graph.user_items(neighbour)
+                for neighbour_item, neighbour_item_weight in zip(neighbour_items.tolist(), neighbour_items_weights.tolist()):
+                    if neighbour_item in excluded:
+                        continue
+
+                    scores[neighbour_item] += user_item_weight / user_norm * \
+                                              neighbour_weight / neighbour_norm * \
+                                              neighbour_item_weight
+
+        top_items = sorted(scores.keys(), key=lambda item: scores[item], reverse=True)[:10]
+        return [graph.item_offset2id[item] for item in top_items]
+
+    def recommend_vectorized(self, user_id):
+        """ The same as recommend, but the paths are scored by the sparse matrix products (ties are ordered by offsets).
+        """
+        graph = self.graph
+        if user_id not in graph.user_id2offset:
+            return []
+
+        item_offsets = recommend_offsets(graph, [graph.user_id2offset[user_id]], **self.scoring_options)[0]
+        return [graph.item_offset2id[item] for item in item_offsets]
+
+    @instrumentation.probe('recommend_bounded')
+    def recommend_bounded(self, user_id, k=10):
+        """ The same as recommend, but at most max_neighbours users of each item and max_edges edges are visited.
+        """
+        normalize = self.scoring_options.get('normalize', False)
+        exclude_history = self.scoring_options.get('exclude_history', False)
+        graph = self.graph
+        if graph is not None:
+            if user_id not in graph.user_id2offset:
+                return []
+            graph.compact()
+
+            user_offset = graph.user_id2offset[user_id]
+            user_items, user_weights = graph.user_items(user_offset)
+            user_norm = float(graph.user_norms[user_offset]) if normalize else 1.0
+            scores, n_edges = walk_paths([(item, weight / user_norm) for item, weight in zip(user_items.tolist(), user_weights.tolist())],
+                                         *get_graph_accessors(graph, self.neighbour_lists, self.max_edges),
+                                         excluded=set(user_items.tolist()) if exclude_history else (), max_edges=self.max_edges,
+                                         get_neighbour_scale=(lambda neighbour: 1 / float(graph.user_norms[neighbour])) if normalize else None)
+            if instrumentation.active is not None:
+                instrumentation.active.record('recommend_bounded.edges', n_edges)
+            top_items = sorted(scores.keys(), key=lambda item: scores[item], reverse=True)[:k]
+            return [graph.item_offset2id[item] for item in top_items]
+
+        if user_id not in self.users:
+            return []
+
+        user_profile = self.users[user_id].user_profile
+        user_norm = self.users[user_id].norm if normalize else 1.0
+        scores, n_edges = walk_paths([(item_id, weight / user_norm) for item_id, weight in user_profile.items()],
+                                     *get_dict_accessors(self.users, self.items, self.neighbour_lists),
+                                     excluded=user_profile if exclude_history else (), max_edges=self.max_edges,
+                                     get_neighbour_scale=(lambda neighbour_id: 1 / self.users[neighbour_id].norm) if normalize else None)
+        if instrumentation.active is not None:
+            instrumentation.active.record('recommend_bounded.edges', n_edges)
+        return sorted(scores.keys(), key=lambda item_id: scores[item_id], reverse=True)[:k]
+
+    def build_item_index(self, n_jobs=1, chunk_size=1000):
+        """ Build the item index from the current network, it is updated with each new interaction then.
+        """
+        self.item_index.build(self.users, self.items, n_jobs=n_jobs, chunk_size=chunk_size)
+
+    def recommend_indexed(self, user_id, k=10):
+        """ The same as recommend, but the paths from each user's item are looked up in the item index.
+        """
+        if not self.item_index.built:
+            self.build_item_index()
+        if user_id not in self.users:
+            return []
+
+        scores = defaultdict(float)
+        user_profile = self.users[user_id].user_profile
+        excluded = user_profile if self.scoring_options.get('exclude_history', False) else ()
+        for user_item_id, user_item_weight in user_profile.items():
+            for neighbour_item_id, neighbour_item_weight in self.item_index.get_neighbours(user_item_id).items():
+                if neighbour_item_id in excluded:
+                    continue
+
+                scores[neighbour_item_id] += user_item_weight * neighbour_item_weight
+
+        return sorted(scores.keys(), key=lambda item_id: scores[item_id], reverse=True)[:k]
+
+    def get_item_paths(self, item_id):
+        """ Sum the weights of all paths (item, neighbour, neighbour's item) from the given item.
+        """
+        normalize = self.scoring_options.get('normalize', False)
+        paths = defaultdict(float)  # {neighbour_item_id => path weight}
+        for neighbour_id, neighbour_weight in self.items[item_id].item_profile.items():
+            neighbour_node = self.users[neighbour_id]
+            neighbour_norm = neighbour_node.norm if normalize else 1.0
+            for neighbour_item_id, neighbour_item_weight in neighbour_node.user_profile.items():
+                paths[neighbour_item_id] += neighbour_weight / neighbour_norm * neighbour_item_weight
+        return paths
+
+    @instrumentation.probe('recommend_many', instrumentation.count_users)
+    def recommend_many(self, user_ids, k=10, block_size=1000, seconds=None):
+        """
+        Recommend top k items for each of the given users.
+        Users are processed in blocks of block_size users, the paths starting in an item are aggregated only once
+        in each block and shared by all users who interacted with the item (at most max_cached_paths path entries
+        are kept, see ItemPathsCache). With seconds (a list), the time of each user is appended to it.
+        """
+        if self.bounded:
+            return recommend_each(self.recommend_bounded, user_ids, k=k, seconds=seconds)
+        if self.graph is not None:
+            return recommend_many(self.graph, user_ids, k=k, block_size=block_size, seconds=seconds, **self.scoring_options)
+        if self.item_index is not None:
+            return recommend_each(self.recommend_indexed, user_ids, k=k, seconds=seconds)
+
+        normalize = self.scoring_options.get('normalize', False)
+        exclude_history = self.scoring_options.get('exclude_history', False)
+        recommendations = []
+        n_edges = 0  # The entries of the item paths read by the users, recorded by the instrumentation.
+        starts = []  # The start time of each user, the end of the last one is appended after the loop.
+        for block_start in range(0, len(user_ids), block_size):
+            items_paths = ItemPathsCache(self.get_item_paths, self.max_cached_paths)  # Shared by the users in the block.
+            for user_id in user_ids[block_start:block_start + block_size]:
+                starts.append(time.perf_counter())
+                if user_id not in self.users:
+                    recommendations.append([])
+                    continue
+
+                scores = defaultdict(float)
+                user_node = self.users[user_id]
+                user_profile = user_node.user_profile
+                excluded = user_profile if exclude_history else ()
+                user_norm = user_node.norm if normalize else 1.0
+                for user_item_id, user_item_weight in user_profile.items():
+                    item_paths = items_paths.get(user_item_id)
+                    n_edges += len(item_paths)
+                    for neighbour_item_id, path_weight in item_paths.items():
+                        if neighbour_item_id in excluded:
+                            continue
+
+                        scores[neighbour_item_id] += user_item_weight / user_norm * path_weight
+
+                recommendations.append(sorted(scores.keys(), key=lambda item_id: scores[item_id], reverse=True)[:k])
+
+        if instrumentation.active is not None:
+            instrumentation.active.record('recommend_many.edges', n_edges)
+        if seconds is not None:
+            starts.append(time.perf_counter())
+            seconds.extend(end - start for start, end in zip(starts, starts[1:]))
+        return recommendations
+
+
+class SnapshotMixin(object):
+    """ Snapshots of a recommender with users, items (its dict nodes) and graph (its SparseGraph, or None).
+    """
+    def save(self, path):
+        """ Save the trained recommender into a snapshot directory (see SparseGraph.save).
+        """
+        graph = self.graph if self.graph is not None else SparseGraph.from_nodes(self.users, self.items)
+        graph.save(path)
+
+    @classmethod
+    def load(cls, path, mmap=True, **options):
+        """ Load a recommender from a snapshot, its network is array-backed (and memory-mapped with mmap).
+        """
+        recommender = cls(sparse=True, **options)
+        recommender.graph = SparseGraph.load(path, mmap=mmap)
+        return recommender
@@ -2,6 +2,10 @@
 
 from collections import defaultdict
 
+from recommender import instrumentation
+from recommender.base import InteractionsMixin, PathsMixin, SetInteractionsMixin, SnapshotMixin
+from recommender.nodes import CompactItem, CompactUser, IdTable
+
 
 class User(object):
     """ Data class that represents one user in the recommender network.
@@ -19,57 +23,85 @@ class Item(object):
         self.item_profile = defaultdict(float)  # {user_id => interaction weight}
 
 
-class Recommender(object):
+@instrumentation.probed
+class Recommender(InteractionsMixin, PathsMixin, SetInteractionsMixin, SnapshotMixin):
     """
     A Baseline Recommender.
     It allows to add a new interaction into the network.
     Recommendations candidates are obtained as all items on the path of the length 3 from the user.
 
     """
-    def __init__(self):
-        self.users = dict()  # {user_id => User()}
-        self.items = dict()  # {item_id => Item()}
+    scoring_options = {}  # How the vectorized scoring reproduces the recommend method.
+
+    def __init__(self, sparse=False, vectorized=False, max_neighbours=None, sampling='top', max_edges=None, item_index=None, compact=False):
+        super().__init__(sparse, vectorized, max_neighbours, sampling, max_edges, item_index, compact)
+        self.user_id_table = IdTable() if compact else None  # Users interned by the compact nodes.
+        self.item_id_table = IdTable() if compact else None  # Items interned by the compact nodes.
 
+    @instrumentation.probe('put_interaction')
     def put_interaction(self, user_id, item_id, weight):
         """ Add a new edge in the network.
         """
+        if self.graph is not None:
+            self.graph.put_interaction(user_id, item_id, weight)
+            if self.neighbour_lists is not None:
+                self.neighbour_lists.invalidate(self.graph.item_id2offset[item_id])
+            return
+
         # Obtain the user if already exists.
         if user_id in self.users:
             user = self.users[user_id]
         # ...or create a new one.
         else:
-            user = self.users[user_id] = User(user_id)
+            if self.compact:
+                user = self.users[user_id] = CompactUser(user_id, self.item_id_table)
+            else:
+                user = self.users[user_id] = User(user_id)
 
         # Obtain the item if already exists.
         if item_id in self.items:
             item = self.items[item_id]
         # ...or create a new one.
         else:
-            item = self.items[item_id] = Item(item_id)
+            if self.compact:
+                item = self.items[item_id] = CompactItem(item_id, self.user_id_table)
+            else:
+                item = self.items[item_id] = Item(item_id)
 
         # Insert a new interest into the user/item profile.
         # If there is the same interests, use the higher weight.
         # Here you can try different methods how to deal with repeating interactions (e.g. sum them)
+        old_weight = user.user_profile.get(item_id, 0.0)
+        old_item_weight = item.item_profile.get(user_id)
         user.user_profile[item_id] = max(weight, user.user_profile[item_id])
         item.item_profile[user_id] = max(weight, item.item_profile[user_id])
+        if self.neighbour_lists is not None:
+            self.neighbour_lists.put(item_id, user_id, old_item_weight, item.item_profile[user_id], len(item.item_profile) - 1)
 
-    def recommend(self, user_id):
-        """ Find all items on the path of the length 3 from the given user.
-        """
-        if user_id not in self.users:
-            return []
+        if self.item_index is not None:
+            self.item_index.put_interaction(user_id, item_id, old_weight, user.user_profile[item_id], self.users, self.items)
 
+    def get_item_scores(self, user_id):
+        """ Score all items on the path of the length 3 from the given user (in the dict network), return {item_id => score}.
+        """
         # One item could be accessible by more then one path in the network.
         # If so, we will sum all these paths into the item's score.
         scores = defaultdict(float)
+        if user_id not in self.users:
+            return scores
+
+        n_edges = 0  # The traversed edges, recorded by the instrumentation.
         user_node = self.users[user_id]
         for user_item_id, user_item_weight in user_node.user_profile.items():
             user_item_node = self.items[user_item_id]
+            n_edges += len(user_item_node.item_profile)
             for neighbour_id, neighbour_weight in user_item_node.item_profile.items():
                 neighbour_node = self.users[neighbour_id]
+                n_edges += len(neighbour_node.user_profile)
                 for neighbour_item_id, neighbour_item_weight in neighbour_node.user_profile.items():
                     # Add the path weight to the item's score.
                     scores[neighbour_item_id] += user_item_weight * neighbour_weight * neighbour_item_weight
 
-        # Return top 10 items with the best score.
-        return sorted(scores.keys(), key=lambda item_id: scores[item_id], reverse=True)[:10]
+        if instrumentation.active is not None:
+            instrumentation.active.record('recommend.edges', n_edges)
+        return scores
@@ -0,0 +1,181 @@
+"""
+Speed benchmark of the recommenders on synthetic datasets.
+
+Run it as `python -m recommender.benchmark --output benchmark.json`, the results are written as JSON,
+so different runs (e.g. before and after a change) can be compared.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import platform
+import resource
+import time
+import tracemalloc
+
+from multiprocessing import get_context
+
+import numpy as np
+
+from recommender.streaming import iter_interactions
+
+RECOMMENDERS = ['baseline_recommender', 'recommender_exluded_history', 'normalized_recommender', 'user_neighbours_recommender']
+BACKENDS = {'dict': {}, 'compact': {'compact': True}, 'sparse': {'sparse': True}, 'vectorized': {'vectorized': True}}
+
+# Dataset sizes: (number of users, number of items, number of interactions).
+DATASETS = {
+    'small': (1000, 500, 20000),
+    'medium': (10000, 5000, 200000),
+    'large': (100000, 20000, 2000000),
+}
+
+
+def generate_dataset(n_users, n_items, n_interactions, exponent=1.1, seed=42):
+    """
+    Generate a reproducible user-item graph with Zipf distributed activity of users and popularity of items,
+    i.e. the k-th most active user (popular item) appears with the probability proportional to k ** -exponent.
+    Return arrays of user and item offsets, one pair per interaction.
+    """
+    random_state = np.random.RandomState(seed)
+
+    def zipf_choice(n_values):
+        probabilities = np.arange(1, n_values + 1, dtype=np.float64) ** -exponent
+        # Ranks are shuffled, so the popularity does not correlate with the offsets.
+        return random_state.permutation(n_values)[random_state.choice(n_values, size=n_interactions, p=probabilities / probabilities.sum())]
+
+    return zipf_choice(n_users), zipf_choice(n_items)
+
+
+def get_peak_rss_mb():
+    """ Return the peak resident memory of the process in MB (ru_maxrss is in kB on Linux).
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(recommender_name, backend, dataset_name, n_recommended=200):
+    """
+    Measure one recommender with one backend on one dataset (it is run in a separate process).
+    The inserts and the finalisation (the compaction and norms) are timed separately. The interactions are generated
+    from the offset arrays while they are inserted, base_rss_mb is the peak memory before the recommender is built.
+    """
+    user_offsets, item_offsets = generate_dataset(*DATASETS[dataset_name])
+    n_interactions = len(user_offsets)
+    base_rss_mb = get_peak_rss_mb()
+    recommender = importlib.import_module('recommender.' + recommender_name).Recommender(**BACKENDS[backend])
+
+    start = time.perf_counter()
+    for user, item in zip(user_offsets.tolist(), item_offsets.tolist()):
+        recommender.put_interaction('user_{}'.format(user), 'item_{}'.format(item), 1.0)
+    put_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if recommender.graph is not None:
+        recommender.graph.compact()
+    for node in list(recommender.users.values()) + list(recommender.items.values()):
+        if hasattr(node, 'update_norm'):
+            node.update_norm()
+    finalize_seconds = time.perf_counter() - start
+
+    detect_seconds = None
+    if hasattr(recommender, 'detect_user_neighbours'):
+        start = time.perf_counter()
+        recommender.detect_user_neighbours()
+        detect_seconds = time.perf_counter() - start
+
+    # Latency of recommendations for a (reproducible) sample of the users.
+    user_ids = sorted(set('user_{}'.format(user) for user in user_offsets.tolist()))
+    sample_ids = [user_ids[n_user] for n_user in np.random.RandomState(0).choice(len(user_ids), size=min(n_recommended, len(user_ids)), replace=False)]
+    latencies = []
+    for user_id in sample_ids:
+        start = time.perf_counter()
+        recommender.recommend(user_id)
+        latencies.append(time.perf_counter() - start)
+
+    peak_rss_mb = get_peak_rss_mb()
+    return {
+        'recommender': recommender_name,
+        'backend': backend,
+        'dataset': dataset_name,
+        'n_interactions': n_interactions,
+        'put_interaction_per_second': n_interactions / put_seconds,
+        'finalize_seconds': finalize_seconds,
+        'detect_user_neighbours_seconds': detect_seconds,
+        'recommend_p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'recommend_p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'peak_rss_mb': peak_rss_mb,
+        'base_rss_mb': base_rss_mb,
+        'recommender_rss_mb': peak_rss_mb - base_rss_mb,  # The peak memory added by the recommender.
+    }
+
+
+def run_benchmark(recommender_names=RECOMMENDERS, backends=BACKENDS, dataset_names=('small', 'medium')):
+    """ Run all the benchmark cases, each in a fresh process so the peak memory is measured per case.
+    """
+    context = get_context('spawn')
+    results = []
+    for dataset_name in dataset_names:
+        for recommender_name in recommender_names:
+            for backend in backends:
+                with context.Pool(1) as pool:
+                    result = pool.apply(run_case, (recommender_name, backend, dataset_name))
+                logging.info('%s', json.dumps(result))
+                results.append(result)
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def get_memory_report(interactions, recommender_names=RECOMMENDERS, detect_neighbours=False):
+    """
+    Measure the memory (in MB, by tracemalloc) of the dict network stored in the default and in the compact nodes
+    (see recommender.nodes), the interactions are a list of dicts (e.g. loaded from data/dataset.json).
+    The ids are allocated by the interactions already, so only the network is measured. With detect_neighbours,
+    the neighbours of the users are detected too. Return {recommender => {'dict' => MB, 'compact' => MB}}.
+    """
+    report = {}
+    for recommender_name in recommender_names:
+        module = importlib.import_module('recommender.' + recommender_name)
+        report[recommender_name] = {}
+        for backend in ['dict', 'compact']:
+            tracemalloc.start()
+            recommender = module.Recommender(**BACKENDS[backend])
+            recommender.put_interactions(interactions)
+            for node in list(recommender.users.values()) + list(recommender.items.values()):
+                if hasattr(node, 'update_norm'):
+                    node.update_norm()
+            if detect_neighbours and hasattr(recommender, 'detect_user_neighbours'):
+                recommender.detect_user_neighbours()
+            report[recommender_name][backend] = tracemalloc.get_traced_memory()[0] / 1024 ** 2
+            del recommender
+            tracemalloc.stop()
+
+        logging.info('%s: dict nodes %.1f MB, compact nodes %.1f MB', recommender_name, report[recommender_name]['dict'], report[recommender_name]['compact'])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--output', default='benchmark.json', help='A JSON file with the results.')
+    parser.add_argument('--datasets', nargs='+', default=['small', 'medium'], choices=sorted(DATASETS))
+    parser.add_argument('--recommenders', nargs='+', default=RECOMMENDERS, choices=RECOMMENDERS)
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('--memory', help='Instead of the speed benchmark, report the memory of the dict and compact nodes on a dataset (e.g. data/dataset.json).')
+    parser.add_argument('--detect-neighbours', action='store_true', help='Include the detected neighbours in the memory report.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s')
+    if args.memory:
+        report = get_memory_report(list(iter_interactions(args.memory)), args.recommenders, args.detect_neighbours)
+    else:
+        report = run_benchmark(args.recommenders, args.backends, args.datasets)
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
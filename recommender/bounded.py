@@ -0,0 +1,201 @@
+"""Bounded-cost walks of the paths of the length 3, the work of one recommendation does not depend on hub items."""
+
+import heapq
+import zlib
+
+from collections import defaultdict
+from itertools import islice
+from math import log
+
+SAMPLINGS = ('top', 'weighted')
+
+
+class NeighbourLists(object):
+    """
+    The users of each item expanded by the bounded walks: at most max_neighbours users with the highest keys, kept
+    with the total weight of the item, so an expansion takes O(max_neighbours) instead of a scan of the item profile.
+    With the 'top' sampling the key is the weight, with 'weighted' it is log(u) / weight for a pseudo-random u fixed
+    by the edge (a weighted sample without replacement, drawn once per item until its profile changes).
+    Ties are ordered by the profile position, the selected users are expanded in the profile order.
+    The lists of the dict network are updated by put (an increased weight or a new user), other changes invalidate
+    the item, its list is built from the profile again when it is expanded next time.
+
+    """
+    def __init__(self, max_neighbours, sampling='top', seed=0):
+        if sampling not in SAMPLINGS:
+            raise ValueError('Unknown sampling {}, use one of {}'.format(sampling, ', '.join(SAMPLINGS)))
+        self.max_neighbours = max_neighbours
+        self.sampling = sampling
+        self.seed = seed  # The seed of the random keys of the 'weighted' sampling.
+        self.entries = dict()  # {item => [((key, -position), user, weight)] of the users with the highest keys}
+        self.totals = dict()  # {item => (the sum of the weights, the number of users) of the whole item profile}
+        self.selected = dict()  # {item => ([(user, weight)] in the profile order, scale)}
+
+    def get_key(self, item, user, weight, position):
+        """ Return the key of the user in the item profile, the users with the highest keys are selected.
+        """
+        if self.sampling == 'top':
+            return weight, -position
+        if weight <= 0:
+            return float('-inf'), -position
+        # A uniform number in (0, 1) fixed by the edge, the same in all processes.
+        uniform = (zlib.crc32(repr((item, user, self.seed)).encode()) + 1) / (2 ** 32 + 2)
+        return log(uniform) / weight, -position
+
+    def build(self, item, users_weights):
+        """ Select the users of the item from its whole profile (pairs (user, weight) in the profile order).
+        """
+        total_weight, n_users = 0.0, 0
+        entries = []
+        for position, (user, weight) in enumerate(users_weights):
+            entry = (self.get_key(item, user, weight, position), user, weight)
+            if len(entries) < self.max_neighbours:
+                heapq.heappush(entries, entry)
+            elif entry[0] > entries[0][0]:
+                heapq.heapreplace(entries, entry)
+            total_weight += weight
+            n_users += 1
+
+        self.entries[item] = sorted(entries, key=lambda entry: entry[0], reverse=True)
+        self.totals[item] = (total_weight, n_users)
+        self.selected.pop(item, None)
+
+    def put(self, item, user, old_weight, new_weight, position):
+        """
+        Update the list of the item after put_interaction changed the weight of the user (old_weight is None for a new
+        user at the position of the item profile).
+        """
+        entries = self.entries.get(item)
+        if entries is None:
+            return
+        if old_weight is not None and new_weight < old_weight:
+            self.invalidate(item)
+            return
+
+        total_weight, n_users = self.totals[item]
+        self.totals[item] = (total_weight + new_weight - (old_weight or 0.0), n_users + (old_weight is None))
+        self.selected.pop(item, None)  # The scale changes with the total weight.
+        if old_weight is not None:
+            if new_weight == old_weight:
+                return
+            # Keys grow with the weight, a user below the selected ones could enter the list, its position is not known.
+            if len(entries) == self.max_neighbours and self.get_key(item, user, new_weight, 0)[0] >= entries[-1][0][0]:
+                listed = [n_entry for n_entry, entry in enumerate(entries) if entry[1] == user]
+                if not listed:
+                    self.invalidate(item)
+                    return
+                key, _, _ = entries.pop(listed[0])
+                entries.append((self.get_key(item, user, new_weight, -key[1]), user, new_weight))
+            elif len(entries) < self.max_neighbours:
+                # The list holds the whole profile.
+                n_entry = [entry[1] for entry in entries].index(user)
+                key, _, _ = entries.pop(n_entry)
+                entries.append((self.get_key(item, user, new_weight, -key[1]), user, new_weight))
+            else:
+                return
+        else:
+            entry = (self.get_key(item, user, new_weight, position), user, new_weight)
+            if len(entries) == self.max_neighbours and entry[0] <= entries[-1][0]:
+                return
+            entries.append(entry)
+
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        del entries[self.max_neighbours:]
+
+    def invalidate(self, item):
+        """ Drop the list of the item, it is built again when it is expanded.
+        """
+        self.entries.pop(item, None)
+        self.totals.pop(item, None)
+        self.selected.pop(item, None)
+
+    def select(self, item, get_users_weights):
+        """
+        Return the selected users of the item (pairs (user, weight) in the profile order) and a scale of their weights
+        (the sum of all weights divided by the sum of the selected ones), so the item's paths keep their total weight.
+        get_users_weights() returns the whole item profile, it is read only when the list of the item is built.
+        """
+        selected = self.selected.get(item)
+        if selected is not None:
+            return selected
+
+        if item not in self.entries:
+            self.build(item, get_users_weights())
+        entries = sorted(self.entries[item], key=lambda entry: entry[0][1], reverse=True)
+        total_weight, n_users = self.totals[item]
+        selected_weight = sum(weight for _, _, weight in entries)
+        scale = total_weight / selected_weight if len(entries) < n_users and selected_weight > 0 else 1.0
+        selected = self.selected[item] = ([(user, weight) for _, user, weight in entries], scale)
+        return selected
+
+
+def walk_paths(user_items, get_item_users, get_user_items, excluded=(), max_edges=None, get_neighbour_scale=None):
+    """
+    Score items on the paths (user, item, neighbour, neighbour's item) like the recommend methods, but with a bounded cost:
+    get_item_users(item) returns the expanded users of an item (at most max_neighbours, see NeighbourLists) as pairs
+    (user, weight) and a scale of their weights, the walk stops once max_edges edges were visited, so the scores found
+    so far are returned. With max_edges the user's items are expanded from the highest weight, otherwise in the order
+    of user_items (pairs (item, weight)), so without the caps the items are scored in the order of recommend.
+    get_user_items(user, limit) returns at most limit (all with None) pairs (item, weight) of a user,
+    get_neighbour_scale (optional) returns a factor of the neighbour's paths (e.g. the inverse of its norm).
+    Return the scores {item => score} and the number of visited edges.
+    """
+    if max_edges is not None:
+        user_items = sorted(user_items, key=lambda user_item: user_item[1], reverse=True)
+    scores = defaultdict(float)
+    n_edges = 0
+    for user_item, user_item_weight in user_items:
+        neighbours, scale = get_item_users(user_item)
+        for neighbour, neighbour_weight in neighbours:
+            if max_edges is not None and n_edges >= max_edges:
+                return scores, n_edges
+
+            # Only a part of the neighbour's profile may fit into the budget.
+            neighbour_items = get_user_items(neighbour, max_edges - n_edges - 1 if max_edges is not None else None)
+            n_edges += 1 + len(neighbour_items)
+
+            path_weight = user_item_weight * neighbour_weight * scale
+            if get_neighbour_scale is not None:
+                path_weight *= get_neighbour_scale(neighbour)
+            for neighbour_item, neighbour_item_weight in neighbour_items:
+                if neighbour_item in excluded:
+                    continue
+
+                scores[neighbour_item] += path_weight * neighbour_item_weight
+
+    return scores, n_edges
+
+
+def get_dict_accessors(users, items, neighbour_lists=None):
+    """
+    Return functions get_item_users and get_user_items (see walk_paths) of the network stored in dicts.
+    Without neighbour_lists (the users of each item are not capped), the item profiles are iterated directly.
+    """
+    def get_item_users(item_id):
+        item_profile = items[item_id].item_profile
+        if neighbour_lists is None:
+            return item_profile.items(), 1.0
+        return neighbour_lists.select(item_id, item_profile.items)
+
+    def get_user_items(user_id, limit=None):
+        return list(islice(users[user_id].user_profile.items(), limit))
+
+    return get_item_users, get_user_items
+
+
+def get_graph_accessors(graph, neighbour_lists=None, max_edges=None):
+    """
+    Return functions get_item_users and get_user_items (see walk_paths) of the array-backed network (by offsets).
+    Without neighbour_lists, at most max_edges users of an item are read (each expanded user is a visited edge).
+    """
+    def get_item_users(item):
+        users, weights = graph.item_users(item)
+        if neighbour_lists is None:
+            return zip(users[:max_edges].tolist(), weights[:max_edges].tolist()), 1.0
+        return neighbour_lists.select(item, lambda: zip(users.tolist(), weights.tolist()))
+
+    def get_user_items(user, limit=None):
+        items, weights = graph.user_items(user)
+        return list(zip(items[:limit].tolist(), weights[:limit].tolist()))
+
+    return get_item_users, get_user_items
@@ -0,0 +1,214 @@
+"""A cache of the top-k recommendations invalidated by new interactions."""
+
+import sys
+import time
+
+from collections import OrderedDict
+
+from recommender.base import InteractionsMixin
+
+
+class CachedRecommender(InteractionsMixin):
+    """
+    Wrap any recommender and cache its recommendations, the least recently used entries are evicted once the cache
+    exceeds the memory budget of max_bytes (or when they are older than ttl seconds).
+    A new interaction (user, item) evicts the user's entry. With invalidate_neighbourhood, entries of users within
+    two hops are evicted as well, i.e. users of the item and users sharing an item with the user, whose paths in
+    the network could go through the new edge.
+    An entry holds the top k items of one request, it serves the requests of the user with the same or a lower k,
+    since the rankings of the recommenders are prefixes of each other (the top k of the same order).
+
+    """
+    def __init__(self, recommender, max_bytes=64 * 1024 * 1024, ttl=None, invalidate_neighbourhood=False):
+        self.recommender = recommender
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.invalidate_neighbourhood = invalidate_neighbourhood
+
+        self.entries = OrderedDict()  # {user_id => (recommended item ids, k, creation time, size in bytes)}, the last used at the end.
+        self.size = 0  # Estimated size of all entries in bytes.
+
+        # Counters for sizing the cache.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # Entries removed because of the memory budget or the ttl.
+        self.invalidations = 0  # Entries removed because of new interactions.
+
+    def __getattr__(self, name):
+        """ Other attributes (e.g. users, items, graph) are taken from the wrapped recommender.
+        """
+        if name == 'recommender':
+            raise AttributeError(name)
+        return getattr(self.recommender, name)
+
+    @staticmethod
+    def get_entry_size(user_id, recommendations):
+        """ Estimate the memory used by one cache entry.
+        """
+        return sys.getsizeof(user_id) + sys.getsizeof(recommendations) + sum(sys.getsizeof(item_id) for item_id in recommendations) + 100
+
+    def get_cached(self, user_id, k=10):
+        """ Return cached top k recommendations of the user, or None.
+        """
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+
+        if self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+            self.remove(user_id)
+            self.evictions += 1
+            return None
+
+        # A shorter ranking than its k contains all the recommended items.
+        recommendations, entry_k = entry[0], entry[1]
+        if entry_k < k and len(recommendations) >= entry_k:
+            return None
+
+        self.entries.move_to_end(user_id)
+        return recommendations[:k]
+
+    def store(self, user_id, recommendations, k=10):
+        """ Store top k recommendations of the user and evict the least recently used entries over the memory budget.
+        """
+        self.remove(user_id)
+        size = self.get_entry_size(user_id, recommendations)
+        self.entries[user_id] = (recommendations, k, time.monotonic(), size)
+        self.size += size
+
+        while self.size > self.max_bytes and self.entries:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def remove(self, user_id):
+        """ Remove the user's entry, return True if there was one.
+        """
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return False
+
+        self.size -= entry[3]
+        return True
+
+    def clear(self):
+        """ Remove all entries, e.g. after the neighbours detection.
+        """
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+        self.size = 0
+
+    def has_nodes(self, user_id, item_id):
+        """ Return True if both the user and the item are in the network (a removed edge of new nodes is not added).
+        """
+        graph = getattr(self.recommender, 'graph', None)
+        if graph is not None:
+            return user_id in graph.user_id2offset and item_id in graph.item_id2offset
+        return user_id in self.recommender.users and item_id in self.recommender.items
+
+    def get_neighbourhood(self, user_id, item_id):
+        """ Return users within two hops from the new edge: users of the item and users sharing an item with the user.
+        """
+        graph = getattr(self.recommender, 'graph', None)
+        if graph is not None:
+            # The pending interactions are searched in the append buffer, a compaction per interaction would be too slow.
+            user_offsets = graph.get_neighbourhood(graph.user_id2offset[user_id], graph.item_id2offset[item_id])
+            return set(graph.user_offset2id[user] for user in user_offsets.tolist())
+
+        items = self.recommender.items
+        item_ids = set(self.recommender.users[user_id].user_profile) | {item_id}
+        return set(neighbour_id for user_item_id in item_ids for neighbour_id in items[user_item_id].item_profile)
+
+    def invalidate(self, user_id, item_id):
+        """ Remove the entries affected by a changed edge (user, item), see get_neighbourhood.
+        """
+        user_ids = {user_id}
+        if self.invalidate_neighbourhood and self.entries and self.has_nodes(user_id, item_id):
+            user_ids |= self.get_neighbourhood(user_id, item_id)
+        for affected_user_id in user_ids:
+            self.invalidations += self.remove(affected_user_id)
+
+    def put_interaction(self, user_id, item_id, weight):
+        """ Add a new edge in the network and invalidate the affected entries.
+        """
+        self.recommender.put_interaction(user_id, item_id, weight)
+        self.invalidate(user_id, item_id)
+
+    def set_interaction(self, user_id, item_id, weight):
+        """ Set the weight of an edge (see set_interactions).
+        """
+        self.set_interactions([{'user_id': user_id, 'item_id': item_id, 'weight': weight}])
+
+    def set_interactions(self, interactions):
+        """
+        Set the weights of edges by the wrapped recommender and invalidate the affected entries as put_interaction,
+        return their number. The users of a removed edge are still found, as the users and items are kept.
+        """
+        interactions = list(interactions)
+        n_interactions = self.recommender.set_interactions(interactions)
+        for interaction in interactions:
+            self.invalidate(interaction['user_id'], interaction['item_id'])
+        return n_interactions
+
+    def recommend(self, user_id):
+        """ Return the cached recommendations, or obtain them from the wrapped recommender.
+        """
+        recommendations = self.get_cached(user_id)
+        if recommendations is not None:
+            self.hits += 1
+            return list(recommendations)
+
+        self.misses += 1
+        recommendations = self.recommender.recommend(user_id)
+        self.store(user_id, tuple(recommendations))
+        return recommendations
+
+    def recommend_many(self, user_ids, k=10, block_size=1000, seconds=None):
+        """
+        The same as recommend_many of the wrapped recommender, only users missing in the cache are recommended.
+        With seconds (a list), the time of each user is appended to it (the lookups are split evenly among all users).
+        """
+        start = time.perf_counter()
+        recommendations = [self.get_cached(user_id, k) for user_id in user_ids]
+        missing_ids = [user_id for user_id, cached in zip(user_ids, recommendations) if cached is None]
+        self.hits += len(user_ids) - len(missing_ids)
+        self.misses += len(missing_ids)
+        lookup_seconds = (time.perf_counter() - start) / max(len(user_ids), 1)
+
+        missing_seconds = [] if seconds is not None else None
+        missing_recommendations = iter(self.recommender.recommend_many(missing_ids, k=k, block_size=block_size, seconds=missing_seconds))
+        missing_seconds = iter(missing_seconds or ())
+        for n_user, user_id in enumerate(user_ids):
+            user_seconds = lookup_seconds
+            if recommendations[n_user] is None:
+                recommendations[n_user] = next(missing_recommendations)
+                self.store(user_id, tuple(recommendations[n_user]), k)
+                user_seconds += next(missing_seconds, 0.0)
+            else:
+                recommendations[n_user] = list(recommendations[n_user])
+            if seconds is not None:
+                seconds.append(user_seconds)
+
+        return recommendations
+
+    def detect_user_neighbours(self, *args, **kwargs):
+        """ Detect neighbours by the wrapped recommender, all entries are invalidated.
+        """
+        self.recommender.detect_user_neighbours(*args, **kwargs)
+        self.clear()
+
+    def refresh_neighbours(self):
+        """ Refresh neighbours by the wrapped recommender, all entries are invalidated.
+        """
+        self.recommender.refresh_neighbours()
+        self.clear()
+
+    def get_stats(self):
+        """ Return the cache counters.
+        """
+        return {
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,176 @@
+"""Evaluation of the recommenders by ranking metrics, optionally parallelized over worker processes."""
+
+import logging
+import time
+
+from collections import defaultdict
+from multiprocessing import get_context
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from recommender import instrumentation
+
+_model = None  # The evaluated recommender, inherited (read-only) by the forked worker processes.
+
+
+def _recommend_chunk(chunk):
+    """
+    Recommend items for a chunk of users, return (recommended item ids, seconds) for each user and the instrumentation
+    of the chunk (recorded only in a worker process with the instrumentation enabled, the parent merges it).
+    """
+    user_ids, k, block_size, per_user_timing, collect_instrumentation = chunk
+    if collect_instrumentation:
+        instrumentation.active = instrumentation.Instrumentation()
+
+    # The users are recommended by the same recommend_many in both modes, the per-user timing is taken from it.
+    if per_user_timing:
+        user_seconds = []
+        recommendations = _model.recommend_many(user_ids, k=k, block_size=block_size, seconds=user_seconds)
+    else:
+        # Only the time of the whole chunk is known, it is split evenly among the users.
+        start = time.perf_counter()
+        recommendations = _model.recommend_many(user_ids, k=k, block_size=block_size)
+        user_seconds = [(time.perf_counter() - start) / max(len(user_ids), 1)] * len(user_ids)
+    results = list(zip(recommendations, user_seconds))
+
+    return results, instrumentation.active if collect_instrumentation else None
+
+
+def collect_results(chunk_results, results, n_users):
+    """ Extend the results by the results of the chunks, merge their instrumentation.
+    """
+    for chunk_result, chunk_instrumentation in chunk_results:
+        results.extend(chunk_result)
+        if chunk_instrumentation is not None:
+            instrumentation.active.merge(chunk_instrumentation)
+        logging.info('Evaluate %d users (%d%%)', len(results), len(results) * 100 / n_users)
+
+
+def recommend_users(recommender, user_ids, k=10, n_jobs=1, chunk_size=1000, per_user_timing=True):
+    """
+    Recommend top k items for each of the given users, return a list of (recommended item ids, seconds).
+    With n_jobs > 1, chunks of users are processed by forked worker processes sharing the trained recommender.
+    With per_user_timing, the seconds of each user are measured by recommend_many, otherwise the time of a chunk
+    is split evenly among its users. The array-backed networks score the users in blocks and split the time of a block,
+    so they are timed by blocks of a single user then (the sharded recommender still gives the times of its blocks).
+    """
+    global _model
+    graph = getattr(recommender, 'graph', None)
+    if graph is not None:
+        graph.compact()
+
+    if n_jobs != 1:
+        # Several chunks per process, so the processes are kept busy even when the users differ in their costs.
+        chunk_size = max(1, min(chunk_size, -(-len(user_ids) // (4 * n_jobs))))
+    collect_instrumentation = n_jobs != 1 and instrumentation.active is not None
+    block_size = 1 if per_user_timing and graph is not None else chunk_size
+    chunks = [(user_ids[start:start + chunk_size], k, block_size, per_user_timing, collect_instrumentation)
+              for start in range(0, len(user_ids), chunk_size)]
+    results = []
+    _model = recommender
+    try:
+        if n_jobs == 1:
+            collect_results(map(_recommend_chunk, chunks), results, len(user_ids))
+        else:
+            # The with statement terminates the pool when a chunk fails, otherwise the workers are joined first.
+            with get_context('fork').Pool(n_jobs) as pool:
+                collect_results(pool.imap(_recommend_chunk, chunks), results, len(user_ids))
+                pool.close()
+                pool.join()
+    finally:
+        _model = None
+
+    return results
+
+
+def get_ranking_metrics(users_ratings, recommendations, k, n_catalog_items):
+    """
+    Calculate the ranking metrics in one vectorized pass.
+    The test ratings form a sparse (users x items) relevance matrix, the top k recommendations a dense
+    (users x k) matrix of item columns, the hits are looked up in the relevance matrix at once.
+    """
+    item_columns = defaultdict(lambda: len(item_columns))  # {item_id => column of the relevance matrix}
+    rows = [n_user for n_user, user_ratings in enumerate(users_ratings) for _ in user_ratings]
+    columns = [item_columns[item_id] for user_ratings in users_ratings for item_id in user_ratings]
+    recommended = np.array([[item_columns[item_id] for item_id in recommended_items[:k]] + [-1] * (k - len(recommended_items[:k]))
+                            for recommended_items in recommendations], dtype=np.int64).reshape(len(users_ratings), k)
+    relevance = csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(len(users_ratings), len(item_columns)))
+
+    n_relevant = np.asarray(relevance.sum(axis=1)).ravel()
+    is_recommended = recommended >= 0
+    user_rows = np.repeat(np.arange(len(users_ratings)), k).reshape(-1, k)
+    hits = np.zeros(recommended.shape, dtype=bool)
+    hits[is_recommended] = np.asarray(relevance[user_rows[is_recommended], recommended[is_recommended]]).ravel() > 0
+
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    n_hits = hits.sum(axis=1)
+    ideal_dcg = np.cumsum(discounts)[np.minimum(n_relevant, k).astype(np.int64) - 1]
+    average_precision = (hits * np.cumsum(hits, axis=1) / np.arange(1, k + 1)).sum(axis=1) / np.minimum(n_relevant, k)
+
+    return {
+        'hit_ratio': float(n_hits.sum() / n_relevant.sum()),
+        'precision': float(np.mean(n_hits / k)),
+        'recall': float(np.mean(n_hits / n_relevant)),
+        'ndcg': float(np.mean((hits * discounts).sum(axis=1) / ideal_dcg)),
+        'map': float(np.mean(average_precision)),
+        'coverage': float(len(np.unique(recommended[is_recommended])) / n_catalog_items) if n_catalog_items else 0.0,
+        'n_hits': int(n_hits.sum()),
+        'n_relevant': int(n_relevant.sum()),
+    }
+
+
+def evaluate_ranking(recommender, test_dataset, k=10, n_jobs=1, chunk_size=1000, per_user_timing=True, n_slowest=10,
+                     instrument=False, profile_path=None):
+    """
+    Evaluate the recommender on the test interactions by the hit ratio, precision@k, recall@k, NDCG@k, MAP@k and
+    the catalog coverage. Return a dict with the metrics and per-user timing (seconds of each user, the slowest users).
+    With instrument, the report contains also the counters and histograms of the probed methods (see recommender.instrumentation),
+    with profile_path, the stacks sampled in this process are written there (the workers are not sampled, use n_jobs=1).
+    """
+    recorder = instrumentation.enable(profile=profile_path is not None) if instrument or profile_path is not None else None
+    try:
+        report = _evaluate_ranking(recommender, test_dataset, k, n_jobs, chunk_size, per_user_timing, n_slowest)
+    finally:
+        if recorder is not None:
+            instrumentation.disable()
+
+    if recorder is not None:
+        report['instrumentation'] = recorder.get_report()
+        recorder.log_report()
+        if profile_path is not None:
+            recorder.profiler.dump(profile_path)
+    return report
+
+
+def _evaluate_ranking(recommender, test_dataset, k, n_jobs, chunk_size, per_user_timing, n_slowest):
+    """ Evaluate the recommender, see evaluate_ranking.
+    """
+    users_ratings = defaultdict(set)
+    for interaction in test_dataset:
+        users_ratings[interaction['user_id']].add(interaction['item_id'])
+
+    user_ids = list(users_ratings.keys())
+    with instrumentation.phase('evaluate.recommend'):
+        results = recommend_users(recommender, user_ids, k=k, n_jobs=n_jobs, chunk_size=chunk_size, per_user_timing=per_user_timing)
+
+    with instrumentation.phase('evaluate.metrics'):
+        graph = getattr(recommender, 'graph', None)
+        n_catalog_items = graph.n_items if graph is not None else len(recommender.items)
+        report = get_ranking_metrics([users_ratings[user_id] for user_id in user_ids], [recommended_items for recommended_items, _ in results], k, n_catalog_items)
+
+    user_seconds = {user_id: seconds for user_id, (_, seconds) in zip(user_ids, results)}
+    seconds = np.array(list(user_seconds.values()))
+    report.update({
+        'n_users': len(user_ids),
+        'user_seconds': user_seconds,
+        'slowest_users': sorted(user_seconds, key=lambda user_id: user_seconds[user_id], reverse=True)[:n_slowest],
+        'seconds_p50': float(np.percentile(seconds, 50)) if len(seconds) else 0.0,
+        'seconds_p99': float(np.percentile(seconds, 99)) if len(seconds) else 0.0,
+    })
+
+    logging.info('Precision@%d = %.4f, recall@%d = %.4f, NDCG@%d = %.4f, MAP@%d = %.4f, coverage = %.4f',
+                 k, report['precision'], k, report['recall'], k, report['ndcg'], k, report['map'], report['coverage'])
+    logging.info('Recommendation time p50 = %.2fms, p99 = %.2fms, the slowest users: %s',
+                 report['seconds_p50'] * 1000, report['seconds_p99'] * 1000, ', '.join(report['slowest_users']))
+    return report
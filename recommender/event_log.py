@@ -0,0 +1,209 @@
+"""
+An append-only log of timestamped interactions with time-decayed weights of the edges, feeding the recommenders.
+
+The log is the source of truth: events are appended to a JSON-lines file and aggregated into edges, the network
+of a recommender is only a view synchronized by InteractionLog.sync. A restarted process replays the file (load).
+"""
+
+import heapq
+import json
+import os
+import time
+
+from itertools import count
+from math import inf, log2
+
+from recommender.streaming import iter_json_lines
+
+POLICIES = ('max', 'sum', 'last')
+
+
+class InteractionLog(object):
+    """
+    Events (user_id, item_id, weight, timestamp) aggregated into edges by the policy:
+        max: the higher of the decayed weight and the new one (as the recommenders merge repeating interactions),
+        sum: the decayed weight plus the new one,
+        last: the newest one.
+    With half_life (in seconds), the weights decay exponentially: w(t) = w * 0.5 ** ((t - timestamp) / half_life).
+    Only the weight at the last update of an edge is stored with its timestamp, the decay is applied when it is read.
+    Events older than the last update of their edge are decayed to it instead (with last they are ignored).
+    compact drops the edges decayed below the threshold and rewrites the file by the remaining ones, sync writes the
+    current weights into a recommender (set_interactions), so its network stays small and current without a rebuild.
+    With the decay, sync writes only the changed edges and the edges which decayed by more than epsilon (relatively)
+    or below the threshold since they were written, so the weights of the recommender are within epsilon of the log.
+
+    """
+    def __init__(self, path=None, half_life=None, policy='max', threshold=0.0, epsilon=0.01):
+        if policy not in POLICIES:
+            raise ValueError('Unknown policy {}, use one of {}'.format(policy, ', '.join(POLICIES)))
+
+        self.path = path  # The JSON-lines file of the events, or None for a log kept only in the memory.
+        self.half_life = half_life  # Half-life of the weights in seconds, None without the decay.
+        self.policy = policy
+        self.threshold = threshold  # Edges decayed below the threshold are dropped by compact.
+        self.epsilon = epsilon  # The relative decay of a synced weight which is written again by sync.
+
+        self.edges = dict()  # {(user_id, item_id) => (weight, timestamp of the last update)}
+        self.changed = dict()  # {(user_id, item_id) => None} of edges changed since the last sync.
+        self.removed = dict()  # {(user_id, item_id) => None} of edges dropped since the last sync.
+        self.due = dict()  # {(user_id, item_id) => time}, when the synced weight of an edge is to be written again.
+        self.due_heap = []  # Heap of (time, n, (user_id, item_id)), the outdated entries (not in due) are skipped.
+        self.n_due = count()  # Breaks the ties of the heap, so the keys are never compared.
+        self.n_events = 0
+
+        self.log_file = open(path, 'a') if path is not None else None
+
+    def close(self):
+        """ Close the log file.
+        """
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+    def get_decay(self, seconds):
+        """ Return the factor of a weight decayed for the given time.
+        """
+        if self.half_life is None:
+            return 1.0
+        return 0.5 ** (seconds / self.half_life)
+
+    def apply(self, user_id, item_id, weight, timestamp):
+        """ Aggregate an event into its edge (without writing it into the file), return the new weight of the edge.
+        """
+        key = (user_id, item_id)
+        edge = self.edges.get(key)
+        if edge is None:
+            new_weight, new_timestamp = weight, timestamp
+        else:
+            old_weight, old_timestamp = edge
+            if timestamp >= old_timestamp:
+                old_weight *= self.get_decay(timestamp - old_timestamp)
+                new_timestamp = timestamp
+            # A late event is decayed to the last update.
+            else:
+                weight *= self.get_decay(old_timestamp - timestamp)
+                new_timestamp = old_timestamp
+
+            if self.policy == 'max':
+                new_weight = max(old_weight, weight)
+            elif self.policy == 'sum':
+                new_weight = old_weight + weight
+            else:
+                new_weight = weight if timestamp >= old_timestamp else old_weight
+
+        self.edges[key] = (new_weight, new_timestamp)
+        self.changed[key] = None
+        self.removed.pop(key, None)
+        self.n_events += 1
+        return new_weight
+
+    def append(self, user_id, item_id, weight=1.0, timestamp=None):
+        """ Append an event to the log (the current time by default), return the new weight of the edge.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if self.log_file is not None:
+            self.log_file.write(json.dumps({'user_id': user_id, 'item_id': item_id, 'weight': weight, 'timestamp': timestamp}) + '\n')
+        return self.apply(user_id, item_id, weight, timestamp)
+
+    def put_interaction(self, user_id, item_id, weight=1.0):
+        """ Append an event of the current time, so the log can be fed like a recommender.
+        """
+        self.append(user_id, item_id, weight)
+
+    def get_weight(self, user_id, item_id, now=None):
+        """ Return the weight of the edge decayed to now (the current time by default), 0.0 for a missing edge.
+        """
+        edge = self.edges.get((user_id, item_id))
+        if edge is None:
+            return 0.0
+        weight, timestamp = edge
+        return weight * self.get_decay(max((now if now is not None else time.time()) - timestamp, 0.0))
+
+    def iter_interactions(self, now=None):
+        """ Iterate all edges as interactions (dicts with user_id, item_id and the weight decayed to now).
+        """
+        now = now if now is not None else time.time()
+        for (user_id, item_id), (weight, timestamp) in self.edges.items():
+            yield {'user_id': user_id, 'item_id': item_id, 'weight': weight * self.get_decay(max(now - timestamp, 0.0))}
+
+    def compact(self, now=None):
+        """
+        Drop the edges decayed below the threshold (at now, the current time by default), return their number.
+        The log file is replaced by one event per remaining edge, its replay gives the same edges.
+        """
+        now = now if now is not None else time.time()
+        n_dropped = 0
+        for key, (weight, timestamp) in list(self.edges.items()):
+            if weight * self.get_decay(max(now - timestamp, 0.0)) < self.threshold:
+                del self.edges[key]
+                self.changed.pop(key, None)
+                self.removed[key] = None
+                n_dropped += 1
+
+        if self.log_file is not None:
+            self.log_file.close()
+            with open(self.path + '.tmp', 'w') as snapshot_file:
+                for (user_id, item_id), (weight, timestamp) in self.edges.items():
+                    snapshot_file.write(json.dumps({'user_id': user_id, 'item_id': item_id, 'weight': weight, 'timestamp': timestamp}) + '\n')
+            os.replace(self.path + '.tmp', self.path)
+            self.log_file = open(self.path, 'a')
+
+        return n_dropped
+
+    def get_due_time(self, weight, now):
+        """
+        Return the time when the weight written at now decays by more than epsilon or below the threshold,
+        after which it is written again by sync.
+        """
+        if self.half_life is None:
+            return inf
+        seconds = self.half_life * log2(1.0 / (1.0 - self.epsilon)) if self.epsilon < 1.0 else inf
+        if self.threshold > 0:
+            seconds = min(seconds, self.half_life * log2(weight / self.threshold))
+        return now + seconds
+
+    def sync(self, recommender, now=None):
+        """
+        Write the edges into the recommender by its set_interactions, the dropped ones are removed. Return their number.
+        Only the edges changed since the last sync are written, with the decay also the edges whose written weights are
+        outdated (see get_due_time), their weights are decayed to now (the current time by default). An edge decayed
+        below the threshold is removed from the recommender, it is kept in the log until compact.
+        """
+        now = now if now is not None else time.time()
+        keys = dict(self.changed)
+        while self.due_heap and self.due_heap[0][0] <= now:
+            due_time, _, key = heapq.heappop(self.due_heap)
+            if self.due.get(key) == due_time:
+                keys[key] = None
+
+        interactions = []
+        for key in keys:
+            self.due.pop(key, None)
+            weight = self.get_weight(key[0], key[1], now)
+            if self.half_life is not None and weight < self.threshold:
+                weight = 0.0
+            elif self.half_life is not None:
+                due_time = self.due[key] = self.get_due_time(weight, now)
+                heapq.heappush(self.due_heap, (due_time, next(self.n_due), key))
+            interactions.append({'user_id': key[0], 'item_id': key[1], 'weight': weight})
+        for key in self.removed:
+            self.due.pop(key, None)
+            interactions.append({'user_id': key[0], 'item_id': key[1], 'weight': 0.0})
+
+        n_interactions = recommender.set_interactions(interactions)
+        self.changed.clear()
+        self.removed.clear()
+        return n_interactions
+
+    @classmethod
+    def load(cls, path, **options):
+        """ Replay the log file (the events are not written again), new events are appended to it.
+        """
+        log = cls(**options)
+        if os.path.exists(path):
+            for event in iter_json_lines(path):
+                log.apply(event['user_id'], event['item_id'], event.get('weight', 1.0), event['timestamp'])
+        log.path = path
+        log.log_file = open(path, 'a')
+        return log
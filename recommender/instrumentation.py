@@ -0,0 +1,374 @@
+"""
+Instrumentation of the recommenders: counters, histograms and a sampling profiler.
+
+Methods of the recommenders are marked by the probe decorator, which returns them unchanged, so the instrumentation
+costs nothing while it is disabled. enable() replaces the marked methods by wrappers recording the number of calls,
+histograms of their time (total and self, i.e. without the nested probes) and of their counts (e.g. traversed edges).
+Optionally, a sampling profiler records stacks of the running thread in the collapsed format of flamegraph.pl:
+
+    with instrumented(profile=True) as recorder:
+        recommender.recommend(user_id)
+    recorder.log_report()
+    recorder.profiler.dump('recommend.stacks')  # flamegraph.pl recommend.stacks > recommend.svg
+"""
+
+import functools
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+active = None  # The enabled Instrumentation, or None.
+PROBED_CLASSES = dict()  # {class => {attribute => the original (marked) attribute}}
+
+
+class Histogram(object):
+    """
+    A histogram with exponential buckets (4 per power of two), percentiles are estimated with the relative error under 19%.
+    Zero and negative values are counted in a separate bucket.
+
+    """
+    BUCKETS_PER_OCTAVE = 4
+
+    def __init__(self):
+        self.buckets = defaultdict(int)  # {bucket => count}, the bucket holds values in [2 ** (b / 4), 2 ** ((b + 1) / 4)).
+        self.n_zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        if value > 0:
+            self.buckets[math.floor(math.log2(value) * self.BUCKETS_PER_OCTAVE)] += 1
+        else:
+            self.n_zeros += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """ Add values of another histogram.
+        """
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] += count
+        self.n_zeros += other.n_zeros
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def get_percentile(self, percentile):
+        """ Estimate the percentile (0-100) as the upper bound of its bucket.
+        """
+        rank = percentile / 100 * self.count
+        seen = self.n_zeros
+        if seen >= rank:
+            return min(0.0, self.max)
+
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** ((bucket + 1) / self.BUCKETS_PER_OCTAVE), self.max)
+        return self.max
+
+    def get_summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'p50': self.get_percentile(50),
+            'p90': self.get_percentile(90),
+            'p99': self.get_percentile(99),
+            'max': self.max if self.count else 0.0,
+        }
+
+
+class SamplingProfiler(object):
+    """
+    Sample the stack of a thread every interval seconds (from a background thread), the stacks are counted in
+    the collapsed format "module:function;module:function count" used by flamegraph.pl and speedscope.
+
+    """
+    def __init__(self, interval=0.001, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks = defaultdict(int)  # {collapsed stack => number of samples}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def collapse(frame):
+        """ Return the collapsed stack of the frame, the outermost function first.
+        """
+        names = []
+        while frame is not None:
+            names.append('{}:{}'.format(os.path.splitext(os.path.basename(frame.f_code.co_filename))[0], frame.f_code.co_name))
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self.collapse(frame)] += 1
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def dump(self, filename):
+        """ Write the collapsed stacks, one per line with the number of samples.
+        """
+        with open(filename, 'w') as stacks_file:
+            for stack, count in sorted(self.stacks.items()):
+                stacks_file.write('{} {}\n'.format(stack, count))
+
+
+class Instrumentation(object):
+    """ Counters and histograms recorded by the probes (and by explicit calls of count, observe and phase).
+    """
+    def __init__(self):
+        self.counters = defaultdict(int)  # {name => total}
+        self.histograms = defaultdict(Histogram)  # {name => Histogram()}
+        self.profiler = None  # SamplingProfiler, if enabled.
+        self.local = threading.local()  # A stack of the nested probes' time for each thread.
+
+    def __getstate__(self):
+        """ Only the counters and histograms are sent from the worker processes.
+        """
+        return {'counters': self.counters, 'histograms': self.histograms}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.counters.update(state['counters'])
+        self.histograms.update(state['histograms'])
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def observe(self, name, value):
+        self.histograms[name].add(value)
+
+    def record(self, name, value):
+        """ Add the value to the counter name and to its histogram.
+        """
+        self.counters[name] += value
+        self.histograms[name].add(value)
+
+    @contextmanager
+    def phase(self, name):
+        """ Record the time of a block of code into the histogram name.seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name + '.seconds', time.perf_counter() - start)
+
+    def call(self, name, function, args, kwargs, get_counts=None):
+        """ Call a probed function and record its time and counts.
+        """
+        stack = self.local.__dict__.setdefault('stack', [])
+        stack.append(0.0)  # Time of the nested probes.
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            nested_seconds = stack.pop()
+            if stack:
+                stack[-1] += seconds
+            self.counters[name + '.calls'] += 1
+            self.observe(name + '.seconds', seconds)
+            self.observe(name + '.self_seconds', seconds - nested_seconds)
+
+        if get_counts is not None:
+            for counter, value in get_counts(args, result).items():
+                self.record(name + '.' + counter, value)
+        return result
+
+    def merge(self, other):
+        """ Add counters and histograms of another instrumentation (e.g. of a worker process).
+        """
+        for name, value in other.counters.items():
+            self.counters[name] += value
+        for name, histogram in other.histograms.items():
+            self.histograms[name].merge(histogram)
+
+    def get_report(self):
+        return {
+            'counters': dict(self.counters),
+            'histograms': {name: histogram.get_summary() for name, histogram in sorted(self.histograms.items())},
+        }
+
+    def log_report(self):
+        for name, value in sorted(self.counters.items()):
+            logging.info('%s = %s', name, value)
+        for name, summary in self.get_report()['histograms'].items():
+            logging.info('%s: count = %d, mean = %.6g, p50 = %.6g, p99 = %.6g, max = %.6g',
+                         name, summary['count'], summary['mean'], summary['p50'], summary['p99'], summary['max'])
+
+
+def probe(name, get_counts=None):
+    """
+    Mark a method to be instrumented as name, its class must be decorated by probed.
+    get_counts(args, result) returns a dict of counts of the call, it is called only when the instrumentation is enabled.
+    """
+    def mark(function):
+        function.probe = (name, get_counts)
+        return function
+    return mark
+
+
+def _install(cls, attribute, original):
+    """ Replace the marked attribute of the class by a wrapper calling the enabled Instrumentation.
+    """
+    function = original.__func__ if isinstance(original, staticmethod) else original
+    name, get_counts = function.probe
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        recorder = active
+        if recorder is None:
+            return function(*args, **kwargs)
+        return recorder.call(name, function, args, kwargs, get_counts)
+
+    setattr(cls, attribute, staticmethod(wrapper) if isinstance(original, staticmethod) else wrapper)
+
+
+def probed(cls):
+    """ Register a class with methods marked by probe.
+    """
+    PROBED_CLASSES[cls] = {attribute: value for attribute, value in vars(cls).items()
+                           if hasattr(value.__func__ if isinstance(value, staticmethod) else value, 'probe')}
+    if active is not None:
+        for attribute, original in PROBED_CLASSES[cls].items():
+            _install(cls, attribute, original)
+    return cls
+
+
+def enable(profile=False, interval=0.001):
+    """ Enable the instrumentation of all probed classes (and the sampling profiler of this thread), return the Instrumentation.
+    """
+    global active
+    if active is not None:
+        disable()
+
+    active = Instrumentation()
+    for cls, originals in PROBED_CLASSES.items():
+        for attribute, original in originals.items():
+            _install(cls, attribute, original)
+
+    if profile:
+        active.profiler = SamplingProfiler(interval)
+        active.profiler.start()
+    return active
+
+
+def disable():
+    """ Restore the original methods, return the disabled Instrumentation.
+    """
+    global active
+    recorder, active = active, None
+    for cls, originals in PROBED_CLASSES.items():
+        for attribute, original in originals.items():
+            setattr(cls, attribute, original)
+
+    if recorder is not None and recorder.profiler is not None:
+        recorder.profiler.stop()
+    return recorder
+
+
+@contextmanager
+def instrumented(profile=False, interval=0.001):
+    """ Enable the instrumentation within a with block, the Instrumentation is returned by the with statement.
+    """
+    recorder = enable(profile, interval)
+    try:
+        yield recorder
+    finally:
+        disable()
+
+
+def phase(name):
+    """ Record the time of a block of code if the instrumentation is enabled.
+    """
+    return active.phase(name) if active is not None else _NO_PHASE
+
+
+class _NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+def count_paths(args, result):
+    """
+    Counts of the path-based recommend: the user's items and the traversed edges (item, neighbour, neighbour's item).
+    The dict walks count their edges themselves, the array-backed network is counted by the profile lengths.
+    """
+    recommender, user_id = args[0], args[1]
+    if getattr(recommender, 'bounded', False) or getattr(recommender, 'item_index', None) is not None:
+        return {'recommended': len(result)}  # Other paths are walked, they are counted by the called methods.
+
+    graph = recommender.graph
+    if graph is not None:
+        if user_id not in graph.user_id2offset:
+            return {}
+        return dict(graph.count_paths([graph.user_id2offset[user_id]]), recommended=len(result))
+
+    if user_id not in recommender.users:
+        return {}
+    return {'items': len(recommender.users[user_id].user_profile), 'recommended': len(result)}
+
+
+def count_neighbour_paths(args, result):
+    """ Counts of the neighbours-based recommend: the considered neighbours, the traversed edges (neighbour, neighbour's item).
+    """
+    recommender, user_id = args[0], args[1]
+    graph = recommender.graph
+    if graph is not None:
+        if user_id not in graph.user_id2offset:
+            return {}
+        return dict(graph.count_paths([graph.user_id2offset[user_id]], neighbours=True), recommended=len(result))
+
+    if user_id not in recommender.users:
+        return {}
+    neighbours = recommender.users[user_id].neighbours
+    n_edges = sum(len(recommender.users[neighbour['neighbour_id']].user_profile) for neighbour in neighbours)
+    return {'neighbours': len(neighbours), 'edges': n_edges, 'recommended': len(result)}
+
+
+def count_users(args, result):
+    """ Counts of recommend_many: the recommended users (their edges are counted by the walks or the scoring).
+    """
+    return {'users': len(result)}
+
+
+def count_candidates(args, result):
+    """ Counts of get_neighbours_candidates: the neighbour candidates.
+    """
+    return {'candidates': len(result)}
+
+
+def count_neighbours(args, result):
+    """ Counts of detect_neighbours_of: the detected neighbours.
+    """
+    return {'neighbours': len(args[0].users[args[1]].neighbours)}
@@ -0,0 +1,155 @@
+"""A precomputed item-item co-occurrence index, the paths of the length 3 are scored by lookups of the item neighbours."""
+
+import logging
+
+from math import sqrt
+from multiprocessing import get_context
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+_matrix = None  # The (items x users) matrix, inherited (read-only) by the forked worker processes.
+_diagonal = None  # C[i, i] of all items.
+
+
+def _build_chunk(chunk):
+    """ Compute the co-occurrences of a chunk of items (rows start, end) and prune them, see ItemIndex.build.
+    """
+    start, end, n_neighbours, normalize = chunk
+    cooccurrences = (_matrix[start:end] @ _matrix.T).tocsr()
+
+    rows = []
+    for n_row in range(end - start):
+        indices = cooccurrences.indices[cooccurrences.indptr[n_row]:cooccurrences.indptr[n_row + 1]]
+        values = cooccurrences.data[cooccurrences.indptr[n_row]:cooccurrences.indptr[n_row + 1]]
+        weights = values
+        if normalize:
+            # Items with zero weights only have zero co-occurrences.
+            norms = np.sqrt(_diagonal[start + n_row] * _diagonal[indices])
+            weights = np.divide(values, norms, out=np.zeros(len(values)), where=norms > 0)
+
+        # The top n_neighbours items by the weight, ties are ordered by the item offsets.
+        order = np.lexsort((indices, -weights))[:n_neighbours]
+        rows.append((indices[order], values[order]))
+
+    return start, rows
+
+
+class ItemIndex(object):
+    """
+    A pruned item-item co-occurrence index.
+    The co-occurrence of items i and j is C[i, j] = sum over users v of w(v, i) * w(v, j), i.e. the summed weight of
+    all paths (i, v, j), so the score of the paths (user, i, v, j) is the sum of w(user, i) * C[i, j] over user's items.
+    Only the top n_neighbours items of each item are kept (all of them with n_neighbours=None, the scores are exact then).
+    With normalize, the weights are C[i, j] / sqrt(C[i, i] * C[j, j]), i.e. the cosine similarity of the item profiles.
+    The index is updated incrementally with each new interaction, the co-occurrences only grow (weights are merged by max).
+    The raw pruned index stays exact, but with normalize the growing norms reorder the neighbours and pruned items cannot
+    be restored, so the normalized index should be rebuilt from time to time. The same holds for the raw index once
+    weights are lowered or edges removed (set_interactions, e.g. by a decaying InteractionLog).
+
+    """
+    def __init__(self, n_neighbours=100, normalize=False):
+        self.n_neighbours = n_neighbours
+        self.normalize = normalize
+
+        self.neighbours = dict()  # {item_id => {neighbour item_id => co-occurrence}}
+        self.diagonal = dict()  # {item_id => C[i, i]}, the sum of the squared weights of the item profile.
+        self.built = False  # The index is updated only after it was built.
+
+    def build(self, users, items, n_jobs=1, chunk_size=1000):
+        """
+        Build the index from the item profiles (dicts of User and Item nodes).
+        Items are processed in chunks of chunk_size rows of the sparse product R R^T, with n_jobs > 1 by forked worker processes.
+        """
+        global _matrix, _diagonal
+        item_ids = list(items.keys())
+        user_id2offset = {user_id: user_offset for user_offset, user_id in enumerate(users.keys())}
+
+        indptr = np.cumsum([0] + [len(items[item_id].item_profile) for item_id in item_ids])
+        indices = np.fromiter((user_id2offset[user_id] for item_id in item_ids for user_id in items[item_id].item_profile), dtype=np.int64, count=indptr[-1])
+        weights = np.fromiter((weight for item_id in item_ids for weight in items[item_id].item_profile.values()), dtype=np.float64, count=indptr[-1])
+
+        _matrix = csr_matrix((weights, indices, indptr), shape=(len(item_ids), len(user_id2offset)))
+        _diagonal = np.asarray(_matrix.multiply(_matrix).sum(axis=1)).ravel()
+        self.neighbours = dict()
+        self.diagonal = dict(zip(item_ids, _diagonal.tolist()))
+
+        n_neighbours = self.n_neighbours if self.n_neighbours is not None else len(item_ids)
+        chunks = [(start, min(start + chunk_size, len(item_ids)), n_neighbours, self.normalize) for start in range(0, len(item_ids), chunk_size)]
+        try:
+            if n_jobs == 1:
+                self.collect_chunks(map(_build_chunk, chunks), item_ids)
+            else:
+                # The with statement terminates the pool when a chunk fails, otherwise the workers are joined first.
+                with get_context('fork').Pool(n_jobs) as pool:
+                    self.collect_chunks(pool.imap_unordered(_build_chunk, chunks), item_ids)
+                    pool.close()
+                    pool.join()
+        finally:
+            _matrix = _diagonal = None
+
+        self.built = True
+
+    def collect_chunks(self, chunk_results, item_ids):
+        """ Store the pruned neighbours of the built chunks, see build.
+        """
+        for start, rows in chunk_results:
+            for n_row, (neighbour_offsets, values) in enumerate(rows):
+                self.neighbours[item_ids[start + n_row]] = dict(zip([item_ids[offset] for offset in neighbour_offsets.tolist()], values.tolist()))
+            logging.info('Indexed %d (%d%%) items', len(self.neighbours), len(self.neighbours) * 100 / len(item_ids))
+
+    def get_weight(self, item_id, neighbour_id, cooccurrence):
+        """ Return the weight of the item's neighbour with the given co-occurrence.
+        """
+        if not self.normalize:
+            return cooccurrence
+        norm = sqrt(self.diagonal[item_id] * self.diagonal[neighbour_id])
+        return cooccurrence / norm if norm > 0 else 0.0
+
+    def get_neighbours(self, item_id):
+        """ Return the item's neighbours {item_id => weight}.
+        """
+        neighbours = self.neighbours.get(item_id, {})
+        if not self.normalize:
+            return neighbours
+        return {neighbour_id: self.get_weight(item_id, neighbour_id, cooccurrence) for neighbour_id, cooccurrence in neighbours.items()}
+
+    @staticmethod
+    def get_cooccurrence(item_id, neighbour_id, items):
+        """ Calculate the co-occurrence of two items from their profiles.
+        """
+        profile_a, profile_b = items[item_id].item_profile, items[neighbour_id].item_profile
+        if len(profile_a) > len(profile_b):
+            profile_a, profile_b = profile_b, profile_a
+        return sum(weight * profile_b[user_id] for user_id, weight in profile_a.items() if user_id in profile_b)
+
+    def update_pair(self, item_id, neighbour_id, delta, items):
+        """ Add delta to the co-occurrence of the items, a pair missing in the index is calculated and possibly inserted.
+        """
+        neighbours = self.neighbours.setdefault(item_id, {})
+        if neighbour_id in neighbours:
+            neighbours[neighbour_id] += delta
+            return
+
+        neighbours[neighbour_id] = self.get_cooccurrence(item_id, neighbour_id, items)
+        if self.n_neighbours is not None and len(neighbours) > self.n_neighbours:
+            weakest_id = min(neighbours, key=lambda other_id: self.get_weight(item_id, other_id, neighbours[other_id]))
+            del neighbours[weakest_id]
+
+    def put_interaction(self, user_id, item_id, old_weight, weight, users, items):
+        """
+        Update the index by an interaction already stored in the nodes, where the weight of the edge (user, item)
+        changed from old_weight to weight. Co-occurrences with all items of the user's profile change.
+        """
+        if not self.built or weight == old_weight:
+            return
+
+        self.diagonal[item_id] = self.diagonal.get(item_id, 0.0) + weight * weight - old_weight * old_weight
+        for user_item_id, user_item_weight in users[user_id].user_profile.items():
+            if user_item_id == item_id:
+                self.update_pair(item_id, item_id, weight * weight - old_weight * old_weight, items)
+                continue
+
+            delta = (weight - old_weight) * user_item_weight
+            self.update_pair(item_id, user_item_id, delta, items)
+            self.update_pair(user_item_id, item_id, delta, items)
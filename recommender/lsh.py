@@ -0,0 +1,93 @@
+"""Approximate neighbour candidates generated by a MinHash locality sensitive hashing (LSH) index."""
+
+import zlib
+
+from collections import defaultdict
+
+import numpy as np
+
+PRIME = (1 << 31) - 1  # A modulus of the universal hash functions.
+
+
+class MinHashLSH(object):
+    """
+    A MinHash LSH index of the user profiles.
+    Each user has a signature of n_bands * band_size minimal hashes of the items in its profile. The signature is
+    split into bands and users with the same band values are stored in the same bucket. Users sharing a bucket are
+    likely similar (in the Jaccard sense), so the candidates of a user are obtained only from its buckets.
+    The index is updated incrementally with each new interaction.
+
+    """
+    def __init__(self, n_bands=20, band_size=5, seed=42):
+        self.n_bands = n_bands
+        self.band_size = band_size
+
+        # Parameters of the hash functions h(x) = (a * x + b) mod PRIME.
+        random_state = np.random.RandomState(seed)
+        self.hash_a = random_state.randint(1, PRIME, n_bands * band_size).astype(np.uint64)
+        self.hash_b = random_state.randint(0, PRIME, n_bands * band_size).astype(np.uint64)
+
+        self.item_hashes = dict()  # {item_id => array of the item hashes}
+        self.signatures = dict()  # {user_id => array of the minimal hashes}
+        self.buckets = defaultdict(dict)  # {(band, band values) => {user_id => None}}, dicts keep the insertion order.
+
+    def get_item_hashes(self, item_id):
+        """ Hash the item by all the hash functions.
+        """
+        if item_id not in self.item_hashes:
+            item_hash = np.uint64(zlib.crc32(str(item_id).encode('utf-8')))
+            self.item_hashes[item_id] = (self.hash_a * item_hash + self.hash_b) % np.uint64(PRIME)
+        return self.item_hashes[item_id]
+
+    def get_signature(self, item_ids):
+        """ Calculate the signature of a profile with the given items.
+        """
+        signature = np.full(self.n_bands * self.band_size, PRIME, dtype=np.uint64)
+        for item_id in item_ids:
+            np.minimum(signature, self.get_item_hashes(item_id), out=signature)
+        return signature
+
+    def get_bucket_keys(self, signature):
+        """ Return keys of the buckets for the given signature, one for each band.
+        """
+        return [(band, signature[band * self.band_size:(band + 1) * self.band_size].tobytes()) for band in range(self.n_bands)]
+
+    def put_interaction(self, user_id, item_id):
+        """ Update the user's signature by a new item and move the user into buckets of the changed bands.
+        """
+        item_hashes = self.get_item_hashes(item_id)
+        old_signature = self.signatures.get(user_id)
+        if old_signature is None:
+            old_keys = [None] * self.n_bands
+            signature = item_hashes.copy()
+        else:
+            if (item_hashes >= old_signature).all():
+                return
+            old_keys = self.get_bucket_keys(old_signature)
+            signature = np.minimum(old_signature, item_hashes)
+
+        for old_key, key in zip(old_keys, self.get_bucket_keys(signature)):
+            if old_key == key:
+                continue
+
+            if old_key is not None:
+                del self.buckets[old_key][user_id]
+                if not self.buckets[old_key]:
+                    del self.buckets[old_key]
+            self.buckets[key][user_id] = None
+
+        self.signatures[user_id] = signature
+
+    def query(self, item_ids=None, user_id=None, n_candidates=1000):
+        """
+        Return up to n_candidates users sharing a bucket with the given profile (or with the indexed user).
+        Candidates are ordered by the number of shared buckets, i.e. by their estimated similarity.
+        """
+        signature = self.signatures[user_id] if user_id is not None else self.get_signature(item_ids)
+
+        collisions = defaultdict(int)  # {user_id => number of shared buckets}
+        for key in self.get_bucket_keys(signature):
+            for candidate_id in self.buckets.get(key, ()):
+                collisions[candidate_id] += 1
+
+        return sorted(collisions.keys(), key=lambda candidate_id: collisions[candidate_id], reverse=True)[:n_candidates]
@@ -0,0 +1,222 @@
+"""User neighbours detection in the array-backed network, optionally parallelized over worker processes."""
+
+import logging
+
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from recommender import instrumentation
+from recommender.similarity import check_measure, finish_similarities, get_centered_norm, get_product
+from recommender.sparse_graph import N_NEIGHBOURS, gather_rows
+
+# Arrays of the network needed for the neighbours detection.
+NETWORK_ARRAYS = ['user_indptr', 'user_indices', 'user_weights', 'item_indptr', 'item_indices', 'user_norms']
+
+_worker_arrays = None  # Network arrays attached by each worker process, {name => array}.
+_worker_memory = []  # Shared memory blocks backing the worker arrays.
+
+
+def get_candidates(arrays, user_offset, n_candidates=1000):
+    """
+    A heuristic to preselect the neighbour candidates (see Recommender.get_neighbours_candidates).
+    Users sharing an item with the user are scored by the (normalized) number of common items.
+    """
+    user_indptr, user_indices = arrays['user_indptr'], arrays['user_indices']
+    items = user_indices[user_indptr[user_offset]:user_indptr[user_offset + 1]]
+    _, users, _ = gather_rows(arrays['item_indptr'], arrays['item_indices'], None, items)
+
+    candidates, first_seen, inverse = np.unique(users, return_index=True, return_inverse=True)
+    candidate_scores = np.bincount(inverse, weights=1 / arrays['user_norms'][users], minlength=len(candidates))
+    by_appearance = np.argsort(first_seen, kind='stable')
+    candidates, candidate_scores = candidates[by_appearance], candidate_scores[by_appearance]
+    return candidates[np.argsort(-candidate_scores, kind='stable')[:n_candidates]]
+
+
+def get_user_similarities(arrays, user_a, candidates, item_positions, measure='cosine'):
+    """
+    Return the similarities of the user with the candidates and the number of the candidates' profile entries read.
+    item_positions is a (reused) array of -1 for each item, it is restored before returning.
+    """
+    user_indptr, user_indices, user_weights = arrays['user_indptr'], arrays['user_indices'], arrays['user_weights']
+    user_norms = arrays['user_norms']
+    items_a = user_indices[user_indptr[user_a]:user_indptr[user_a + 1]]
+    weights_a = user_weights[user_indptr[user_a]:user_indptr[user_a + 1]]
+
+    # Similarities, the products are summed in the order of the items in the user profile.
+    item_positions[items_a] = np.arange(len(items_a))
+    owners, items_b, weights_b = gather_rows(user_indptr, user_indices, user_weights, candidates)
+    sizes_b = np.bincount(owners, minlength=len(candidates)).astype(np.float64)
+    mean_a, means_b = 0.0, np.zeros(len(candidates))
+    centered_norm_a, centered_norms_b = 0.0, np.zeros(len(candidates))
+    if measure == 'adjusted_cosine':
+        # Summed in order as by the dict network (numpy sums pairwise), so the similarities are the same.
+        mean_a = sum(weights_a.tolist()) / len(weights_a) if len(weights_a) else 0.0
+        centered_norm_a = get_centered_norm(weights_a.tolist(), mean_a)
+        means_b = np.divide(np.bincount(owners, weights=weights_b, minlength=len(candidates)), sizes_b, out=np.zeros(len(candidates)), where=sizes_b > 0)
+        centered_norms_b = np.sqrt(np.bincount(owners, weights=(weights_b - means_b[owners]) ** 2, minlength=len(candidates)))
+
+    positions = item_positions[items_b]
+    common = positions >= 0
+    owners, positions, weights_b = owners[common], positions[common], weights_b[common]
+    order = np.argsort(positions, kind='stable')
+    owners, positions, weights_b = owners[order], positions[order], weights_b[order]
+    products = np.bincount(owners, weights=get_product(measure, weights_a[positions], weights_b, mean_a, means_b[owners]), minlength=len(candidates))
+    similarities = finish_similarities(measure, products, (user_norms[user_a], len(items_a), centered_norm_a),
+                                       (user_norms[candidates], sizes_b, centered_norms_b))
+    item_positions[items_a] = -1
+    return similarities, len(items_b)
+
+
+def detect_neighbours(arrays, user_offsets, n_candidates=1000, n_neighbours=N_NEIGHBOURS, measure='cosine'):
+    """
+    Detect neighbours of the given users, return (neighbour offsets, similarities) arrays with n_neighbours columns.
+    This is the vectorized version of the Recommender.detect_user_neighbours loops. Scores are summed in the same
+    order and ties are broken by the same (first occurrence) order, so the neighbours are the same as of the loops.
+    If the arrays contain candidate_indptr/candidate_indices, the candidates are read from them instead.
+    The similarity measure is one of similarity.MEASURES. The time of the candidates generation, the similarities
+    and the sort is recorded by the instrumentation (if enabled) as the phases of detect_neighbours.
+    """
+    n_items = len(arrays['item_indptr']) - 1
+    neighbour_offsets = np.full((len(user_offsets), n_neighbours), -1, dtype=np.int32)
+    neighbour_similarities = np.zeros((len(user_offsets), n_neighbours), dtype=np.float64)
+    item_positions = np.full(n_items, -1, dtype=np.int64)  # Position of each item in the current user profile.
+
+    for n_user, user_a in enumerate(user_offsets):
+        with instrumentation.phase('detect_neighbours.candidates'):
+            if 'candidate_indptr' in arrays:
+                candidates = arrays['candidate_indices'][arrays['candidate_indptr'][user_a]:arrays['candidate_indptr'][user_a + 1]]
+            else:
+                candidates = get_candidates(arrays, user_a, n_candidates)
+            candidates = candidates[candidates != user_a]
+
+        with instrumentation.phase('detect_neighbours.similarity'):
+            similarities, n_edges = get_user_similarities(arrays, user_a, candidates, item_positions, measure)
+
+        with instrumentation.phase('detect_neighbours.sort'):
+            best = np.argsort(-similarities, kind='stable')[:n_neighbours]
+            neighbour_offsets[n_user, :len(best)] = candidates[best]
+            neighbour_similarities[n_user, :len(best)] = similarities[best]
+
+        if instrumentation.active is not None:
+            instrumentation.active.record('detect_neighbours.candidates', len(candidates))
+            instrumentation.active.record('detect_neighbours.edges', n_edges)
+
+    return neighbour_offsets, neighbour_similarities
+
+
+def _attach_arrays(descriptions):
+    """ Attach the network arrays from the shared memory (the worker process initializer).
+    """
+    global _worker_arrays
+    _worker_arrays = {}
+    for name, (memory_name, shape, dtype) in descriptions.items():
+        memory = SharedMemory(name=memory_name)
+        _worker_memory.append(memory)
+        _worker_arrays[name] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def _detect_chunk(chunk):
+    """
+    Detect neighbours for a chunk of users (range start, end) in a worker process, return also the instrumentation
+    of the chunk (recorded only with the instrumentation enabled in the parent, the parent merges it).
+    """
+    start, end, n_candidates, n_neighbours, measure, collect_instrumentation = chunk
+    instrumentation.active = instrumentation.Instrumentation() if collect_instrumentation else None
+    chunk_neighbours = detect_neighbours(_worker_arrays, range(start, end), n_candidates, n_neighbours, measure)
+    return start, chunk_neighbours, instrumentation.active
+
+
+def detect_user_neighbours(graph, n_jobs=1, chunk_size=1000, n_candidates=1000, n_neighbours=N_NEIGHBOURS, candidates=None, measure='cosine'):
+    """
+    Detect neighbours of all users in the network and store them into the graph.
+    With n_jobs > 1, users are split into chunks of chunk_size users processed by a pool of worker processes.
+    The workers read the network arrays from the shared memory, the result does not depend on n_jobs or chunk_size.
+    Optional candidates are (indptr, indices) arrays with precomputed neighbour candidates of each user.
+    """
+    check_measure(measure)
+    graph.compact()
+    arrays = {name: getattr(graph, name) for name in NETWORK_ARRAYS}
+    if candidates is not None:
+        arrays['candidate_indptr'], arrays['candidate_indices'] = candidates
+
+    neighbour_offsets = np.full((graph.n_users, n_neighbours), -1, dtype=np.int32)
+    neighbour_similarities = np.zeros((graph.n_users, n_neighbours), dtype=np.float64)
+    collect_instrumentation = n_jobs != 1 and instrumentation.active is not None
+    chunks = [(start, min(start + chunk_size, graph.n_users), n_candidates, n_neighbours, measure, collect_instrumentation)
+              for start in range(0, graph.n_users, chunk_size)]
+
+    n_detected = 0
+
+    def store(start, chunk_neighbours):
+        nonlocal n_detected
+        n_detected += len(chunk_neighbours[0])
+        neighbour_offsets[start:start + len(chunk_neighbours[0])], neighbour_similarities[start:start + len(chunk_neighbours[0])] = chunk_neighbours
+        logging.info('Detected neighbours for %d (%d%%) users', n_detected, n_detected * 100 / graph.n_users)
+
+    if n_jobs == 1:
+        for start, end, _, _, _, _ in chunks:
+            store(start, detect_neighbours(arrays, range(start, end), n_candidates, n_neighbours, measure))
+    else:
+        memory_blocks = []
+        descriptions = {}
+        try:
+            for name, array in arrays.items():
+                memory = SharedMemory(create=True, size=max(array.nbytes, 1))
+                memory_blocks.append(memory)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[:] = array
+                descriptions[name] = (memory.name, array.shape, array.dtype.str)
+
+            # The with statement terminates the pool when a chunk fails, otherwise the workers are joined first.
+            with get_context('fork').Pool(n_jobs, initializer=_attach_arrays, initargs=(descriptions,)) as pool:
+                for start, chunk_neighbours, chunk_instrumentation in pool.imap_unordered(_detect_chunk, chunks):
+                    store(start, chunk_neighbours)
+                    if chunk_instrumentation is not None:
+                        instrumentation.active.merge(chunk_instrumentation)
+                pool.close()
+                pool.join()
+        finally:
+            for memory in memory_blocks:
+                memory.close()
+                memory.unlink()
+
+    graph.neighbour_offsets = neighbour_offsets
+    graph.neighbour_similarities = neighbour_similarities
+
+
+def get_affected_users(graph, user_offsets):
+    """ Return the given users and all users sharing an item with them (sorted offsets).
+    """
+    graph.compact()
+    user_offsets = np.asarray(user_offsets, dtype=np.int64)
+    _, items, _ = gather_rows(graph.user_indptr, graph.user_indices, None, user_offsets)
+    _, users, _ = gather_rows(graph.item_indptr, graph.item_indices, None, np.unique(items))
+    return np.union1d(user_offsets, users)
+
+
+def refresh_user_neighbours(graph, user_offsets, n_candidates=1000, n_neighbours=N_NEIGHBOURS, candidates=None, measure='cosine'):
+    """ Detect neighbours of the given users again, neighbours of other users are kept.
+    """
+    check_measure(measure)
+    graph.compact()
+    arrays = {name: getattr(graph, name) for name in NETWORK_ARRAYS}
+    if candidates is not None:
+        arrays['candidate_indptr'], arrays['candidate_indices'] = candidates
+
+    # New users have no neighbours yet, the table is widened if it is narrower than n_neighbours (e.g. built elsewhere).
+    width = max(n_neighbours, graph.neighbour_offsets.shape[1])
+    n_rows, n_columns = graph.neighbour_offsets.shape
+    if n_rows < graph.n_users or n_columns < width:
+        neighbour_offsets = np.full((graph.n_users, width), -1, dtype=np.int32)
+        neighbour_similarities = np.zeros((graph.n_users, width), dtype=np.float64)
+        neighbour_offsets[:n_rows, :n_columns] = graph.neighbour_offsets
+        neighbour_similarities[:n_rows, :n_columns] = graph.neighbour_similarities
+        graph.neighbour_offsets, graph.neighbour_similarities = neighbour_offsets, neighbour_similarities
+
+    # The columns over n_neighbours (of a wider table) are cleared.
+    graph.neighbour_offsets[user_offsets, n_neighbours:] = -1
+    graph.neighbour_similarities[user_offsets, n_neighbours:] = 0.0
+    graph.neighbour_offsets[user_offsets, :n_neighbours], graph.neighbour_similarities[user_offsets, :n_neighbours] = \
+        detect_neighbours(arrays, user_offsets, n_candidates, n_neighbours, measure)
+    logging.info('Refreshed neighbours for %d users', len(user_offsets))
@@ -0,0 +1,197 @@
+"""
+Compact user and item nodes of the dict network, used by the recommenders with compact=True.
+
+A node is a slotted object with only the attributes its recommender uses. Its profile (ProfileView) is stored in
+parallel arrays: offsets of the interned ids (array('i')) and the weights (array('d'), so the weights are the same
+as in the dicts) in the order of insertion, and the sorted offsets with their positions, which are looked up by
+the binary search. The ids are interned once per recommender by an IdTable. The neighbours are stored in two arrays
+as well. An edge takes 20 bytes instead of a dict entry, but the lookups are slower than in the dicts.
+The public attributes stay readable: user_profile and item_profile are mappings {id => weight} (ProfileView),
+neighbours is a list of dicts with the keys neighbour_id and similarity, so the recommenders work with both kinds of nodes.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections.abc import ItemsView, MutableMapping, ValuesView
+
+from recommender.base import NormMixin
+
+
+class IdTable(object):
+    """ Ids interned to integer offsets, shared by the nodes of one recommender.
+    """
+    def __init__(self):
+        self.ids = []  # [id], the offset is the index.
+        self.id2offset = dict()  # {id => offset}
+
+    def intern(self, id_):
+        """ Return the offset of the id, a new id is appended.
+        """
+        offset = self.id2offset.get(id_)
+        if offset is None:
+            offset = self.id2offset[id_] = len(self.ids)
+            self.ids.append(id_)
+        return offset
+
+
+class ProfileItems(ItemsView):
+    """ The (id, weight) pairs of a ProfileView, iterated from its arrays.
+    """
+    __slots__ = ()
+
+    def __iter__(self):
+        return zip(self._mapping, self._mapping.weights)
+
+
+class ProfileValues(ValuesView):
+    """ The weights of a ProfileView, iterated from its array.
+    """
+    __slots__ = ()
+
+    def __iter__(self):
+        return iter(self._mapping.weights)
+
+
+class ProfileView(MutableMapping):
+    """
+    A mapping {id => weight} stored in arrays, the profile of a compact node.
+    Missing ids are read as 0.0 like from the defaultdict(float) profiles of the other nodes, but nothing is inserted.
+    The ids are iterated in the order of insertion as in the dicts, so the recommenders score (and break ties) the same way.
+
+    """
+    __slots__ = ('offsets', 'weights', 'sorted_offsets', 'positions', 'ids')
+
+    def __init__(self, ids):
+        self.offsets = array('i')  # Offsets of the ids in the order of insertion.
+        self.weights = array('d')  # Weights of the ids in the order of insertion.
+        self.sorted_offsets = array('i')  # The sorted offsets, for the binary search.
+        self.positions = array('i')  # Positions of the sorted offsets in offsets and weights.
+        self.ids = ids  # IdTable of the ids.
+
+    def find(self, id_):
+        """ Return the position of the id in offsets and weights, or -1.
+        """
+        offset = self.ids.id2offset.get(id_)
+        if offset is None:
+            return -1
+        sorted_offsets = self.sorted_offsets
+        index = bisect_left(sorted_offsets, offset)
+        return self.positions[index] if index < len(sorted_offsets) and sorted_offsets[index] == offset else -1
+
+    def __getitem__(self, id_):
+        position = self.find(id_)
+        return self.weights[position] if position >= 0 else 0.0
+
+    def get(self, id_, default=None):
+        position = self.find(id_)
+        return self.weights[position] if position >= 0 else default
+
+    def __contains__(self, id_):
+        return self.find(id_) >= 0
+
+    def __setitem__(self, id_, weight):
+        offset = self.ids.intern(id_)
+        index = bisect_left(self.sorted_offsets, offset)
+        if index < len(self.sorted_offsets) and self.sorted_offsets[index] == offset:
+            self.weights[self.positions[index]] = weight
+        else:
+            self.sorted_offsets.insert(index, offset)
+            self.positions.insert(index, len(self.offsets))
+            self.offsets.append(offset)
+            self.weights.append(weight)
+
+    def __delitem__(self, id_):
+        offset = self.ids.id2offset.get(id_)
+        index = bisect_left(self.sorted_offsets, offset) if offset is not None else len(self.sorted_offsets)
+        if index >= len(self.sorted_offsets) or self.sorted_offsets[index] != offset:
+            raise KeyError(id_)
+
+        position = self.positions[index]
+        del self.sorted_offsets[index]
+        del self.positions[index]
+        del self.offsets[position]
+        del self.weights[position]
+        # The removals are rare (set_interactions), so the positions after the removed one are shifted in O(n).
+        self.positions = array('i', [other - (other > position) for other in self.positions])
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        return map(self.ids.ids.__getitem__, self.offsets)
+
+    def items(self):
+        return ProfileItems(self)
+
+    def values(self):
+        return ProfileValues(self)
+
+
+class CompactUser(object):
+    """ A user node with the profile stored in arrays (the baseline recommenders).
+    """
+    __slots__ = ('user_id', 'user_profile')
+
+    def __init__(self, user_id, item_ids):
+        self.user_id = user_id  # String identifier of the user.
+        self.user_profile = ProfileView(item_ids)  # The mapping {item_id => interaction weight}.
+
+
+class CompactItem(object):
+    """ An item node with the profile stored in arrays (the baseline recommenders).
+    """
+    __slots__ = ('item_id', 'item_profile')
+
+    def __init__(self, item_id, user_ids):
+        self.item_id = item_id  # Item identifier.
+        self.item_profile = ProfileView(user_ids)  # The mapping {user_id => interaction weight}.
+
+
+class CompactNormalizedUser(NormMixin, CompactUser):
+    """ A compact user node with the norm (the normalized recommender).
+    """
+    __slots__ = ('norm', 'squared_norm')
+    profile_name = 'user_profile'
+
+    def __init__(self, user_id, item_ids):
+        super().__init__(user_id, item_ids)
+        self.norm = 0.0  # User's norm will be stored here.
+        self.squared_norm = 0.0  # A sum of the (transformed) weights under the square root of the norm.
+
+
+class CompactNormalizedItem(NormMixin, CompactItem):
+    """ A compact item node with the norm (the normalized and the neighbours recommenders).
+    """
+    __slots__ = ('norm', 'squared_norm')
+    profile_name = 'item_profile'
+
+    def __init__(self, item_id, user_ids):
+        super().__init__(item_id, user_ids)
+        self.norm = 0.0  # Item's norm will be stored here.
+        self.squared_norm = 0.0  # A sum of the (transformed) weights under the square root of the norm.
+
+
+class CompactNeighboursUser(CompactNormalizedUser):
+    """ A compact user node with the norm and the neighbours stored in arrays (the neighbours recommender).
+    """
+    __slots__ = ('user_ids', 'neighbour_offsets', 'neighbour_similarities')
+
+    def __init__(self, user_id, item_ids, user_ids):
+        super().__init__(user_id, item_ids)
+        self.user_ids = user_ids  # IdTable of the users, for the neighbours.
+        self.neighbour_offsets = None  # array('i') of the neighbours' offsets in user_ids, None without neighbours.
+        self.neighbour_similarities = None  # array('d') of the neighbours' similarities.
+
+    @property
+    def neighbours(self):
+        """ The list of dicts with the keys neighbour_id and similarity.
+        """
+        if self.neighbour_offsets is None:
+            return []
+        return [{'neighbour_id': self.user_ids.ids[neighbour_offset], 'similarity': similarity}
+                for neighbour_offset, similarity in zip(self.neighbour_offsets, self.neighbour_similarities)]
+
+    @neighbours.setter
+    def neighbours(self, neighbours):
+        self.neighbour_offsets = array('i', [self.user_ids.intern(neighbour['neighbour_id']) for neighbour in neighbours])
+        self.neighbour_similarities = array('d', [neighbour['similarity'] for neighbour in neighbours])
@@ -1,81 +1,119 @@
 """All weights are normalized using user (or item) norms."""
 
 from collections import defaultdict
-from math import sqrt
 
+from recommender import instrumentation
+from recommender.base import InteractionsMixin, NormMixin, PathsMixin, SetInteractionsMixin, SnapshotMixin
+from recommender.nodes import CompactNormalizedItem, CompactNormalizedUser, IdTable
 
-class User(object):
+
+class User(NormMixin):
     """ Data class that represents one user in the recommender network.
     """
+    profile_name = 'user_profile'
+
     def __init__(self, user_id):
         self.user_id = user_id  # String identifier of the user.
         self.user_profile = defaultdict(float)  # A dict with users interests (interactions), { item_id => interaction weight}
         self.norm = 0.0  # User's norm will be stored here.
+        self.squared_norm = 0.0  # A sum of the (transformed) weights under the square root of the norm.
 
-    def update_norm(self):
-        """ Calculate the user's norm.
-        """
-        self.norm = sqrt(sum([item_weight ** item_weight for item_weight in self.user_profile.values()]))
 
+class Item(NormMixin):
+    profile_name = 'item_profile'
 
-class Item(object):
     def __init__(self, item_id):
         self.item_id = item_id  # Item identifier.
         self.item_profile = defaultdict(float)  # A dict {user_id => interaction weight}
         self.norm = 0.0  # Item's norm will be stored here.
-
-    def update_norm(self):
-        """ Calculate the item's norm.
-        """
-        self.norm = sqrt(sum([user_weight ** user_weight for user_weight in self.item_profile.values()]))
+        self.squared_norm = 0.0  # A sum of the (transformed) weights under the square root of the norm.
 
 
-class Recommender(object):
+@instrumentation.probed
+class Recommender(InteractionsMixin, PathsMixin, SetInteractionsMixin, SnapshotMixin):
     """
     A Baseline Recommender with excluded items already visited by the user and with the normalized path scores.
     It allows to add a new interaction into the network.
     Recommendations candidates are obtained as all items on the path of the length 3 from the user.
 
     """
-    def __init__(self):
-        self.users = dict()  # {user_id => User()}
-        self.items = dict()  # {item_id => Item()}
+    scoring_options = {'exclude_history': True, 'normalize': True}  # How the vectorized scoring reproduces the recommend method.
+
+    def __init__(self, sparse=False, vectorized=False, online=False, max_neighbours=None, sampling='top', max_edges=None, compact=False):
+        super().__init__(sparse, vectorized, max_neighbours, sampling, max_edges, compact=compact)
+        self.online = online  # Update norms with each interaction, so update_norm need not be called.
+        self.user_id_table = IdTable() if compact else None  # Users interned by the compact nodes.
+        self.item_id_table = IdTable() if compact else None  # Items interned by the compact nodes.
 
+    @instrumentation.probe('put_interaction')
     def put_interaction(self, user_id, item_id, weight):
         """ Add a new edge in the network.
         """
+        if self.graph is not None:
+            self.graph.put_interaction(user_id, item_id, weight)
+            if self.neighbour_lists is not None:
+                self.neighbour_lists.invalidate(self.graph.item_id2offset[item_id])
+            return
+
         # Obtain the user if already exists.
         if user_id in self.users:
             user = self.users[user_id]
         # ...or create a new one.
         else:
-            user = self.users[user_id] = User(user_id)
+            if self.compact:
+                user = self.users[user_id] = CompactNormalizedUser(user_id, self.item_id_table)
+            else:
+                user = self.users[user_id] = User(user_id)
 
         # Obtain the item if already exists.
         if item_id in self.items:
             item = self.items[item_id]
         # ...or create a new one.
         else:
-            item = self.items[item_id] = Item(item_id)
+            if self.compact:
+                item = self.items[item_id] = CompactNormalizedItem(item_id, self.user_id_table)
+            else:
+                item = self.items[item_id] = Item(item_id)
 
         # Insert a new interest into the user/item profile.
         # If there is the same interests, use the higher weight.
         # Here you can try different methods how to deal with repeating interactions (e.g. sum them)
+        old_user_weight = user.user_profile.get(item_id)
+        old_item_weight = item.item_profile.get(user_id)
         user.user_profile[item_id] = max(weight, user.user_profile[item_id])
         item.item_profile[user_id] = max(weight, item.item_profile[user_id])
+        if self.neighbour_lists is not None:
+            self.neighbour_lists.put(item_id, user_id, old_item_weight, item.item_profile[user_id], len(item.item_profile) - 1)
+
+        # In the online mode, norms are kept up to date with each interaction.
+        if self.online:
+            user.update_norm_online(old_user_weight, user.user_profile[item_id])
+            item.update_norm_online(old_item_weight, item.item_profile[user_id])
 
-    def recommend(self, user_id):
-        """ Find all items on the path of the length 3 from the given user.
+    def after_set_interaction(self, user, item, old_weight, weight):
+        """ Drop the neighbour list of the item and update the norms by the changed edge.
         """
-        if user_id not in self.users:
-            return []
+        super().after_set_interaction(user, item, old_weight, weight)
+        if self.online:
+            user.update_norm_online(old_weight, weight if weight > 0 else None)
+            item.update_norm_online(old_weight, weight if weight > 0 else None)
 
+    def get_item_scores(self, user_id):
+        """ Score all items on the path of the length 3 from the given user (in the dict network), return {item_id => score}.
+        """
         scores = defaultdict(float)  # {item_id => relevance for the user}
-        for interest_id, interest_relevance in self.users[user_id].user_profile.items():
+        if user_id not in self.users:
+            return scores
+
+        n_edges = 0  # The traversed edges, recorded by the instrumentation.
+        user_profile = self.users[user_id].user_profile
+        for interest_id, interest_relevance in user_profile.items():
+            n_edges += len(self.items[interest_id].item_profile)
             for neighbour_id in self.items[interest_id].item_profile:
+                n_edges += len(self.users[neighbour_id].user_profile)
                 for candidate_id, candidate_relevance in self.users[neighbour_id].user_profile.items():
                     # Do not recommend items such that user interacted with them already.
-                    if candidate_id in self.users[user_id].user_profile:
+                    if candidate_id in user_profile:
                         continue
 
                     # Normalize the scores on the path using the user's norm.
@@ -83,5 +121,6 @@ class Recommender(object):
                                             self.users[neighbour_id].user_profile[interest_id] / self.users[neighbour_id].norm * \
                                             candidate_relevance
 
-        # Return top 10 items with the best score.
-        return sorted(scores.keys(), key=lambda item_id: scores[item_id], reverse=True)[:10]
+        if instrumentation.active is not None:
+            instrumentation.active.record('recommend.edges', n_edges)
+        return scores
@@ -0,0 +1,33 @@
+"""A bounded cache of the paths from items, shared by the users of one block of recommend_many."""
+
+from collections import OrderedDict
+
+
+class ItemPathsCache(object):
+    """
+    The summed paths (item, neighbour, neighbour's item) of items, obtained by get_item_paths(item_id).
+    Each cached item holds a dict of all items reachable from it (up to the whole catalogue), so the cache is bounded
+    by max_entries of these dicts' entries in total and the least recently used items are evicted. An item with more
+    paths than max_entries is still kept until the next one is cached, so the memory stays O(max_entries + items).
+
+    """
+    def __init__(self, get_item_paths, max_entries=1000000):
+        self.get_item_paths = get_item_paths
+        self.max_entries = max_entries
+        self.paths = OrderedDict()  # {item_id => {item_id => path weight}}, the least recently used first.
+        self.n_entries = 0  # The number of entries of all cached dicts.
+
+    def get(self, item_id):
+        """ Return the paths from the item, they are calculated if they are not cached.
+        """
+        paths = self.paths.get(item_id)
+        if paths is not None:
+            self.paths.move_to_end(item_id)
+            return paths
+
+        paths = self.paths[item_id] = self.get_item_paths(item_id)
+        self.n_entries += len(paths)
+        while self.n_entries > self.max_entries and len(self.paths) > 1:
+            _, evicted_paths = self.paths.popitem(last=False)
+            self.n_entries -= len(evicted_paths)
+        return paths
@@ -0,0 +1,141 @@
+"""Vectorized scoring of the recommendation paths in the array-backed network."""
+
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+
+from recommender import instrumentation
+
+
+def get_user_item_matrix(graph):
+    """ Return the (users x items) sparse matrix R of the interaction weights.
+    """
+    graph.compact()
+    return csr_matrix((graph.user_weights, graph.user_indices, graph.user_indptr), shape=(graph.n_users, graph.n_items))
+
+
+def get_item_user_matrix(graph):
+    """ Return the (items x users) sparse matrix R^T of the interaction weights.
+    """
+    graph.compact()
+    return csr_matrix((graph.item_weights, graph.item_indices, graph.item_indptr), shape=(graph.n_items, graph.n_users))
+
+
+def get_neighbour_matrix(graph, user_offsets):
+    """ Return the (users x all users) sparse matrix of the user neighbour similarities.
+    """
+    user_offsets = np.asarray(user_offsets)
+    neighbour_offsets = np.full((len(user_offsets), graph.neighbour_offsets.shape[1]), -1, dtype=np.int32)
+    neighbour_similarities = np.zeros(neighbour_offsets.shape, dtype=np.float64)
+
+    # Users added after the last neighbours detection have no neighbours.
+    detected = user_offsets < len(graph.neighbour_offsets)
+    neighbour_offsets[detected] = graph.neighbour_offsets[user_offsets[detected]]
+    neighbour_similarities[detected] = graph.neighbour_similarities[user_offsets[detected]]
+
+    mask = neighbour_offsets >= 0
+    indptr = np.concatenate([[0], np.cumsum(mask.sum(axis=1))])
+    return csr_matrix((neighbour_similarities[mask], neighbour_offsets[mask], indptr), shape=(len(user_offsets), graph.n_users))
+
+
+def score_paths(graph, user_offsets, normalize=False):
+    """
+    Score all items on the paths of the length 3 from the given users, i.e. compute R^T (R r_u) for each user u.
+    With normalize, each path is divided by the norms of the user and of the neighbour on the path.
+    Return a sparse (users x items) matrix, stored entries are exactly the items reachable by some path.
+    """
+    user_item_matrix = get_user_item_matrix(graph)
+    neighbour_weights = user_item_matrix[user_offsets] @ get_item_user_matrix(graph)  # (users x neighbours)
+
+    if normalize:
+        neighbour_weights = diags(1 / graph.user_norms[user_offsets]) @ neighbour_weights @ diags(1 / graph.user_norms)
+
+    return (neighbour_weights @ user_item_matrix).tocsr()
+
+
+def score_neighbours(graph, user_offsets):
+    """ Score all items of the user neighbours weighted by the neighbour similarity.
+    """
+    return (get_neighbour_matrix(graph, user_offsets) @ get_user_item_matrix(graph)).tocsr()
+
+
+def score_users(graph, user_offsets, normalize=False, neighbours=False):
+    """ Score the items for the given users either by the paths of the length 3 or by the user neighbours.
+    """
+    if neighbours:
+        return score_neighbours(graph, user_offsets)
+    return score_paths(graph, user_offsets, normalize=normalize)
+
+
+def top_items(item_offsets, scores, k=10, excluded=None):
+    """
+    Select k items with the highest score.
+    Unlike a full sort, only the k-th highest score is found (by a partition) and just the items above it are sorted.
+    Items with the same score are ordered by their offsets.
+    """
+    if excluded is not None and len(excluded):
+        kept = ~np.isin(item_offsets, excluded)
+        item_offsets, scores = item_offsets[kept], scores[kept]
+
+    if len(scores) > k:
+        kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        best = scores >= kth_score
+        item_offsets, scores = item_offsets[best], scores[best]
+
+    return item_offsets[np.lexsort((item_offsets, -scores))[:k]]
+
+
+def recommend_offsets(graph, user_offsets, k=10, exclude_history=False, normalize=False, neighbours=False):
+    """ Recommend top k item offsets for each of the given user offsets.
+    """
+    scores = score_users(graph, user_offsets, normalize=normalize, neighbours=neighbours)
+
+    recommendations = []
+    for n_user, user_offset in enumerate(user_offsets):
+        start, end = scores.indptr[n_user], scores.indptr[n_user + 1]
+        excluded = graph.user_items(user_offset)[0] if exclude_history else None
+        recommendations.append(top_items(scores.indices[start:end], scores.data[start:end], k=k, excluded=excluded))
+
+    return recommendations
+
+
+def recommend_many(graph, user_ids, k=10, block_size=1000, seconds=None, **options):
+    """
+    Recommend top k item ids for each of the given user ids.
+    Users are scored together in blocks of block_size users (by a sparse matrix-matrix product), so the memory
+    used by the score matrix is bounded by the block size. With seconds (a list), the time of each user is appended
+    to it, the time of a block is split evenly among its users (unknown users take no time).
+    """
+    graph.compact()
+    recommendations = [[] for _ in user_ids]
+    user_seconds = [0.0] * len(user_ids)
+    known_users = [(n_user, graph.user_id2offset[user_id]) for n_user, user_id in enumerate(user_ids) if user_id in graph.user_id2offset]
+
+    for block_start in range(0, len(known_users), block_size):
+        start = time.perf_counter()
+        block = known_users[block_start:block_start + block_size]
+        block_recommendations = recommend_offsets(graph, [user_offset for _, user_offset in block], k=k, **options)
+        if instrumentation.active is not None:
+            instrumentation.active.record('recommend_many.edges', graph.count_paths([user_offset for _, user_offset in block], options.get('neighbours', False))['edges'])
+        for (n_user, _), item_offsets in zip(block, block_recommendations):
+            recommendations[n_user] = [graph.item_offset2id[item] for item in item_offsets]
+        block_seconds = (time.perf_counter() - start) / len(block)
+        for n_user, _ in block:
+            user_seconds[n_user] = block_seconds
+
+    if seconds is not None:
+        seconds.extend(user_seconds)
+    return recommendations
+
+
+def recommend_each(recommend, user_ids, k=10, seconds=None):
+    """ Recommend top k items for each user by recommend(user_id, k=k), with seconds (a list) the time of each user is appended to it.
+    """
+    recommendations = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        recommendations.append(recommend(user_id, k=k))
+        if seconds is not None:
+            seconds.append(time.perf_counter() - start)
+    return recommendations
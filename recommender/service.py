@@ -0,0 +1,337 @@
+"""
+An asyncio recommendation service with micro-batching of the requests.
+
+The protocol is JSON-lines over TCP, each request is one JSON object on a line and each response too:
+
+    {"id": 1, "method": "recommend", "user_id": "u1", "k": 10}  ->  {"id": 1, "items": ["i5", "i7", ...]}
+    {"id": 2, "method": "put_interaction", "user_id": "u1", "item_id": "i3", "weight": 1.0}  ->  {"id": 2, "ok": true}
+    {"id": 3, "method": "set_interaction", "user_id": "u1", "item_id": "i3", "weight": 0.0}  ->  {"id": 3, "ok": true}
+    {"id": 4, "method": "stats"}  ->  {"id": 4, "stats": {...}}
+
+set_interaction sets the weight of an edge by the recommender's set_interactions, i.e. it lowers or (with zero) removes it.
+
+Responses of one connection may come in a different order than the requests, they are matched by the id.
+Run it as `python -m recommender.service --snapshot model --recommender normalized_recommender --port 8765`.
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class ReadWriteLock(object):
+    """
+    An asyncio lock allowing either many readers or one writer.
+    Waiting writers block new readers, so a stream of reads does not starve the writes.
+
+    """
+    def __init__(self):
+        self.condition = asyncio.Condition()
+        self.n_readers = 0
+        self.n_waiting_writers = 0
+        self.writing = False
+
+    async def acquire_read(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.writing and not self.n_waiting_writers)
+            self.n_readers += 1
+
+    async def release_read(self):
+        async with self.condition:
+            self.n_readers -= 1
+            self.condition.notify_all()
+
+    async def acquire_write(self):
+        async with self.condition:
+            self.n_waiting_writers += 1
+            await self.condition.wait_for(lambda: not self.writing and not self.n_readers)
+            self.n_waiting_writers -= 1
+            self.writing = True
+
+    async def release_write(self):
+        async with self.condition:
+            self.writing = False
+            self.condition.notify_all()
+
+
+class RecommendationService(object):
+    """
+    Serve recommendations of a recommender without blocking the event loop.
+    Concurrent recommend requests are collected for up to batch_window seconds (or max_batch_size requests) and
+    recommended by one recommend_many call on a pool of n_workers threads. Interactions are queued and applied in
+    batches too, a batch of writes excludes all reads (see ReadWriteLock) and the array-backed network is compacted
+    within the write, so the reads never modify the recommender.
+    With n_workers > 1, batches are recommended concurrently, so the recommender must not modify itself when
+    recommending (e.g. the CachedRecommender does).
+
+    """
+    def __init__(self, recommender, batch_window=0.002, max_batch_size=256, n_workers=1, n_latencies=10000):
+        self.recommender = recommender
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.n_workers = n_workers
+
+        self.executor = ThreadPoolExecutor(n_workers)
+        self.lock = None  # ReadWriteLock, created in the event loop by start.
+        self.read_queue = None  # asyncio.Queue of (user_id, k, future, arrival time).
+        self.write_queue = None  # asyncio.Queue of (method, user_id, item_id, weight, future, arrival time).
+        self.workers = None  # asyncio.Semaphore limiting the batches in progress to n_workers.
+        self.tasks = []
+
+        # Metrics.
+        methods = ('recommend', 'put_interaction', 'set_interaction')
+        self.latencies = {method: deque(maxlen=n_latencies) for method in methods}  # Recent latencies in seconds.
+        self.n_requests = {method: 0 for method in methods}
+        self.n_batches = {method: 0 for method in methods}  # The write batches are counted by each method they contain.
+        self.max_queue_depth = {method: 0 for method in methods}
+
+    def start(self):
+        """ Start the batching tasks, it must be called in the running event loop.
+        """
+        graph = getattr(self.recommender, 'graph', None)
+        if graph is not None:
+            graph.compact()
+
+        self.lock = ReadWriteLock()
+        self.read_queue = asyncio.Queue()
+        self.write_queue = asyncio.Queue()
+        self.workers = asyncio.Semaphore(self.n_workers)
+        self.tasks = [asyncio.ensure_future(self.read_batches()), asyncio.ensure_future(self.write_batches())]
+
+    async def stop(self):
+        """ Stop the batching tasks and the worker threads.
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.executor.shutdown()
+
+    async def collect_batch(self, queue):
+        """ Wait for a request and collect the following ones arriving within the batch window.
+        """
+        batch = [await queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        while len(batch) < self.max_batch_size and not queue.empty():
+            batch.append(queue.get_nowait())
+        return batch
+
+    async def read_batches(self):
+        """ Recommend the queued users in batches, at most n_workers batches at once.
+        """
+        while True:
+            batch = await self.collect_batch(self.read_queue)
+            await self.workers.acquire()
+            asyncio.ensure_future(self.recommend_batch(batch))
+
+    async def recommend_batch(self, batch):
+        """ Recommend one batch of users, users with the same k are recommended by one recommend_many call.
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            await self.lock.acquire_read()
+            try:
+                for k in set(request[1] for request in batch):
+                    requests = [request for request in batch if request[1] == k]
+                    try:
+                        recommendations = await loop.run_in_executor(self.executor, self.recommender.recommend_many, [request[0] for request in requests], k)
+                    except Exception as error:
+                        for _, _, future, _ in requests:
+                            if not future.done():
+                                future.set_exception(error)
+                        continue
+
+                    for (_, _, future, arrival), recommended_items in zip(requests, recommendations):
+                        if not future.done():  # The request could be cancelled (e.g. the client disconnected).
+                            future.set_result(recommended_items)
+                        self.latencies['recommend'].append(time.monotonic() - arrival)
+            finally:
+                await self.lock.release_read()
+        finally:
+            self.n_batches['recommend'] += 1
+            self.workers.release()
+
+    def put_interactions(self, interactions):
+        """
+        Apply a batch of interactions (method, user_id, item_id, weight) in order and compact the array-backed network
+        (in a worker thread). The consecutive set_interaction requests are applied by one set_interactions call.
+        """
+        to_set = []
+        for method, user_id, item_id, weight in interactions:
+            if method == 'set_interaction':
+                to_set.append({'user_id': user_id, 'item_id': item_id, 'weight': weight})
+                continue
+            if to_set:
+                self.recommender.set_interactions(to_set)
+                to_set = []
+            self.recommender.put_interaction(user_id, item_id, weight)
+        if to_set:
+            self.recommender.set_interactions(to_set)
+
+        graph = getattr(self.recommender, 'graph', None)
+        if graph is not None:
+            graph.compact()
+
+    async def write_batches(self):
+        """ Apply the queued interactions in batches, each batch excludes the reads.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self.collect_batch(self.write_queue)
+            await self.lock.acquire_write()
+            try:
+                await loop.run_in_executor(self.executor, self.put_interactions, [request[:4] for request in batch])
+            except Exception as error:
+                for _, _, _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+            else:
+                for method, _, _, _, future, arrival in batch:
+                    if not future.done():
+                        future.set_result(True)
+                    self.latencies[method].append(time.monotonic() - arrival)
+            finally:
+                await self.lock.release_write()
+                for method in set(request[0] for request in batch):
+                    self.n_batches[method] += 1
+
+    async def recommend(self, user_id, k=10):
+        """ Return top k items for the user, the request is recommended within a batch.
+        """
+        future = asyncio.get_event_loop().create_future()
+        self.read_queue.put_nowait((user_id, k, future, time.monotonic()))
+        self.n_requests['recommend'] += 1
+        self.max_queue_depth['recommend'] = max(self.max_queue_depth['recommend'], self.read_queue.qsize())
+        return await future
+
+    async def write(self, method, user_id, item_id, weight):
+        """ Queue a write request (put_interaction or set_interaction), it is applied within a batch.
+        """
+        future = asyncio.get_event_loop().create_future()
+        self.write_queue.put_nowait((method, user_id, item_id, weight, future, time.monotonic()))
+        self.n_requests[method] += 1
+        self.max_queue_depth[method] = max(self.max_queue_depth[method], self.write_queue.qsize())
+        return await future
+
+    async def put_interaction(self, user_id, item_id, weight=1.0):
+        """ Add a new edge in the network, the request is applied within a batch.
+        """
+        return await self.write('put_interaction', user_id, item_id, weight)
+
+    async def set_interaction(self, user_id, item_id, weight):
+        """ Set the weight of an edge, a zero weight removes it (see set_interactions of the recommenders).
+        """
+        return await self.write('set_interaction', user_id, item_id, weight)
+
+    def get_stats(self):
+        """ Return the queue depths, the numbers of requests and batches and the latency percentiles (in ms).
+        """
+        stats = {}
+        for method, queue in [('recommend', self.read_queue), ('put_interaction', self.write_queue), ('set_interaction', self.write_queue)]:
+            latencies = np.array(self.latencies[method]) * 1000
+            stats[method] = {
+                'queue_depth': queue.qsize() if queue is not None else 0,
+                'max_queue_depth': self.max_queue_depth[method],
+                'requests': self.n_requests[method],
+                'batches': self.n_batches[method],
+                'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            }
+        return stats
+
+    async def handle_request(self, request):
+        """ Process one request of the protocol, return the response.
+        """
+        method = request.get('method')
+        if method == 'recommend':
+            return {'items': await self.recommend(request['user_id'], request.get('k', 10))}
+        if method == 'put_interaction':
+            return {'ok': await self.put_interaction(request['user_id'], request['item_id'], request.get('weight', 1.0))}
+        if method == 'set_interaction':
+            return {'ok': await self.set_interaction(request['user_id'], request['item_id'], request['weight'])}
+        if method == 'stats':
+            return {'stats': self.get_stats()}
+        raise ValueError('Unknown method {}'.format(method))
+
+    async def respond(self, line, writer):
+        """ Process one line of a connection and write the response.
+        """
+        response = {}
+        try:
+            request = json.loads(line)
+            response['id'] = request.get('id')
+            response.update(await self.handle_request(request))
+        except Exception as error:
+            response['error'] = '{}: {}'.format(type(error).__name__, error)
+
+        writer.write(json.dumps(response).encode('utf-8') + b'\n')
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        """ Read the requests of a connection, they are processed concurrently, so they can share batches.
+        """
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(self.respond(line, writer))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+
+            if pending:
+                await asyncio.wait(pending)
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        """ Start the batching tasks and the TCP server, return the server.
+        """
+        self.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logging.info('Serving recommendations on %s:%d', host, port)
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--snapshot', required=True, help='A snapshot directory of a trained recommender (see Recommender.save).')
+    parser.add_argument('--recommender', default='normalized_recommender', help='A module with the Recommender class.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--batch-window', type=float, default=0.002, help='Seconds to wait for more requests of a batch.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of the worker threads.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s')
+    recommender = importlib.import_module('recommender.' + args.recommender).Recommender.load(args.snapshot)
+    service = RecommendationService(recommender, batch_window=args.batch_window, n_workers=args.workers)
+
+    async def run():
+        server = await service.serve(args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""A recommender with the network partitioned by items across worker processes, scored by scatter-gather."""
+
+import time
+import zlib
+
+from collections import defaultdict
+from math import sqrt
+from multiprocessing import get_context
+
+from recommender.baseline_recommender import Recommender
+
+
+class Shard(object):
+    """
+    One shard of the network: profiles of its items and the users' rows restricted to these items.
+    The shard's network is stored by a baseline recommender (its dict nodes), so interactions are merged the same way.
+
+    """
+    def __init__(self):
+        self.network = Recommender()
+
+    def put_interactions(self, interactions):
+        """
+        Add interactions (user_id, item_id, weight) of the shard's items.
+        Return the changes of the users' squared norms {user_id => change}, the norm is sqrt(sum(w ** w)) over the profile.
+        """
+        users = self.network.users
+        changes = defaultdict(float)
+        for user_id, item_id, weight in interactions:
+            old_weight = users[user_id].user_profile.get(item_id) if user_id in users else None
+            self.network.put_interaction(user_id, item_id, weight)
+            new_weight = users[user_id].user_profile[item_id]
+            changes[user_id] += new_weight ** new_weight - (old_weight ** old_weight if old_weight is not None else 0.0)
+        return dict(changes)
+
+    def get_neighbour_weights(self, user_ids):
+        """ Sum the paths (user, item, neighbour) through the shard's items, return {neighbour_id => weight} for each user.
+        """
+        users, items = self.network.users, self.network.items
+        users_weights = []
+        for user_id in user_ids:
+            neighbour_weights = defaultdict(float)
+            if user_id in users:
+                for item_id, item_weight in users[user_id].user_profile.items():
+                    for neighbour_id, neighbour_weight in items[item_id].item_profile.items():
+                        neighbour_weights[neighbour_id] += item_weight * neighbour_weight
+            users_weights.append(dict(neighbour_weights))
+        return users_weights
+
+    def score_items(self, user_ids, users_weights, k=10, exclude_history=False):
+        """
+        Score the shard's items by the neighbour weights, return the top k (all with k=None) pairs (item_id, score) for each user.
+        Each item belongs to exactly one shard, so the scores are complete.
+        """
+        users = self.network.users
+        recommendations = []
+        for user_id, neighbour_weights in zip(user_ids, users_weights):
+            excluded = users[user_id].user_profile if exclude_history and user_id in users else ()
+            scores = defaultdict(float)
+            for neighbour_id, neighbour_weight in neighbour_weights.items():
+                if neighbour_id not in users:
+                    continue
+
+                for item_id, item_weight in users[neighbour_id].user_profile.items():
+                    if item_id in excluded:
+                        continue
+
+                    scores[item_id] += neighbour_weight * item_weight
+
+            recommendations.append(sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k])
+        return recommendations
+
+
+def _run_shard(connection):
+    """ Serve requests (method name, arguments) of the coordinator until None is received (the shard process).
+    """
+    shard = Shard()
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+
+        method, args = message
+        try:
+            connection.send((True, getattr(shard, method)(*args)))
+        except Exception as error:
+            connection.send((False, error))
+    connection.close()
+
+
+class ShardedRecommender(object):
+    """
+    The path-based recommender (the baseline, with exclude_history the excluded history, with normalize also the normalized one)
+    with items partitioned across n_shards processes by a hash of the item id.
+    The coordinator keeps only the users' squared norms. A recommendation is scored in two scatter-gather phases:
+    1. each shard sums the paths (user, item, neighbour) through its items, the partial neighbour weights are summed,
+    2. the neighbour weights are sent to all shards, each shard scores its items and returns its top k, they are merged.
+    The scores are the same as of the single-process recommend (up to the rounding), so only tied items may be ordered differently.
+
+    """
+    def __init__(self, n_shards=2, exclude_history=False, normalize=False):
+        self.n_shards = n_shards
+        self.exclude_history = exclude_history
+        self.normalize = normalize
+        self.squared_norms = defaultdict(float)  # {user_id => squared norm of the whole user profile}
+
+        context = get_context('fork')
+        self.connections = []
+        self.processes = []
+        for _ in range(n_shards):
+            connection, shard_connection = context.Pipe()
+            process = context.Process(target=_run_shard, args=(shard_connection,), daemon=True)
+            process.start()
+            shard_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def close(self):
+        """ Stop the shard processes.
+        """
+        for connection, process in zip(self.connections, self.processes):
+            connection.send(None)
+            process.join()
+            connection.close()
+        self.connections, self.processes = [], []
+
+    def get_shard(self, item_id):
+        """ Return the index of the item's shard (a hash stable across processes and runs).
+        """
+        return zlib.crc32(str(item_id).encode('utf-8')) % self.n_shards
+
+    def scatter(self, shards_args, method):
+        """ Call the method in all shards with their arguments at once, return their results.
+        """
+        for connection, args in zip(self.connections, shards_args):
+            connection.send((method, args))
+
+        results = []
+        for connection in self.connections:
+            success, result = connection.recv()
+            if not success:
+                raise result
+            results.append(result)
+        return results
+
+    def put_interaction(self, user_id, item_id, weight):
+        """ Add a new edge in the network.
+        """
+        self.put_interactions([{'user_id': user_id, 'item_id': item_id, 'weight': weight}])
+
+    def put_interactions(self, interactions, weight=1.0, chunk_size=10000):
+        """ Add all interactions (dicts with user_id and item_id) from an iterable, return their number.
+        """
+        n_interactions = 0
+        shards_interactions = [[] for _ in range(self.n_shards)]
+
+        def flush():
+            for changes in self.scatter([(shard_interactions,) for shard_interactions in shards_interactions], 'put_interactions'):
+                for user_id, change in changes.items():
+                    self.squared_norms[user_id] += change
+            for shard_interactions in shards_interactions:
+                shard_interactions.clear()
+
+        for interaction in interactions:
+            item_id = interaction['item_id']
+            shards_interactions[self.get_shard(item_id)].append((interaction['user_id'], item_id, interaction.get('weight', weight)))
+            n_interactions += 1
+            if n_interactions % chunk_size == 0:
+                flush()
+
+        flush()
+        return n_interactions
+
+    def get_scores(self, user_ids, k=10):
+        """ Return the top k (all with k=None) pairs (item_id, score) for each of the given users.
+        """
+        # Phase 1: the neighbour weights are summed from the partial weights of the shards.
+        users_weights = [defaultdict(float) for _ in user_ids]
+        for shard_weights in self.scatter([(user_ids,)] * self.n_shards, 'get_neighbour_weights'):
+            for neighbour_weights, partial_weights in zip(users_weights, shard_weights):
+                for neighbour_id, weight in partial_weights.items():
+                    neighbour_weights[neighbour_id] += weight
+
+        if self.normalize:
+            for user_id, neighbour_weights in zip(user_ids, users_weights):
+                for neighbour_id in neighbour_weights:
+                    neighbour_weights[neighbour_id] /= sqrt(self.squared_norms[user_id]) * sqrt(self.squared_norms[neighbour_id])
+
+        # Phase 2: each shard returns top k of its items, the item scores are complete, so the merge is exact.
+        users_weights = [dict(neighbour_weights) for neighbour_weights in users_weights]
+        shards_recommendations = self.scatter([(user_ids, users_weights, k, self.exclude_history)] * self.n_shards, 'score_items')
+        return [sorted([item for shard_items in user_items for item in shard_items], key=lambda item: item[1], reverse=True)[:k]
+                for user_items in zip(*shards_recommendations)]
+
+    def recommend(self, user_id):
+        """ Find top 10 items on the paths of the length 3 from the given user.
+        """
+        return self.recommend_many([user_id])[0]
+
+    def recommend_many(self, user_ids, k=10, block_size=1000, seconds=None):
+        """
+        Recommend top k items for each of the given users, a block of block_size users is scattered at once.
+        With seconds (a list), the time of each user is appended to it, the time of a block is split evenly among its users.
+        """
+        recommendations = []
+        for block_start in range(0, len(user_ids), block_size):
+            start = time.perf_counter()
+            block_scores = self.get_scores(user_ids[block_start:block_start + block_size], k=k)
+            recommendations.extend([[item_id for item_id, _ in user_scores] for user_scores in block_scores])
+            if seconds is not None:
+                seconds.extend([(time.perf_counter() - start) / len(block_scores)] * len(block_scores))
+        return recommendations
@@ -0,0 +1,100 @@
+"""
+Similarity measures of the user profiles, one user is compared with all its neighbour candidates at once.
+
+The similarity of users a and b is a sum of products over their common items divided by a denominator:
+    cosine: w(a, i) * w(b, i) / (norm(a) * norm(b)), where the norm is the one of the recommender (User.norm),
+    jaccard: 1 / (|a| + |b| - |a and b|), i.e. the ratio of the common items, the weights are ignored,
+    adjusted_cosine: (w(a, i) - mean(a)) * (w(b, i) - mean(b)) / (centered norm(a) * centered norm(b)), i.e. the cosine
+        of the profiles centered by their mean weights (the Pearson correlation with zeros out of the profiles' items).
+The profiles are only read, pairs with a zero denominator have the zero similarity.
+"""
+
+from math import sqrt
+
+import numpy as np
+
+MEASURES = ('cosine', 'jaccard', 'adjusted_cosine')
+
+
+def check_measure(measure):
+    """ Raise ValueError for an unknown similarity measure.
+    """
+    if measure not in MEASURES:
+        raise ValueError('Unknown similarity {}, use one of {}'.format(measure, ', '.join(MEASURES)))
+
+
+def get_product(measure, weights_a, weights_b, mean_a=0.0, means_b=0.0):
+    """ Return the products of the common items' weights summed by the measure (floats or arrays).
+    """
+    if measure == 'cosine':
+        return weights_a * weights_b
+    if measure == 'jaccard':
+        return np.ones_like(weights_b) if isinstance(weights_b, np.ndarray) else 1.0
+    return (weights_a - mean_a) * (weights_b - means_b)
+
+
+def get_centered_norm(weights, mean):
+    """ Return the euclidean norm of the weights centered by their mean.
+    """
+    return sqrt(sum([(weight - mean) ** 2 for weight in weights]))
+
+
+def finish_similarities(measure, products, stats_a, stats_b):
+    """
+    Divide the summed products by the denominators of the measure, vectorized over the candidates b.
+    The stats are (norm, size, centered norm) of the user a and the same arrays of the candidates b.
+    """
+    if measure == 'cosine':
+        denominators = stats_a[0] * stats_b[0]
+    elif measure == 'jaccard':
+        denominators = stats_a[1] + stats_b[1] - products
+    else:
+        denominators = stats_a[2] * stats_b[2]
+    return np.divide(products, denominators, out=np.zeros(len(products)), where=denominators > 0)
+
+
+def get_common_weights(user_items, user_positions, profile_b):
+    """
+    Return the pairs of weights (a, b) of the items common to the user and the profile b, in the order of the user's
+    items. The smaller of the profiles is iterated and the items are looked up in the other one.
+    """
+    if len(profile_b) < len(user_items):
+        common = sorted((user_positions[item_id], weight_b) for item_id, weight_b in profile_b.items() if item_id in user_positions)
+        return [(user_items[position][1], weight_b) for position, weight_b in common]
+
+    # Missing items are read by get, so the defaultdict profiles are not modified.
+    common = [(weight_a, profile_b.get(item_id)) for item_id, weight_a in user_items]
+    return [(weight_a, weight_b) for weight_a, weight_b in common if weight_b is not None]
+
+
+def get_similarities(user_id, candidate_ids, users, measure='cosine'):
+    """
+    Calculate the similarities of the user with all the candidates (a dict of the User nodes), return an array
+    aligned with candidate_ids. Each candidate is joined with the user by the smaller of their profiles, so a pair
+    costs min(|a|, |b|) lookups and the users of popular items which are not candidates are never visited.
+    The products are summed in the order of the user's profile, as by recommender.neighbours.detect_neighbours.
+    """
+    check_measure(measure)
+    user_profile = users[user_id].user_profile
+    user_items = list(user_profile.items())
+    user_positions = {item_id: position for position, (item_id, _) in enumerate(user_items)}
+    candidate_profiles = [users[candidate_id].user_profile for candidate_id in candidate_ids]
+
+    mean_a, means_b = 0.0, [0.0] * len(candidate_ids)
+    centered_norm_a, centered_norms_b = 0.0, [0.0] * len(candidate_ids)
+    if measure == 'adjusted_cosine':
+        mean_a = sum(user_profile.values()) / len(user_profile) if user_profile else 0.0
+        centered_norm_a = get_centered_norm(user_profile.values(), mean_a)
+        means_b = [sum(profile.values()) / len(profile) if profile else 0.0 for profile in candidate_profiles]
+        centered_norms_b = [get_centered_norm(profile.values(), mean) for profile, mean in zip(candidate_profiles, means_b)]
+
+    products = [0.0] * len(candidate_ids)
+    for position, (profile_b, mean_b) in enumerate(zip(candidate_profiles, means_b)):
+        for weight_a, weight_b in get_common_weights(user_items, user_positions, profile_b):
+            products[position] += get_product(measure, weight_a, weight_b, mean_a, mean_b)
+
+    stats_a = (users[user_id].norm, len(user_profile), centered_norm_a)
+    stats_b = (np.array([users[candidate_id].norm for candidate_id in candidate_ids], dtype=np.float64),
+               np.array([len(profile) for profile in candidate_profiles], dtype=np.float64),
+               np.array(centered_norms_b, dtype=np.float64))
+    return finish_similarities(measure, np.array(products, dtype=np.float64), stats_a, stats_b)
@@ -0,0 +1,561 @@
+"""An array-backed (CSR/CSC) storage of the user-item network."""
+
+import heapq
+import json
+import os
+
+from array import array
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1  # A version of the snapshot format written by SparseGraph.save.
+N_NEIGHBOURS = 50  # Columns of the neighbour table, the number of the neighbours detected for each user.
+
+# Arrays stored in a snapshot.
+SNAPSHOT_ARRAYS = ['user_indptr', 'user_indices', 'user_weights', 'user_sequence', 'item_indptr', 'item_indices', 'item_weights',
+                   'user_norms', 'item_norms', 'neighbour_offsets', 'neighbour_similarities']
+
+
+# Types of the ids stored in a snapshot: {name => (the type of the ids, dtype of their array)}.
+ID_TYPES = {'str': (str, str), 'int': (int, np.int64)}
+
+
+def get_id_type(ids):
+    """ Return the name of the type of all the ids (see ID_TYPES), raise ValueError for other or mixed types.
+    """
+    id_types = set(get_id_type_or_none(id) for id in ids) or {'str'}
+    if len(id_types) != 1 or None in id_types:
+        raise ValueError('Only str or int ids (all of the same type) can be saved in a snapshot')
+    return id_types.pop()
+
+
+def get_id_type_or_none(id):
+    """ Return the name of the type of one id (see ID_TYPES), or None.
+    """
+    if isinstance(id, str):
+        return 'str'
+    if isinstance(id, (int, np.integer)) and not isinstance(id, bool):
+        return 'int'
+    return None
+
+
+class SnapshotIds(object):
+    """ A list of ids loaded from a snapshot (a possibly memory-mapped array), new ids are appended to a list.
+    """
+    def __init__(self, ids, id_type='str'):
+        self.ids = ids
+        self.id_type = ID_TYPES[id_type][0]  # The stored ids are converted from numpy scalars.
+        self.new_ids = []
+
+    def __len__(self):
+        return len(self.ids) + len(self.new_ids)
+
+    def __getitem__(self, offset):
+        if isinstance(offset, slice):
+            return [self[n_offset] for n_offset in range(*offset.indices(len(self)))]
+        if offset < len(self.ids):
+            return self.id_type(self.ids[offset])
+        return self.new_ids[offset - len(self.ids)]
+
+    def __iter__(self):
+        for offset in range(len(self.ids)):
+            yield self.id_type(self.ids[offset])
+        yield from self.new_ids
+
+    def append(self, id):
+        self.new_ids.append(id)
+
+
+class SnapshotIdIndex(object):
+    """
+    A mapping {id => offset} of ids loaded from a snapshot. Ids are found by a binary search in the sorted ids,
+    so no dict has to be built when the snapshot is loaded. New ids are stored in a dict.
+
+    """
+    def __init__(self, sorted_ids, sorted_offsets, id_type='str'):
+        self.sorted_ids = sorted_ids
+        self.sorted_offsets = sorted_offsets  # Offsets of the sorted ids.
+        self.id_type = id_type  # Ids of another type are never found in the sorted ids.
+        self.new_ids = dict()  # {id => offset}
+
+    def __len__(self):
+        return len(self.sorted_ids) + len(self.new_ids)
+
+    def get(self, id, default=None):
+        if id in self.new_ids:
+            return self.new_ids[id]
+        if get_id_type_or_none(id) != self.id_type:
+            return default
+
+        position = np.searchsorted(self.sorted_ids, id)
+        if position < len(self.sorted_ids) and self.sorted_ids[position] == id:
+            return int(self.sorted_offsets[position])
+        return default
+
+    def __contains__(self, id):
+        return self.get(id) is not None
+
+    def __getitem__(self, id):
+        offset = self.get(id)
+        if offset is None:
+            raise KeyError(id)
+        return offset
+
+    def __setitem__(self, id, offset):
+        self.new_ids[id] = offset
+
+
+def gather_rows(indptr, indices, weights, rows):
+    """ Concatenate the given rows of a compressed sparse matrix, return (row positions, indices, weights or None).
+    """
+    starts = indptr[rows]
+    lengths = indptr[np.asarray(rows) + 1] - starts
+    flat = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths) + np.arange(lengths.sum())
+    return np.repeat(np.arange(len(rows)), lengths), indices[flat], None if weights is None else weights[flat]
+
+
+def get_profiles_sequence(user_indptr, user_indices, item_indptr, item_indices):
+    """
+    Return sequence numbers of the edges (in the CSR order) increasing along each user profile and along each item
+    profile, i.e. a topological order of the edges such as the order of their insertion into the dict profiles.
+    The compaction orders the profiles by the sequence, so both the user and the item profiles keep their order.
+    The edges are taken from the lowest CSR position, edges of (inconsistent) cyclic profiles are appended at the end.
+    """
+    n_edges = len(user_indices)
+    rows = np.repeat(np.arange(len(user_indptr) - 1), np.diff(user_indptr)).tolist()
+    cols = np.repeat(np.arange(len(item_indptr) - 1), np.diff(item_indptr)).tolist()
+    positions = {edge: position for position, edge in enumerate(zip(rows, user_indices.tolist()))}  # {(user, item) => CSR position}
+    item_positions = [positions[edge] for edge in zip(item_indices.tolist(), cols)]  # CSR positions in the CSC order.
+
+    # Each edge precedes the next edge of its user profile and the next edge of its item profile.
+    successors = [[] for _ in range(n_edges)]
+    n_predecessors = [0] * n_edges
+    for profile_rows, profile_positions in [(rows, range(n_edges)), (cols, item_positions)]:
+        for n_edge in range(len(profile_positions) - 1):
+            if profile_rows[n_edge] == profile_rows[n_edge + 1]:
+                successors[profile_positions[n_edge]].append(profile_positions[n_edge + 1])
+                n_predecessors[profile_positions[n_edge + 1]] += 1
+
+    heap = [position for position in range(n_edges) if not n_predecessors[position]]
+    order = []
+    while heap:
+        position = heapq.heappop(heap)
+        order.append(position)
+        for successor in successors[position]:
+            n_predecessors[successor] -= 1
+            if not n_predecessors[successor]:
+                heapq.heappush(heap, successor)
+
+    if len(order) < n_edges:
+        ordered = set(order)
+        order.extend(position for position in range(n_edges) if position not in ordered)
+
+    sequence = np.empty(n_edges, dtype=np.int64)
+    sequence[order] = np.arange(n_edges, dtype=np.int64)
+    return sequence
+
+
+class SparseGraph(object):
+    """
+    The user-item network stored as compressed sparse arrays.
+    String identifiers are interned to dense integer offsets (in order of their first appearance).
+    User profiles are kept in the CSR arrays (user => items), item profiles in the CSC arrays (item => users).
+    New interactions are collected in an append buffer, which is merged into the compressed arrays (compacted)
+    once it is full or before the network is read.
+
+    Edges inside each row (column) keep the order of their first insertion, so a traversal of the arrays visits
+    the network in the same order as a traversal of the dict based profiles.
+
+    """
+    def __init__(self, buffer_size=100000):
+        self.user_id2offset = {}  # {user_id => user offset}
+        self.user_offset2id = []  # [user_id]
+        self.item_id2offset = {}  # {item_id => item offset}
+        self.item_offset2id = []  # [item_id]
+
+        # Appended interactions waiting for the compaction.
+        self.buffer_size = buffer_size
+        self.buffer_users = array('q')
+        self.buffer_items = array('q')
+        self.buffer_weights = array('d')
+        self.n_inserted = 0  # A sequence number of the next inserted interaction.
+
+        # User profiles (CSR): items of the user u are user_indices[user_indptr[u]:user_indptr[u + 1]].
+        self.user_indptr = np.zeros(1, dtype=np.int64)
+        self.user_indices = np.zeros(0, dtype=np.int32)
+        self.user_weights = np.zeros(0, dtype=np.float64)
+        self.user_sequence = np.zeros(0, dtype=np.int64)  # When the edge was inserted for the first time.
+
+        # Item profiles (CSC): users of the item i are item_indices[item_indptr[i]:item_indptr[i + 1]].
+        self.item_indptr = np.zeros(1, dtype=np.int64)
+        self.item_indices = np.zeros(0, dtype=np.int32)
+        self.item_weights = np.zeros(0, dtype=np.float64)
+
+        # Users and items norms, updated by each compaction by the changed edges only.
+        self.user_norms = np.zeros(0, dtype=np.float64)
+        self.item_norms = np.zeros(0, dtype=np.float64)
+        self.user_squared_norms = np.zeros(0, dtype=np.float64)  # Sums of the (transformed) weights under the square root of the norms.
+        self.item_squared_norms = np.zeros(0, dtype=np.float64)
+
+        # User neighbours (one row per user, unused positions contain the offset -1).
+        self.neighbour_offsets = np.zeros((0, 0), dtype=np.int32)
+        self.neighbour_similarities = np.zeros((0, 0), dtype=np.float64)
+
+    @property
+    def n_users(self):
+        return len(self.user_offset2id)
+
+    @property
+    def n_items(self):
+        return len(self.item_offset2id)
+
+    def get_user_offset(self, user_id):
+        """ Obtain the user offset, a new one is assigned to an unknown user.
+        """
+        if user_id not in self.user_id2offset:
+            self.user_id2offset[user_id] = len(self.user_offset2id)
+            self.user_offset2id.append(user_id)
+        return self.user_id2offset[user_id]
+
+    def get_item_offset(self, item_id):
+        """ Obtain the item offset, a new one is assigned to an unknown item.
+        """
+        if item_id not in self.item_id2offset:
+            self.item_id2offset[item_id] = len(self.item_offset2id)
+            self.item_offset2id.append(item_id)
+        return self.item_id2offset[item_id]
+
+    def put_interaction(self, user_id, item_id, weight):
+        """ Add a new edge in the network.
+        """
+        self.buffer_users.append(self.get_user_offset(user_id))
+        self.buffer_items.append(self.get_item_offset(item_id))
+        self.buffer_weights.append(weight)
+
+        if len(self.buffer_weights) >= self.buffer_size:
+            self.compact()
+
+    def compact(self):
+        """
+        Merge the append buffer into the compressed arrays.
+        Repeating interactions are merged the same way as in the dict based profiles, i.e. the higher weight is used.
+        """
+        n_buffered = len(self.buffer_weights)
+        if not n_buffered:
+            return
+
+        n_users, n_items = self.n_users, self.n_items
+        n_compacted = self.n_inserted  # Edges with a lower sequence number are in the compressed arrays already.
+        user_counts = np.diff(self.user_indptr)
+
+        # All the edges: the already compacted ones followed by the buffered ones.
+        rows = np.concatenate([np.repeat(np.arange(len(user_counts), dtype=np.int64), user_counts),
+                               np.frombuffer(self.buffer_users, dtype=np.int64)])
+        cols = np.concatenate([self.user_indices.astype(np.int64),
+                               np.frombuffer(self.buffer_items, dtype=np.int64)])
+        weights = np.concatenate([self.user_weights, np.frombuffer(self.buffer_weights, dtype=np.float64)])
+        sequence = np.concatenate([self.user_sequence,
+                                   np.arange(self.n_inserted, self.n_inserted + n_buffered, dtype=np.int64)])
+        self.n_inserted += n_buffered
+
+        # Group the repeating edges, the first edge in each group is the first inserted one.
+        order = np.lexsort((sequence, cols, rows))
+        rows, cols, weights, sequence = rows[order], cols[order], weights[order], sequence[order]
+        group_starts = np.flatnonzero(np.concatenate([[True], (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])]))
+        # The dict based profiles start with the zero weight, so the merged weight is never negative.
+        merged_weights = np.maximum(np.maximum.reduceat(weights, group_starts), 0.0)
+        # The compacted edge of a group (if any) is its first one, groups with buffered edges changed.
+        compacted = sequence[group_starts] < n_compacted
+        changed = ~compacted | (np.diff(np.append(group_starts, len(rows))) > 1)
+        old_weights = np.where(compacted, weights[group_starts], np.nan)[changed]
+        rows, cols, sequence = rows[group_starts], cols[group_starts], sequence[group_starts]
+
+        # Rows (user profiles) ordered by the insertion.
+        order = np.lexsort((sequence, rows))
+        self.user_indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_users))]).astype(np.int64)
+        self.user_indices = cols[order].astype(np.int32)
+        self.user_weights = merged_weights[order]
+        self.user_sequence = sequence[order]
+
+        # Columns (item profiles) ordered by the insertion.
+        order = np.lexsort((sequence, cols))
+        self.item_indptr = np.concatenate([[0], np.cumsum(np.bincount(cols, minlength=n_items))]).astype(np.int64)
+        self.item_indices = rows[order].astype(np.int32)
+        self.item_weights = merged_weights[order]
+
+        self.update_norms_online(rows[changed], cols[changed], old_weights, merged_weights[changed])
+
+        self.buffer_users = array('q')
+        self.buffer_items = array('q')
+        self.buffer_weights = array('d')
+
+    def set_interactions(self, user_ids, item_ids, weights):
+        """
+        Set the weights of the edges, unlike put_interaction a lower weight replaces the higher one.
+        Edges with the zero (or a negative) weight are removed, their users and items keep the offsets.
+        If an edge is repeated, its last weight is used.
+        """
+        self.compact()
+
+        # Removals of unknown edges are skipped, so no offsets are assigned to them.
+        edges = [(self.get_user_offset(user_id), self.get_item_offset(item_id), weight)
+                 for user_id, item_id, weight in zip(user_ids, item_ids, weights)
+                 if weight > 0 or (user_id in self.user_id2offset and item_id in self.item_id2offset)]
+        if not edges:
+            return
+
+        n_users, n_items = self.n_users, self.n_items
+        rows = np.array([edge[0] for edge in edges], dtype=np.int64)
+        cols = np.array([edge[1] for edge in edges], dtype=np.int64)
+        weights = np.maximum(np.array([edge[2] for edge in edges], dtype=np.float64), 0.0)
+
+        # The last update of each edge.
+        keys = rows * n_items + cols
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last
+        keys, rows, cols, weights = keys[last], rows[last], cols[last], weights[last]
+
+        # Positions of the existing edges in the CSR arrays (rows ordered by the insertion, so by sorted keys).
+        user_rows = np.repeat(np.arange(len(self.user_indptr) - 1, dtype=np.int64), np.diff(self.user_indptr))
+        user_positions, user_found = self.find_edges(user_rows * n_items + self.user_indices, keys)
+        # ...and in the CSC arrays.
+        item_cols = np.repeat(np.arange(len(self.item_indptr) - 1, dtype=np.int64), np.diff(self.item_indptr))
+        item_positions, _ = self.find_edges(item_cols * n_users + self.item_indices, cols * n_users + rows)
+
+        user_weights = np.array(self.user_weights)
+        user_weights[user_positions[user_found]] = weights[user_found]
+        item_weights = np.array(self.item_weights)
+        item_weights[item_positions[user_found]] = weights[user_found]
+
+        removed = user_found & (weights == 0.0)
+        user_kept = np.ones(len(user_weights), dtype=bool)
+        user_kept[user_positions[removed]] = False
+        item_kept = np.ones(len(item_weights), dtype=bool)
+        item_kept[item_positions[removed]] = False
+
+        self.user_indptr = np.concatenate([[0], np.cumsum(np.bincount(user_rows[user_kept], minlength=n_users))]).astype(np.int64)
+        self.user_indices = self.user_indices[user_kept]
+        self.user_weights = user_weights[user_kept]
+        self.user_sequence = self.user_sequence[user_kept]
+        self.item_indptr = np.concatenate([[0], np.cumsum(np.bincount(item_cols[item_kept], minlength=n_items))]).astype(np.int64)
+        self.item_indices = self.item_indices[item_kept]
+        self.item_weights = item_weights[item_kept]
+
+        # New edges are merged by the compaction, it updates the norms only by them, so all norms are updated after it.
+        added = ~user_found & (weights > 0.0)
+        self.buffer_users.extend(rows[added].tolist())
+        self.buffer_items.extend(cols[added].tolist())
+        self.buffer_weights.extend(weights[added].tolist())
+        if added.any():
+            self.compact()
+        self.update_norms()
+
+    @staticmethod
+    def find_edges(edge_keys, keys):
+        """ Return positions of the keys in the (unsorted) edge_keys and a mask of the found ones.
+        """
+        if not len(edge_keys):
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+        order = np.argsort(edge_keys, kind='stable')
+        positions = order[np.minimum(np.searchsorted(edge_keys, keys, sorter=order), len(order) - 1)]
+        return positions, edge_keys[positions] == keys
+
+    def update_norms(self):
+        """ Calculate norms of all users and items, the same way as User.update_norm/Item.update_norm.
+        """
+        user_rows = np.repeat(np.arange(self.n_users), np.diff(self.user_indptr))
+        item_cols = np.repeat(np.arange(self.n_items), np.diff(self.item_indptr))
+        self.user_squared_norms = np.bincount(user_rows, weights=self.user_weights ** self.user_weights, minlength=self.n_users)
+        self.item_squared_norms = np.bincount(item_cols, weights=self.item_weights ** self.item_weights, minlength=self.n_items)
+        self.user_norms = np.sqrt(self.user_squared_norms)
+        self.item_norms = np.sqrt(self.item_squared_norms)
+
+    def update_norms_online(self, rows, cols, old_weights, new_weights):
+        """
+        Update norms of the users and items after the weights of the edges (rows, cols) changed from old_weights
+        to new_weights, the same way as User.update_norm_online, i.e. only the changed edges are visited.
+        The old weight of a new edge and the new weight of a removed edge are NaN.
+        """
+        terms = np.nan_to_num(new_weights ** new_weights) - np.nan_to_num(old_weights ** old_weights)
+        for kind, offsets, n_nodes in [('user', rows, self.n_users), ('item', cols, self.n_items)]:
+            squared_norms = getattr(self, kind + '_squared_norms')
+            if len(squared_norms) < n_nodes:
+                squared_norms = np.concatenate([squared_norms, np.zeros(n_nodes - len(squared_norms))])
+            squared_norms = squared_norms + np.bincount(offsets, weights=terms, minlength=n_nodes)
+            setattr(self, kind + '_squared_norms', squared_norms)
+            # Removals may leave a tiny negative rounding error.
+            setattr(self, kind + '_norms', np.sqrt(np.maximum(squared_norms, 0.0)))
+
+    def user_items(self, user_offset):
+        """ Return the (item offsets, weights) arrays of the user profile.
+        """
+        start, end = self.user_indptr[user_offset], self.user_indptr[user_offset + 1]
+        return self.user_indices[start:end], self.user_weights[start:end]
+
+    def item_users(self, item_offset):
+        """ Return the (user offsets, weights) arrays of the item profile.
+        """
+        start, end = self.item_indptr[item_offset], self.item_indptr[item_offset + 1]
+        return self.item_indices[start:end], self.item_weights[start:end]
+
+    def get_neighbourhood(self, user_offset, item_offset):
+        """
+        Return offsets of users within two hops from the edge (user, item): users of the item and users sharing an item
+        with the user. Both the compressed arrays and the append buffer are searched, so nothing is compacted.
+        """
+        buffer_users = np.frombuffer(self.buffer_users, dtype=np.int64) if len(self.buffer_users) else np.zeros(0, dtype=np.int64)
+        buffer_items = np.frombuffer(self.buffer_items, dtype=np.int64) if len(self.buffer_items) else np.zeros(0, dtype=np.int64)
+
+        item_offsets = [np.array([item_offset], dtype=np.int64), buffer_items[buffer_users == user_offset]]
+        if user_offset < len(self.user_indptr) - 1:
+            item_offsets.append(self.user_items(user_offset)[0])
+        item_offsets = np.unique(np.concatenate(item_offsets))
+
+        user_offsets = [buffer_users[np.isin(buffer_items, item_offsets)]]
+        for item in item_offsets[item_offsets < len(self.item_indptr) - 1].tolist():
+            user_offsets.append(self.item_users(item)[0])
+        return np.unique(np.concatenate(user_offsets))
+
+    def count_paths(self, user_offsets, neighbours=False):
+        """
+        Count the items of the users and the edges of their paths (item, neighbour, neighbour's item), with neighbours
+        the detected neighbours and the edges of the paths (neighbour, neighbour's item). The profile lengths are taken
+        from the differences of indptr of the compressed arrays (the buffer is not compacted, nor counted).
+        """
+        user_degrees = np.diff(self.user_indptr)
+        user_offsets = np.asarray(user_offsets, dtype=np.int64)
+        if neighbours:
+            neighbour_offsets = self.neighbour_offsets[user_offsets[user_offsets < len(self.neighbour_offsets)]].ravel()
+            neighbour_offsets = neighbour_offsets[(neighbour_offsets >= 0) & (neighbour_offsets < len(user_degrees))]
+            return {'neighbours': len(neighbour_offsets), 'edges': int(user_degrees[neighbour_offsets].sum())}
+
+        _, items, _ = gather_rows(self.user_indptr, self.user_indices, None, user_offsets[user_offsets < len(user_degrees)])
+        _, item_users, _ = gather_rows(self.item_indptr, self.item_indices, None, items[items < len(self.item_indptr) - 1])
+        return {'items': len(items), 'edges': len(item_users) + int(user_degrees[item_users].sum())}
+
+    def user_neighbours(self, user_offset):
+        """ Return the (neighbour offsets, similarities) arrays of the user.
+        """
+        if user_offset >= len(self.neighbour_offsets):
+            return self.neighbour_offsets[:0, 0], self.neighbour_similarities[:0, 0]
+
+        offsets = self.neighbour_offsets[user_offset]
+        n_neighbours = np.count_nonzero(offsets >= 0)
+        return offsets[:n_neighbours], self.neighbour_similarities[user_offset, :n_neighbours]
+
+    @classmethod
+    def from_nodes(cls, users, items):
+        """
+        Build the graph from the dict based User and Item nodes (of a trained recommender).
+        The order of users, items and profiles is kept. Zero entries present only in a user profile
+        (without the matching item profile entry) are skipped.
+        """
+        graph = cls()
+        for user_id in users:
+            graph.get_user_offset(user_id)
+        for item_id in items:
+            graph.get_item_offset(item_id)
+
+        user_indices, user_weights, user_counts = [], [], []
+        for user_id, user in users.items():
+            n_user_items = 0
+            for item_id, weight in user.user_profile.items():
+                if user_id in items[item_id].item_profile:
+                    user_indices.append(graph.item_id2offset[item_id])
+                    user_weights.append(weight)
+                    n_user_items += 1
+            user_counts.append(n_user_items)
+
+        item_indices, item_weights, item_counts = [], [], []
+        for item in items.values():
+            for user_id, weight in item.item_profile.items():
+                item_indices.append(graph.user_id2offset[user_id])
+                item_weights.append(weight)
+            item_counts.append(len(item.item_profile))
+
+        graph.user_indptr = np.concatenate([[0], np.cumsum(user_counts, dtype=np.int64)])
+        graph.user_indices = np.array(user_indices, dtype=np.int32)
+        graph.user_weights = np.array(user_weights, dtype=np.float64)
+        graph.item_indptr = np.concatenate([[0], np.cumsum(item_counts, dtype=np.int64)])
+        graph.item_indices = np.array(item_indices, dtype=np.int32)
+        graph.item_weights = np.array(item_weights, dtype=np.float64)
+        graph.user_sequence = get_profiles_sequence(graph.user_indptr, graph.user_indices, graph.item_indptr, graph.item_indices)
+        graph.n_inserted = len(user_indices)
+        graph.update_norms()
+
+        # The table has the width of the detected neighbours (shorter lists are padded), so it can be refreshed.
+        longest = max([len(getattr(user, 'neighbours', None) or ()) for user in users.values()] or [0])
+        if longest:
+            n_neighbours = max(longest, N_NEIGHBOURS)
+            graph.neighbour_offsets = np.full((graph.n_users, n_neighbours), -1, dtype=np.int32)
+            graph.neighbour_similarities = np.zeros((graph.n_users, n_neighbours), dtype=np.float64)
+            for user_offset, user in enumerate(users.values()):
+                for n_neighbour, neighbour in enumerate(user.neighbours):
+                    graph.neighbour_offsets[user_offset, n_neighbour] = graph.user_id2offset[neighbour['neighbour_id']]
+                    graph.neighbour_similarities[user_offset, n_neighbour] = neighbour['similarity']
+
+        return graph
+
+    def save(self, path):
+        """
+        Save the graph into a snapshot directory: a versioned manifest, the profile arrays, norms, neighbours and
+        the id tables (ids by offset, and sorted ids with their offsets for lookups), each as a .npy file.
+        The ids must be all str or all int (per users and items), their type is kept in the manifest.
+        """
+        self.compact()
+        os.makedirs(path, exist_ok=True)
+
+        for name in SNAPSHOT_ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+
+        id_types = dict()
+        for kind, offset2id in [('user', self.user_offset2id), ('item', self.item_offset2id)]:
+            ids = list(offset2id)
+            id_types[kind] = get_id_type(ids)
+            ids = np.array(ids, dtype=ID_TYPES[id_types[kind]][1])
+            sorted_offsets = np.argsort(ids, kind='stable')
+            np.save(os.path.join(path, kind + '_ids.npy'), ids)
+            np.save(os.path.join(path, kind + '_sorted_ids.npy'), ids[sorted_offsets])
+            np.save(os.path.join(path, kind + '_sorted_offsets.npy'), sorted_offsets)
+
+        with open(os.path.join(path, 'snapshot.json'), 'w') as manifest_file:
+            json.dump({
+                'version': SNAPSHOT_VERSION,
+                'n_users': self.n_users,
+                'n_items': self.n_items,
+                'n_inserted': self.n_inserted,
+                'buffer_size': self.buffer_size,
+                'id_types': id_types,
+            }, manifest_file)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load the graph from a snapshot directory. With mmap, the arrays are memory-mapped (copy-on-write), so
+        the pages are shared by all processes loading the same snapshot and nothing is read until it is used.
+        """
+        with open(os.path.join(path, 'snapshot.json'), 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest['version'] != SNAPSHOT_VERSION:
+            raise ValueError('Unsupported snapshot version {} (expected {})'.format(manifest['version'], SNAPSHOT_VERSION))
+
+        mmap_mode = 'c' if mmap else None
+
+        def load_array(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+
+        graph = cls(buffer_size=manifest['buffer_size'])
+        graph.n_inserted = manifest['n_inserted']
+        for name in SNAPSHOT_ARRAYS:
+            setattr(graph, name, load_array(name))
+
+        graph.user_squared_norms = np.square(graph.user_norms)
+        graph.item_squared_norms = np.square(graph.item_norms)
+
+        # Snapshots saved before the id types were kept have str ids.
+        id_types = manifest.get('id_types', {'user': 'str', 'item': 'str'})
+        graph.user_offset2id = SnapshotIds(load_array('user_ids'), id_types['user'])
+        graph.user_id2offset = SnapshotIdIndex(load_array('user_sorted_ids'), load_array('user_sorted_offsets'), id_types['user'])
+        graph.item_offset2id = SnapshotIds(load_array('item_ids'), id_types['item'])
+        graph.item_id2offset = SnapshotIdIndex(load_array('item_sorted_ids'), load_array('item_sorted_offsets'), id_types['item'])
+        return graph
@@ -0,0 +1,107 @@
+"""Streaming loaders of the interactions, no dataset is ever loaded into the memory as a whole."""
+
+import json
+import os
+import zlib
+
+import numpy as np
+
+from preprocessing.utils import iter_dataset
+
+
+def iter_json_array(filename, chunk_size=1024 * 1024):
+    """ Iterate objects of a JSON array (e.g. data/dataset.json) decoding the file chunk by chunk.
+    """
+    decoder = json.JSONDecoder()
+    with open(filename, 'r') as json_file:
+        buffer = json_file.read(chunk_size).lstrip()
+        # The leading whitespace could be longer than a chunk.
+        while not buffer:
+            chunk = json_file.read(chunk_size)
+            if not chunk:
+                break
+            buffer = chunk.lstrip()
+        if not buffer.startswith('['):
+            raise ValueError('{} does not contain a JSON array'.format(filename))
+        position = 1
+
+        while True:
+            # Skip separators between the objects.
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+
+            if position < len(buffer) and buffer[position] == ']':
+                return
+
+            try:
+                interaction, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # The object continues in the next chunk.
+                chunk = json_file.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+
+            yield interaction
+            position = end
+
+
+def iter_json_lines(filename):
+    """ Iterate interactions stored as JSON-lines, i.e. one JSON object per line.
+    """
+    with open(filename, 'r') as json_file:
+        for line in json_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_binary(dirname, chunk_size=1024 * 1024):
+    """
+    Iterate interactions stored in the binary format, i.e. a directory with the arrays user_offsets.npy and
+    item_offsets.npy (one element per interaction) and the tables user_ids.txt and item_ids.txt (one id per line).
+    The arrays are memory-mapped and read in chunks.
+    """
+    with open(os.path.join(dirname, 'user_ids.txt'), 'r') as user_ids_file:
+        user_ids = user_ids_file.read().split('\n')
+    with open(os.path.join(dirname, 'item_ids.txt'), 'r') as item_ids_file:
+        item_ids = item_ids_file.read().split('\n')
+
+    user_offsets = np.load(os.path.join(dirname, 'user_offsets.npy'), mmap_mode='r')
+    item_offsets = np.load(os.path.join(dirname, 'item_offsets.npy'), mmap_mode='r')
+    for start in range(0, len(user_offsets), chunk_size):
+        for user_offset, item_offset in zip(user_offsets[start:start + chunk_size].tolist(), item_offsets[start:start + chunk_size].tolist()):
+            yield {
+                'user_id': user_ids[user_offset],
+                'item_id': item_ids[item_offset]
+            }
+
+
+def iter_interactions(filename):
+    """
+    Iterate interactions from a file, the format is given by its name:
+    a directory with the binary format, *.jsonl with JSON-lines, *.csv with the raw ratings and *.json with a JSON array.
+    """
+    if os.path.isdir(filename):
+        return iter_binary(filename)
+    if filename.endswith('.jsonl'):
+        return iter_json_lines(filename)
+    if filename.endswith('.csv'):
+        return iter_dataset(filename)
+    return iter_json_array(filename)
+
+
+def is_test_interaction(interaction, test_size=0.1):
+    """ Decide by a hash of the interaction whether it belongs to the test set, the split is deterministic.
+    """
+    key = '{}\t{}'.format(interaction['user_id'], interaction['item_id']).encode('utf-8')
+    return zlib.crc32(key) % 10000 < test_size * 10000
+
+
+def split_interactions(interactions, test=False, test_size=0.1):
+    """ Yield only train (or only test) interactions, so the train and test sets are obtained by two passes.
+    """
+    for interaction in interactions:
+        if is_test_interaction(interaction, test_size) == test:
+            yield interaction
@@ -1,88 +1,154 @@
 """Recommender detect and use user neighbours."""
 
 import logging
+import time
 
 from collections import defaultdict
-from math import sqrt
 
+import numpy as np
 
-class User(object):
+from recommender import instrumentation
+from recommender.base import InteractionsMixin, NormMixin, SetInteractionsMixin, SnapshotMixin
+from recommender.neighbours import detect_user_neighbours, get_affected_users, refresh_user_neighbours
+from recommender.nodes import CompactNeighboursUser, CompactNormalizedItem, IdTable
+from recommender.scoring import recommend_offsets, recommend_many
+from recommender.similarity import check_measure, get_similarities
+from recommender.sparse_graph import SparseGraph
+
+
+class User(NormMixin):
     """ A data class for the user representation.
     """
+    profile_name = 'user_profile'
+
     def __init__(self, user_id):
         self.user_id = user_id  # A string user identification.
         self.user_profile = defaultdict(float)  # A dict {item_id => interaction weight}
         self.neighbours = []  # A list of dict, one dict present one user neighbour and contains the keys neighbour_id and similarity.
         self.norm = 0.0   # A user norm (i.e. an euclidean norm of weights from the user profile).
-
-    def update_norm(self):
-        """ Calculate a user's norm.
-        """
-        self.norm = sqrt(sum([item_weight ** item_weight for item_weight in self.user_profile.values()]))
+        self.squared_norm = 0.0  # A sum of the (transformed) weights under the square root of the norm.
 
 
-class Item(object):
+class Item(NormMixin):
     """ A data class for the item representation.
     """
+    profile_name = 'item_profile'
+
     def __init__(self, item_id):
         self.item_id = item_id  # A string identification.
         self.item_profile = defaultdict(float)  # A dict {user_id => interaction weight}
         self.norm = 0.0  # A item's norm.
-
-    def update_norm(self):
-        """ Calculate the item's norm.
-        """
-        self.norm = sqrt(sum([user_weight ** user_weight for user_weight in self.item_profile.values()]))
+        self.squared_norm = 0.0  # A sum of the (transformed) weights under the square root of the norm.
 
 
-class Recommender(object):
+@instrumentation.probed
+class Recommender(InteractionsMixin, SetInteractionsMixin, SnapshotMixin):
     """
     Recommend items for users using the paths (user, neighbour, item)
     This class represent the user-item network and detect user neighbours, i.e. shortcuts in the network.
 
     """
-    def __init__(self):
+    scoring_options = {'exclude_history': True, 'neighbours': True}  # How the vectorized scoring reproduces the recommend method.
+
+    def __init__(self, sparse=False, vectorized=False, candidate_generator=None, online=False, compact=False, similarity='cosine'):
         self.users = dict()  # A dict {user_id => User}
         self.items = dict()  # A dict {item_id => Item}
+        self.online = online  # Update norms with each interaction and track users whose neighbours should be refreshed.
+        self.dirty_users = dict()  # {user_id => None} of users with new interactions since the last neighbours detection.
+        self.candidate_generator = candidate_generator  # An index providing neighbour candidates (e.g. MinHashLSH), or None for the heuristic.
+        self.graph = SparseGraph() if sparse or vectorized else None  # The array-backed network used instead of the dicts.
+        self.vectorized = vectorized  # Score the paths by the sparse matrix products instead of the loops.
+        check_measure(similarity)
+        self.similarity = similarity  # The similarity measure of the neighbours (see recommender.similarity).
+
+        if compact and self.graph is not None:
+            raise ValueError('The compact nodes store the dict network, they cannot be used with sparse or vectorized')
+        self.compact = compact  # Store the users and items in the compact nodes (see recommender.nodes).
+        self.user_id_table = IdTable() if compact else None  # Users interned by the compact nodes.
+        self.item_id_table = IdTable() if compact else None  # Items interned by the compact nodes.
 
+    @instrumentation.probe('put_interaction')
     def put_interaction(self, user_id, item_id, weight):
         """ Add a new edge in the network.
         """
+        if self.candidate_generator is not None:
+            self.candidate_generator.put_interaction(user_id, item_id)
+
+        if self.graph is not None:
+            self.graph.put_interaction(user_id, item_id, weight)
+            if self.online:
+                self.dirty_users[user_id] = None
+            return
+
         # Obtain the user if already exists.
         if user_id in self.users:
             user = self.users[user_id]
         # ...or create a new one.
         else:
-            user = self.users[user_id] = User(user_id)
+            if self.compact:
+                user = self.users[user_id] = CompactNeighboursUser(user_id, self.item_id_table, self.user_id_table)
+            else:
+                user = self.users[user_id] = User(user_id)
 
         # Obtain the item if already exists.
         if item_id in self.items:
             item = self.items[item_id]
         # ...or create a new one.
         else:
-            item = self.items[item_id] = Item(item_id)
+            if self.compact:
+                item = self.items[item_id] = CompactNormalizedItem(item_id, self.user_id_table)
+            else:
+                item = self.items[item_id] = Item(item_id)
 
         # Insert a new interest into the user/item profile.
         # If there is the same interests, use the higher weight.
         # Here you can try different methods how to deal with repeating interactions (e.g. sum them)
+        old_user_weight = user.user_profile.get(item_id)
+        old_item_weight = item.item_profile.get(user_id)
         user.user_profile[item_id] = max(weight, user.user_profile[item_id])
         item.item_profile[user_id] = max(weight, item.item_profile[user_id])
 
-    @staticmethod
-    def get_similarity(profile_a, norm_a, profile_b, norm_b):
-        """ Calculate the (cosine) similarity between two user profiles.
+        # In the online mode, norms are kept up to date with each interaction.
+        if self.online:
+            user.update_norm_online(old_user_weight, user.user_profile[item_id])
+            item.update_norm_online(old_item_weight, item.item_profile[user_id])
+            self.dirty_users[user_id] = None
+
+    def after_set_graph_interactions(self, interactions):
+        """
+        Add the new edges into the candidate generator and mark the changed users for the neighbours refresh.
+        The candidate generator only learns new edges, removed ones stay in its index.
         """
-        similarity = 0.0
-        for i in profile_a:
-            similarity += profile_a[i] * profile_b[i]
-        similarity /= norm_a * norm_b
-        return similarity
+        for interaction in interactions:
+            if self.candidate_generator is not None and interaction['weight'] > 0:
+                self.candidate_generator.put_interaction(interaction['user_id'], interaction['item_id'])
+            if self.online:
+                self.dirty_users[interaction['user_id']] = None
 
+    def after_set_interaction(self, user, item, old_weight, weight):
+        """ Update the norms by the changed edge and mark the user for the neighbours refresh.
+        """
+        if self.online:
+            user.update_norm_online(old_weight, weight if weight > 0 else None)
+            item.update_norm_online(old_weight, weight if weight > 0 else None)
+            self.dirty_users[user.user_id] = None
+
+    @instrumentation.probe('get_similarities', instrumentation.count_candidates)
+    def get_similarities(self, user_id, candidate_ids):
+        """ Calculate the similarities (by the similarity measure) of the user with all the candidates at once.
+        """
+        return get_similarities(user_id, candidate_ids, self.users, self.similarity)
+
+    @instrumentation.probe('get_neighbours_candidates', instrumentation.count_candidates)
     def get_neighbours_candidates(self, user_profile):
         """
         A heuristic to preselect a subset from the users neighbours candidates.
         The 1000 most relevant neighbour candidates are selected for each user, based on the (normalized) number of common items.
+        With a candidate generator, the candidates are obtained from it instead.
         """
+        if self.candidate_generator is not None:
+            return self.candidate_generator.query(item_ids=user_profile.keys(), n_candidates=1000)
+
         neighbour_candidates = defaultdict(int)
         for item_id in user_profile:
             for user_id in self.items[item_id].item_profile:
@@ -90,53 +156,195 @@ class Recommender(object):
 
         return sorted(neighbour_candidates.keys(), key=lambda user_id: neighbour_candidates[user_id], reverse=True)[:1000]
 
-    def detect_user_neighbours(self):
+    @instrumentation.probe('detect_user_neighbours')
+    def detect_user_neighbours(self, n_jobs=1, chunk_size=1000):
         """
         A simple method for neighbours detection.
         For each user obtain a set of 1000 neighbour candidates. For each of them calculate the user-user similarity
         and choose the 50 most important neighbours.
+
+        With the array-backed network, the users could be split into chunks of chunk_size users and processed by
+        n_jobs worker processes (see recommender.neighbours).
         """
+        if self.graph is not None:
+            detect_user_neighbours(self.graph, n_jobs=n_jobs, chunk_size=chunk_size, candidates=self.get_candidates_arrays(), measure=self.similarity)
+            self.dirty_users.clear()
+            return
+
+        if n_jobs != 1:
+            logging.warning('Parallel neighbours detection requires the array-backed network, using one process')
+
         for n_user, user_id_a in enumerate(self.users):
             if (n_user % 100) == 0:
                 logging.info('Detected neighbours for %d (%d%%) users', n_user, n_user * 100 / len(self.users))
 
-            user_profile_a = self.users[user_id_a].user_profile
-            user_norm_a = self.users[user_id_a].norm
-            neighbours_scored = dict()  # {neighbour_id => similarity}
+            self.detect_neighbours_of(user_id_a)
 
-            for user_id_b in self.get_neighbours_candidates(user_profile_a):
-                if user_id_b == user_id_a:
-                    continue
+        self.dirty_users.clear()
 
-                user_profile_b = self.users[user_id_b].user_profile
-                user_norm_b = self.users[user_id_b].norm
+    @instrumentation.probe('detect_neighbours_of', instrumentation.count_neighbours)
+    def detect_neighbours_of(self, user_id_a):
+        """ Detect the 50 most important neighbours of one user.
+        """
+        user_profile_a = self.users[user_id_a].user_profile
+        candidate_ids = [user_id_b for user_id_b in self.get_neighbours_candidates(user_profile_a) if user_id_b != user_id_a]
 
-                similarity = self.get_similarity(user_profile_a, user_norm_a, user_profile_b, user_norm_b)
-                neighbours_scored[user_id_b] = similarity
+        # All candidates are compared at once (see recommender.similarity).
+        neighbours_scored = dict(zip(candidate_ids, self.get_similarities(user_id_a, candidate_ids).tolist()))  # {neighbour_id => similarity}
 
+        with instrumentation.phase('detect_neighbours_of.sort'):
             sorted_neighbours_ids = sorted(neighbours_scored.keys(), key=lambda neighbour_id: neighbours_scored[neighbour_id], reverse=True)[:50]
-            self.users[user_id_a].neighbours = [{'neighbour_id': neighbour_id, 'similarity': neighbours_scored[neighbour_id]} for neighbour_id in sorted_neighbours_ids]
+        self.users[user_id_a].neighbours = [{'neighbour_id': neighbour_id, 'similarity': neighbours_scored[neighbour_id]} for neighbour_id in sorted_neighbours_ids]
+
+    def get_affected_users(self):
+        """
+        Return users whose neighbours could be changed by the interactions since the last neighbours detection.
+        These are the dirty users and all users sharing an item with them, since only their candidate scores
+        and similarities depend on profiles (and norms) of the dirty users.
+        """
+        affected_users = set(self.dirty_users)
+        for user_id in self.dirty_users:
+            for item_id in self.users[user_id].user_profile:
+                affected_users.update(self.items[item_id].item_profile)
+
+        # Keep the order of the users in the network.
+        return [user_id for user_id in self.users if user_id in affected_users]
+
+    @instrumentation.probe('refresh_neighbours')
+    def refresh_neighbours(self):
+        """
+        Refresh neighbours of the users affected by new interactions (in the online mode), instead of detecting
+        neighbours of all users again. Call it on demand, e.g. after each batch of the streamed interactions.
+        """
+        if self.graph is not None:
+            user_offsets = get_affected_users(self.graph, [self.graph.user_id2offset[user_id] for user_id in self.dirty_users])
+            refresh_user_neighbours(self.graph, user_offsets, candidates=self.get_candidates_arrays(user_offsets), measure=self.similarity)
+        else:
+            affected_users = self.get_affected_users()
+            for n_user, user_id in enumerate(affected_users):
+                if (n_user % 100) == 0:
+                    logging.info('Refreshed neighbours for %d (%d%%) users', n_user, n_user * 100 / len(affected_users))
+
+                self.detect_neighbours_of(user_id)
 
+        self.dirty_users.clear()
+
+    @instrumentation.probe('recommend', instrumentation.count_neighbour_paths)
     def recommend(self, user_id):
         """
         Recommend top 10 most important items.
         Recommendations are provided from all items on the path (user-neighbour-item).
 
         """
+        if self.vectorized:
+            return self.recommend_vectorized(user_id)
+        if self.graph is not None:
+            return self.recommend_sparse(user_id)
+
         if user_id not in self.users:
             return []
 
         scores = defaultdict(float)
         user_node = self.users[user_id]
+        user_profile = user_node.user_profile
         for neighbour in user_node.neighbours:
             neighbour_id = neighbour['neighbour_id']
             neighbour_node = self.users[neighbour_id]
             similarity = neighbour['similarity']
 
             for neighbour_item_id, neighbour_item_weight in neighbour_node.user_profile.items():
-                if neighbour_item_id in user_node.user_profile:
+                if neighbour_item_id in user_profile:
                     continue
 
                 scores[neighbour_item_id] += similarity * neighbour_item_weight
 
         return sorted(scores.keys(), key=lambda item_id: scores[item_id], reverse=True)[:10]
+
+    def get_candidates_arrays(self, user_offsets=None):
+        """
+        Return neighbour candidates of all users in the array-backed network as (indptr, indices), if generated.
+        If user_offsets are given, the candidates of other users are left empty.
+        """
+        if self.candidate_generator is None:
+            return None
+
+        graph = self.graph
+        selected = set(range(graph.n_users) if user_offsets is None else user_offsets)
+        candidates = [[graph.user_id2offset[candidate_id] for candidate_id in self.candidate_generator.query(user_id=user_id, n_candidates=1000)]
+                      if user_offset in selected else [] for user_offset, user_id in enumerate(graph.user_offset2id)]
+        indptr = np.concatenate([[0], np.cumsum([len(user_candidates) for user_candidates in candidates])]).astype(np.int64)
+        indices = np.fromiter((candidate for user_candidates in candidates for candidate in user_candidates), dtype=np.int32, count=indptr[-1])
+        return indptr, indices
+
+    def recommend_sparse(self, user_id):
+        """ The same as recommend, but the paths are walked in the array-backed network.
+        """
+        graph = self.graph
+        if user_id not in graph.user_id2offset:
+            return []
+        graph.compact()
+
+        scores = defaultdict(float)  # {item offset => score}
+        user_offset = graph.user_id2offset[user_id]
+        user_profile = set(graph.user_items(user_offset)[0].tolist())
+        neighbours, similarities = graph.user_neighbours(user_offset)
+        for neighbour, similarity in zip(neighbours.tolist(), similarities.tolist()):
+            neighbour_items, neighbour_items_weights = graph.user_items(neighbour)
+            for neighbour_item, neighbour_item_weight in zip(neighbour_items.tolist(), neighbour_items_weights.tolist()):
+                if neighbour_item in user_profile:
+                    continue
+
+                scores[neighbour_item] += similarity * neighbour_item_weight
+
+        top_items = sorted(scores.keys(), key=lambda item: scores[item], reverse=True)[:10]
+        return [graph.item_offset2id[item] for item in top_items]
+
+    def recommend_vectorized(self, user_id):
+        """ The same as recommend, but the paths are scored by the sparse matrix products (ties are ordered by offsets).
+        """
+        graph = self.graph
+        if user_id not in graph.user_id2offset:
+            return []
+
+        item_offsets = recommend_offsets(graph, [graph.user_id2offset[user_id]], **self.scoring_options)[0]
+        return [graph.item_offset2id[item] for item in item_offsets]
+
+    @instrumentation.probe('recommend_many', instrumentation.count_users)
+    def recommend_many(self, user_ids, k=10, block_size=1000, seconds=None):
+        """
+        Recommend top k items for each of the given users.
+        With the array-backed network, users are scored together in blocks of block_size users.
+        With seconds (a list), the time of each user is appended to it.
+        """
+        if self.graph is not None:
+            return recommend_many(self.graph, user_ids, k=k, block_size=block_size, seconds=seconds, **self.scoring_options)
+
+        recommendations = []
+        n_edges = 0  # The traversed edges (neighbour, neighbour's item), recorded by the instrumentation.
+        starts = []  # The start time of each user, the end of the last one is appended after the loop.
+        for user_id in user_ids:
+            starts.append(time.perf_counter())
+            if user_id not in self.users:
+                recommendations.append([])
+                continue
+
+            scores = defaultdict(float)
+            user_node = self.users[user_id]
+            user_profile = user_node.user_profile
+            for neighbour in user_node.neighbours:
+                neighbour_profile = self.users[neighbour['neighbour_id']].user_profile
+                n_edges += len(neighbour_profile)
+                for neighbour_item_id, neighbour_item_weight in neighbour_profile.items():
+                    if neighbour_item_id in user_profile:
+                        continue
+
+                    scores[neighbour_item_id] += neighbour['similarity'] * neighbour_item_weight
+
+            recommendations.append(sorted(scores.keys(), key=lambda item_id: scores[item_id], reverse=True)[:k])
+
+        if instrumentation.active is not None:
+            instrumentation.active.record('recommend_many.edges', n_edges)
+        if seconds is not None:
+            starts.append(time.perf_counter())
+            seconds.extend(end - start for start, end in zip(starts, starts[1:]))
+        return recommendations
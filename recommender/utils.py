@@ -1,8 +1,12 @@
 import logging
 
 from collections import defaultdict
+
+import numpy as np
 from sklearn.model_selection import train_test_split
 
+from recommender.evaluation import evaluate_ranking
+
 
 def split_dataset(dataset):
     y = [interaction['user_id'] for interaction in dataset]
@@ -31,24 +35,87 @@ def check_dataset(train_dataset, test_dataset):
     logging.info('Number of users that appear only in test data = %d', n_missing)
 
 
-def evaluate(recommender, test_dataset):
-    users_ratings = defaultdict(set)
-    for interaction in test_dataset:
-        user_id = interaction['user_id']
-        item_id = interaction['item_id']
-        users_ratings[user_id].add(item_id)
+def evaluate(recommender, test_dataset, block_size=1000, n_jobs=1, instrument=False, profile_path=None):
+    """
+    Return the hit ratio of the top 10 recommendations, i.e. the ratio of the test interactions which were recommended.
+    The users are recommended in blocks (by n_jobs processes), see evaluate_ranking for the other metrics
+    and for the instrumentation (instrument, profile_path).
+    """
+    report = evaluate_ranking(recommender, test_dataset, k=10, n_jobs=n_jobs, chunk_size=block_size, per_user_timing=False,
+                              instrument=instrument, profile_path=profile_path)
+
+    logging.info('Correctly recommended = %d', report['n_hits'])
+    logging.info('Total recommended = %d', report['n_relevant'])
+    return report['hit_ratio']
+
+
+def check_recommendations(reference, recommender, user_ids):
+    """
+    Compare recommendations of a vectorized recommender with a reference (pure Python) one.
+    Both rankings must have the same length and the same score at each position, where the scores are computed by
+    the reference's loops (get_item_scores), so only items with tied scores may be ordered differently.
+    Return the number of users with different recommendations.
+    """
+    n_mismatches = 0
+    for user_id in user_ids:
+        expected = reference.recommend(user_id)
+        actual = recommender.recommend(user_id)
+        if expected == actual:
+            continue
+
+        scores = reference.get_item_scores(user_id)
+        if len(expected) != len(actual) or any(item_id not in scores for item_id in actual) or \
+                not np.allclose([scores[item_id] for item_id in expected], [scores[item_id] for item_id in actual]):
+            n_mismatches += 1
+
+    logging.info('Different recommendations for %d of %d users', n_mismatches, len(user_ids))
+    return n_mismatches
+
+
+def check_sharded_recommendations(reference, sharded, user_ids):
+    """
+    Compare recommendations of a sharded recommender with a reference (single-process) one.
+    Both rankings must have the same length and the same scores (all item scores are obtained from the shards),
+    so only items with tied scores may be ordered differently. Return the number of users with different recommendations.
+    """
+    n_mismatches = 0
+    for user_id, actual in zip(user_ids, sharded.recommend_many(user_ids)):
+        expected = reference.recommend(user_id)
+        if expected == actual:
+            continue
+
+        scores = dict(sharded.get_scores([user_id], k=None)[0])
+        if len(expected) != len(actual) or any(item_id not in scores for item_id in expected) or \
+                not np.allclose([scores[item_id] for item_id in expected], [scores[item_id] for item_id in actual]):
+            n_mismatches += 1
+
+    logging.info('Different recommendations for %d of %d users', n_mismatches, len(user_ids))
+    return n_mismatches
+
+
+def get_neighbour_ids(recommender, user_id):
+    """ Return ids of the user neighbours detected by the (user neighbours) recommender.
+    """
+    graph = recommender.graph
+    if graph is None:
+        return [neighbour['neighbour_id'] for neighbour in recommender.users[user_id].neighbours]
 
-    correctly_recommended = 0
-    total_recommended = 0
+    return [graph.user_offset2id[neighbour] for neighbour in graph.user_neighbours(graph.user_id2offset[user_id])[0]]
 
-    for n_user, (user_id, user_ratings) in enumerate(users_ratings.items()):
-        if (n_user % 100) == 0:
-            logging.info('Evaluate %d users (%d%%) [%d]', n_user, n_user * 100 / len(users_ratings), correctly_recommended)
 
-        recommended_items = set(recommender.recommend(user_id))
-        correctly_recommended += len(users_ratings[user_id] & recommended_items)
-        total_recommended += len(users_ratings[user_id])
+def evaluate_neighbours(exact_recommender, recommender, user_ids):
+    """
+    Compare neighbours detected by a recommender (e.g. with approximate candidates) with the exact ones.
+    Return the recall@50, i.e. the average ratio of the exact neighbours which were found.
+    """
+    total_recall = 0.0
+    for user_id in user_ids:
+        exact_neighbours = set(get_neighbour_ids(exact_recommender, user_id))
+        if exact_neighbours:
+            total_recall += len(exact_neighbours & set(get_neighbour_ids(recommender, user_id))) / len(exact_neighbours)
+        else:
+            total_recall += 1.0
 
-    logging.info('Correctly recommended = %d', correctly_recommended)
-    logging.info('Total recommended = %d', total_recommended)
-    return correctly_recommended / total_recommended
+    recall = total_recall / len(user_ids)
+    logging.info('Neighbours recall@50 = %.4f', recall)
+    return recall
@@ -0,0 +1,28 @@
+import pytest
+
+from recommender.benchmark import generate_dataset
+
+
+def generate_interactions(n_users=200, n_items=100, n_interactions=3000, weights=(1.0,), seed=42):
+    """ Return a reproducible list of interactions (dicts with user_id, item_id and weight) of a Zipf distributed graph.
+    """
+    user_offsets, item_offsets = generate_dataset(n_users, n_items, n_interactions, seed=seed)
+    return [{'user_id': 'user_{}'.format(user), 'item_id': 'item_{}'.format(item), 'weight': weights[n_interaction % len(weights)]}
+            for n_interaction, (user, item) in enumerate(zip(user_offsets.tolist(), item_offsets.tolist()))]
+
+
+@pytest.fixture(scope='session')
+def interactions():
+    return generate_interactions()
+
+
+@pytest.fixture(scope='session')
+def weighted_interactions():
+    return generate_interactions(weights=(1.0, 2.0, 0.5, 3.0, 1.5))
+
+
+@pytest.fixture(scope='session')
+def small_interactions():
+    """ A network of 30 users, so each user has fewer neighbours than the detector keeps.
+    """
+    return generate_interactions(n_users=30, n_items=20, n_interactions=200)
@@ -0,0 +1,25 @@
+import json
+import sys
+
+from recommender import benchmark
+
+RESULT_KEYS = {'recommender', 'backend', 'dataset', 'n_interactions', 'put_interaction_per_second', 'finalize_seconds',
+               'detect_user_neighbours_seconds', 'recommend_p50_ms', 'recommend_p99_ms', 'peak_rss_mb', 'base_rss_mb',
+               'recommender_rss_mb'}
+
+
+def test_benchmark_writes_the_report(tmp_path, monkeypatch):
+    """ One case of the speed benchmark is run in a spawned process, the report is written as JSON.
+    """
+    output = tmp_path / 'benchmark.json'
+    monkeypatch.setattr(sys, 'argv', ['benchmark', '--output', str(output), '--datasets', 'small',
+                                      '--recommenders', 'user_neighbours_recommender', '--backends', 'sparse'])
+    benchmark.main()
+
+    report = json.loads(output.read_text())
+    assert set(report) == {'python', 'numpy', 'created', 'results'}
+    [result] = report['results']
+    assert set(result) == RESULT_KEYS
+    assert (result['recommender'], result['backend'], result['dataset']) == ('user_neighbours_recommender', 'sparse', 'small')
+    assert result['n_interactions'] == benchmark.DATASETS['small'][2]
+    assert result['detect_user_neighbours_seconds'] > 0.0 and result['recommend_p50_ms'] <= result['recommend_p99_ms']
@@ -0,0 +1,75 @@
+import pytest
+
+from recommender import baseline_recommender, bounded, normalized_recommender, recommender_exluded_history
+from recommender.bounded import NeighbourLists
+from recommender.item_index import ItemIndex
+
+MODULES = [baseline_recommender, recommender_exluded_history]
+
+
+@pytest.mark.parametrize('module', MODULES)
+@pytest.mark.parametrize('options', [{}, {'sparse': True}])
+def test_rankings_without_binding_caps(interactions, module, options):
+    """ The bounded walk with caps larger than the network ranks the items as recommend.
+    """
+    reference = module.Recommender(**options)
+    bounded = module.Recommender(max_neighbours=10 ** 6, **options)
+    reference.put_interactions(interactions)
+    bounded.put_interactions(interactions)
+    for user_id in sorted(reference.users or reference.graph.user_id2offset)[:50]:
+        assert bounded.recommend(user_id) == reference.recommend(user_id)
+
+
+@pytest.mark.parametrize('sampling', ['top', 'weighted'])
+@pytest.mark.parametrize('module', MODULES + [normalized_recommender])
+def test_lists_are_kept_by_put_interaction(weighted_interactions, module, sampling):
+    """ The lists updated with each interaction select the same users as the lists built from the final profiles.
+    """
+    recommender = module.Recommender(max_neighbours=5, sampling=sampling, **({'online': True} if module is normalized_recommender else {}))
+    half = len(weighted_interactions) // 2
+    recommender.put_interactions(weighted_interactions[:half])
+    for item_id in recommender.items:
+        recommender.recommend_bounded(next(iter(recommender.items[item_id].item_profile)))
+    recommender.put_interactions(weighted_interactions[half:])
+    recommender.put_interactions(dict(interaction, weight=interaction['weight'] * 1.5) for interaction in weighted_interactions[::7])
+
+    built = NeighbourLists(5, sampling)
+    for item_id, item in recommender.items.items():
+        selected, scale = recommender.neighbour_lists.select(item_id, item.item_profile.items)
+        expected, expected_scale = built.select(item_id, item.item_profile.items)
+        assert selected == expected
+        assert scale == pytest.approx(expected_scale)
+
+
+def test_expansion_does_not_read_the_profile():
+    lists = NeighbourLists(2)
+    lists.build('item', [('user_a', 1.0), ('user_b', 3.0), ('user_c', 3.0), ('user_d', 2.0)])
+    lists.put('item', 'user_e', None, 5.0, 4)
+
+    def read_profile():
+        raise AssertionError('The profile is read')
+    assert lists.select('item', read_profile) == ([('user_b', 3.0), ('user_e', 5.0)], 14.0 / 8.0)
+
+    lists.put('item', 'user_e', 5.0, 1.0, 4)
+    assert lists.select('item', lambda: [('user_a', 1.0), ('user_b', 3.0), ('user_c', 3.0), ('user_d', 2.0), ('user_e', 1.0)]) == \
+        ([('user_b', 3.0), ('user_c', 3.0)], 10.0 / 6.0)
+
+
+@pytest.mark.parametrize('options', [{}, {'sparse': True}])
+def test_edge_budget(interactions, options):
+    recommender = baseline_recommender.Recommender(max_neighbours=20, max_edges=100, **options)
+    recommender.put_interactions(interactions)
+    get_item_users, get_user_items = (bounded.get_dict_accessors(recommender.users, recommender.items, recommender.neighbour_lists) if not options
+                                      else bounded.get_graph_accessors(recommender.graph, recommender.neighbour_lists, 100))
+    if options:
+        recommender.graph.compact()
+        user_items = zip(*(array.tolist() for array in recommender.graph.user_items(0)))
+    else:
+        user_items = next(iter(recommender.users.values())).user_profile.items()
+    _, n_edges = bounded.walk_paths(user_items, get_item_users, get_user_items, max_edges=100)
+    assert n_edges <= 100
+
+
+def test_item_index_and_caps_are_exclusive():
+    with pytest.raises(ValueError):
+        baseline_recommender.Recommender(max_edges=100, item_index=ItemIndex())
@@ -0,0 +1,71 @@
+import pytest
+
+from recommender import recommender_exluded_history
+from recommender.cache import CachedRecommender
+
+
+@pytest.mark.parametrize('options', [{}, {'sparse': True}])
+def test_neighbourhood_invalidation_keeps_recommendations_fresh(options, interactions):
+    recommender = CachedRecommender(recommender_exluded_history.Recommender(**options), invalidate_neighbourhood=True)
+    recommender.put_interactions(interactions[:2000])
+    user_ids = sorted(set(interaction['user_id'] for interaction in interactions))
+    recommender.recommend_many(user_ids)
+
+    for interaction in interactions[2000:2200]:
+        recommender.put_interaction(interaction['user_id'], interaction['item_id'], interaction['weight'])
+        if options:
+            # The neighbourhood is found without compacting the network.
+            assert len(recommender.graph.buffer_weights)
+
+    assert recommender.invalidations
+    for user_id in user_ids:
+        assert recommender.recommend(user_id) == recommender.recommender.recommend(user_id)
+
+
+def test_sparse_neighbourhood_is_dict_neighbourhood(interactions):
+    dict_recommender = CachedRecommender(recommender_exluded_history.Recommender())
+    sparse_recommender = CachedRecommender(recommender_exluded_history.Recommender(sparse=True))
+    for n_interaction, interaction in enumerate(interactions):
+        dict_recommender.put_interaction(interaction['user_id'], interaction['item_id'], interaction['weight'])
+        sparse_recommender.put_interaction(interaction['user_id'], interaction['item_id'], interaction['weight'])
+        if n_interaction == 1500:
+            sparse_recommender.graph.compact()
+        if n_interaction % 100 == 0:
+            assert sparse_recommender.get_neighbourhood(interaction['user_id'], interaction['item_id']) == \
+                dict_recommender.get_neighbourhood(interaction['user_id'], interaction['item_id'])
+
+
+def test_entries_serve_requests_with_lower_k(interactions):
+    inner = recommender_exluded_history.Recommender()
+    inner.put_interactions(interactions)
+    recommender = CachedRecommender(inner)
+    user_ids = sorted(set(interaction['user_id'] for interaction in interactions))[:30]
+
+    assert recommender.recommend_many(user_ids, k=5) == inner.recommend_many(user_ids, k=5)
+    assert recommender.misses == 30
+    # A longer ranking is obtained from the recommender, a shorter one from the cache.
+    assert recommender.recommend_many(user_ids, k=20) == inner.recommend_many(user_ids, k=20)
+    assert recommender.misses == 60
+    assert recommender.recommend_many(user_ids, k=10) == inner.recommend_many(user_ids, k=10)
+    assert [recommender.recommend(user_id) for user_id in user_ids] == [inner.recommend(user_id) for user_id in user_ids]
+    assert recommender.misses == 60 and recommender.hits == 60
+
+
+@pytest.mark.parametrize('options', [{}, {'sparse': True}])
+@pytest.mark.parametrize('invalidate_neighbourhood', [False, True])
+def test_set_interactions_invalidates(options, invalidate_neighbourhood, interactions):
+    """ Lowered and removed edges invalidate the entries as the new ones, so the cache serves the current recommendations.
+    """
+    recommender = CachedRecommender(recommender_exluded_history.Recommender(**options), invalidate_neighbourhood=invalidate_neighbourhood)
+    recommender.put_interactions(interactions)
+    user_ids = sorted(set(interaction['user_id'] for interaction in interactions))
+    recommender.recommend_many(user_ids)
+
+    changed = [dict(interaction, weight=0.0 if n_interaction % 2 else 0.1) for n_interaction, interaction in enumerate(interactions[:200])]
+    changed.append({'user_id': 'user_new', 'item_id': 'item_new', 'weight': 0.0})
+    assert recommender.set_interactions(changed) == len(changed)
+    assert recommender.invalidations
+
+    checked_user_ids = user_ids if invalidate_neighbourhood else sorted(set(interaction['user_id'] for interaction in changed))
+    for user_id in checked_user_ids:
+        assert recommender.recommend(user_id) == recommender.recommender.recommend(user_id)
@@ -0,0 +1,77 @@
+import pytest
+
+from recommender import baseline_recommender, evaluation, user_neighbours_recommender
+from recommender.cache import CachedRecommender
+
+BACKENDS = [{}, {'sparse': True}, {'max_neighbours': 5}]
+
+
+class FailingRecommender(object):
+    """ A recommender failing in recommend_many.
+    """
+    graph = None
+
+    def recommend_many(self, user_ids, k=10, block_size=1000, seconds=None):
+        raise RuntimeError('Failed')
+
+
+@pytest.mark.parametrize('options', BACKENDS)
+def test_per_user_timing_evaluates_the_blocks(interactions, options):
+    """ Both timing modes recommend the users by recommend_many, so they return the same recommendations.
+    """
+    recommender = baseline_recommender.Recommender(**options)
+    recommender.put_interactions(interactions[:2500])
+    user_ids = sorted(set(interaction['user_id'] for interaction in interactions[2500:])) + ['user_unknown']
+
+    timed = evaluation.recommend_users(recommender, user_ids, chunk_size=50, per_user_timing=True)
+    untimed = evaluation.recommend_users(recommender, user_ids, chunk_size=50, per_user_timing=False)
+    assert [items for items, _ in timed] == [items for items, _ in untimed] == recommender.recommend_many(user_ids)
+    assert all(seconds >= 0.0 for _, seconds in timed)
+
+
+def test_per_user_timing_times_each_user_of_the_graph(interactions, monkeypatch):
+    """ The array-backed network splits the time of a block, so with per_user_timing each user is a block.
+    """
+    recommender = baseline_recommender.Recommender(sparse=True)
+    recommender.put_interactions(interactions)
+    user_ids = sorted(set(interaction['user_id'] for interaction in interactions))
+    block_sizes = []
+    recommend_many = recommender.recommend_many
+
+    def record_blocks(user_ids, k=10, block_size=1000, seconds=None):
+        block_sizes.append(block_size)
+        return recommend_many(user_ids, k=k, block_size=block_size, seconds=seconds)
+
+    monkeypatch.setattr(recommender, 'recommend_many', record_blocks)
+    timed = evaluation.recommend_users(recommender, user_ids, chunk_size=50, per_user_timing=True)
+    assert set(block_sizes) == {1}
+    assert len(set(seconds for _, seconds in timed[:50])) > 1
+
+    block_sizes.clear()
+    evaluation.recommend_users(recommender, user_ids, chunk_size=50, per_user_timing=False)
+    assert set(block_sizes) == {50}
+
+
+def test_wrappers_time_users(interactions):
+    recommender = CachedRecommender(user_neighbours_recommender.Recommender())
+    recommender.put_interactions(interactions)
+    user_ids = sorted(set(interaction['user_id'] for interaction in interactions))
+    recommender.recommend_many(user_ids[:10])
+
+    seconds = []
+    assert recommender.recommend_many(user_ids, seconds=seconds) == recommender.recommender.recommend_many(user_ids)
+    assert len(seconds) == len(user_ids)
+
+
+def test_metrics_are_floats(interactions):
+    recommender = baseline_recommender.Recommender(sparse=True)
+    recommender.put_interactions(interactions[:2500])
+    report = evaluation.evaluate_ranking(recommender, interactions[2500:], n_jobs=2, chunk_size=20)
+    assert type(report['hit_ratio']) is float and type(report['coverage']) is float
+    assert report['n_users'] == len(report['user_seconds'])
+
+
+def test_failed_chunk_terminates_the_pool():
+    with pytest.raises(RuntimeError):
+        evaluation.recommend_users(FailingRecommender(), ['user_{}'.format(n_user) for n_user in range(20)], n_jobs=2)
+    assert evaluation._model is None
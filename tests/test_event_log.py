@@ -0,0 +1,105 @@
+import pytest
+
+from recommender import baseline_recommender
+from recommender.event_log import InteractionLog
+
+
+class RecordingRecommender(object):
+    """ Records the interactions written by set_interactions.
+    """
+    def __init__(self):
+        self.written = []
+
+    def set_interactions(self, interactions):
+        self.written.append({(interaction['user_id'], interaction['item_id']): interaction['weight'] for interaction in interactions})
+        return len(interactions)
+
+
+def test_sync_writes_only_outdated_edges():
+    """ With the decay, an edge is written again only after it decayed by more than epsilon (or below the threshold).
+    """
+    log = InteractionLog(half_life=100.0, epsilon=0.01, threshold=0.5)
+    recommender = RecordingRecommender()
+    for n_edge in range(3):
+        log.append('user_{}'.format(n_edge), 'item', 1.0, timestamp=0.0)
+
+    assert log.sync(recommender, now=0.0) == 3
+    assert log.sync(recommender, now=1.0) == 0  # Decayed by 0.7%.
+    assert log.sync(recommender, now=2.0) == 3  # Decayed by 1.4%.
+    assert recommender.written[-1][('user_0', 'item')] == pytest.approx(0.5 ** 0.02)
+
+    log.append('user_0', 'item', 1.0, timestamp=2.5)
+    assert log.sync(recommender, now=2.5) == 1
+    assert log.sync(recommender, now=2.6) == 0
+
+    # The edges below the threshold are removed from the recommender, but they stay in the log until compact.
+    log.sync(recommender, now=101.0)
+    assert recommender.written[-1] == {('user_0', 'item'): pytest.approx(0.5 ** 0.985), ('user_1', 'item'): 0.0, ('user_2', 'item'): 0.0}
+    assert len(log.edges) == 3
+    assert log.sync(recommender, now=150.0) == 1
+    assert recommender.written[-1] == {('user_0', 'item'): 0.0}
+
+
+def test_synced_weights_are_within_epsilon(interactions):
+    """ The weights of the recommender stay within epsilon of the decayed weights of the log.
+    """
+    log = InteractionLog(half_life=50.0, epsilon=0.05)
+    recommender = baseline_recommender.Recommender()
+    for n_interaction, interaction in enumerate(interactions[:1000]):
+        log.append(interaction['user_id'], interaction['item_id'], interaction['weight'], timestamp=n_interaction / 10)
+        if n_interaction % 100 == 99:
+            now = n_interaction / 10
+            log.sync(recommender, now=now)
+            for (user_id, item_id), _ in log.edges.items():
+                weight = log.get_weight(user_id, item_id, now)
+                assert recommender.users[user_id].user_profile[item_id] == pytest.approx(weight, rel=0.06)
+
+
+@pytest.mark.parametrize('policy, expected', [('max', 1.0), ('sum', 1.0 * 0.25 + 2.0 * 0.5 + 0.5 + 1.0), ('last', 0.5)])
+def test_policies(policy, expected):
+    """ The repeated events are aggregated by the policy, a late event is decayed to the last update (or ignored by last).
+    """
+    log = InteractionLog(half_life=10.0, policy=policy)
+    log.append('user', 'item', 1.0, timestamp=0.0)
+    log.append('user', 'item', 2.0, timestamp=10.0)
+    log.append('user', 'item', 0.5, timestamp=20.0)
+    log.append('user', 'item', 4.0, timestamp=0.0)  # Late, decayed by two half-lives to 1.0.
+    assert log.get_weight('user', 'item', now=20.0) == pytest.approx(expected)
+    assert log.get_weight('user', 'item', now=30.0) == pytest.approx(expected / 2)
+    assert log.get_weight('user', 'missing', now=30.0) == 0.0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        InteractionLog(policy='min')
+
+
+def test_without_decay():
+    log = InteractionLog(policy='sum')
+    log.append('user', 'item', 1.0, timestamp=0.0)
+    log.append('user', 'item', 2.0, timestamp=1000.0)
+    assert log.get_weight('user', 'item', now=1e9) == 3.0
+
+
+def test_compaction_replays_the_same_edges(tmp_path, weighted_interactions):
+    """ The compacted file gives the same edges as the log, the dropped edges are removed from the recommender by sync.
+    """
+    path = str(tmp_path / 'events.jsonl')
+    log = InteractionLog(path, half_life=100.0, policy='sum', threshold=0.5)
+    recommender = baseline_recommender.Recommender()
+    for n_interaction, interaction in enumerate(weighted_interactions[:1000]):
+        log.append(interaction['user_id'], interaction['item_id'], interaction['weight'], timestamp=float(n_interaction))
+    log.sync(recommender, now=1000.0)
+    n_edges = len(log.edges)
+
+    n_dropped = log.compact(now=1000.0)
+    assert 0 < n_dropped < n_edges and len(log.edges) == n_edges - n_dropped
+    log.sync(recommender, now=1000.0)
+    log.close()
+
+    replayed = InteractionLog.load(path, half_life=100.0, policy='sum', threshold=0.5)
+    assert replayed.edges == pytest.approx(log.edges)
+    replayed.close()
+    assert sum(len(user.user_profile) for user in recommender.users.values()) == len(log.edges)
+    for (user_id, item_id), _ in log.edges.items():
+        assert recommender.users[user_id].user_profile[item_id] == pytest.approx(log.get_weight(user_id, item_id, now=1000.0))
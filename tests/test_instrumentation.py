@@ -0,0 +1,72 @@
+import pytest
+
+from recommender import baseline_recommender, evaluation, instrumentation, user_neighbours_recommender
+
+
+@pytest.mark.parametrize('options', [{}, {'sparse': True}])
+def test_evaluation_counts_the_edges(interactions, options):
+    """ The evaluation recommends by recommend_many, its edges are counted both by the dict walks and by the graph.
+    """
+    recommender = baseline_recommender.Recommender(**options)
+    recommender.put_interactions(interactions[:2500])
+
+    report = evaluation.evaluate_ranking(recommender, interactions[2500:], chunk_size=50, instrument=True)
+    assert report['instrumentation']['counters']['recommend_many.edges'] > 0
+
+
+def test_graph_counts_the_edges_of_the_walks(interactions):
+    """ The edges counted from the profile lengths of the graph are the edges walked by the dict recommender.
+    """
+    dict_recommender = baseline_recommender.Recommender()
+    sparse_recommender = baseline_recommender.Recommender(sparse=True)
+    for recommender in (dict_recommender, sparse_recommender):
+        recommender.put_interactions(interactions)
+    user_ids = sorted(set(interaction['user_id'] for interaction in interactions))[:30]
+
+    with instrumentation.instrumented() as recorder:
+        for user_id in user_ids:
+            dict_recommender.recommend(user_id)
+    graph = sparse_recommender.graph
+    graph.compact()
+    counts = graph.count_paths([graph.user_id2offset[user_id] for user_id in user_ids])
+    assert counts['edges'] == recorder.counters['recommend.edges'] > 0
+
+
+def test_counting_does_not_compact(interactions):
+    """ The graph counts the compressed arrays only, the buffered interactions stay in the buffer.
+    """
+    recommender = baseline_recommender.Recommender(sparse=True)
+    recommender.put_interactions(interactions[:2500])
+    recommender.recommend('user_1')
+    recommender.put_interactions(interactions[2500:])
+
+    graph = recommender.graph
+    n_buffered = len(graph.buffer_users)
+    counts = graph.count_paths([0, 1, 2])
+    assert len(graph.buffer_users) == n_buffered > 0
+    assert counts['items'] > 0 and counts['edges'] > 0
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_neighbours_kernel_phases(interactions, n_jobs):
+    """ The phases of the sparse neighbours detection are recorded, also in the worker processes.
+    """
+    recommender = user_neighbours_recommender.Recommender(sparse=True)
+    recommender.put_interactions(interactions)
+    with instrumentation.instrumented() as recorder:
+        recommender.detect_user_neighbours(n_jobs=n_jobs, chunk_size=50)
+
+    n_users = len(recommender.graph.user_id2offset)
+    for name in ('candidates', 'similarity', 'sort'):
+        assert recorder.histograms['detect_neighbours.{}.seconds'.format(name)].count == n_users
+    assert recorder.counters['detect_neighbours.edges'] > 0
+
+
+def test_dict_neighbours_sort_phase(interactions):
+    """ The sort of the neighbours of the dict recommender is recorded apart from their scoring.
+    """
+    recommender = user_neighbours_recommender.Recommender(online=True)
+    recommender.put_interactions(interactions)
+    with instrumentation.instrumented() as recorder:
+        recommender.detect_user_neighbours()
+    assert recorder.histograms['detect_neighbours_of.sort.seconds'].count == len(recommender.users)
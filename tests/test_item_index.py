@@ -0,0 +1,61 @@
+import pytest
+
+from recommender import baseline_recommender
+from recommender.item_index import ItemIndex
+
+
+def build_recommender(interactions, n_neighbours=None, normalize=False):
+    recommender = baseline_recommender.Recommender(item_index=ItemIndex(n_neighbours=n_neighbours, normalize=normalize))
+    recommender.put_interactions(interactions)
+    return recommender
+
+
+@pytest.mark.parametrize('n_neighbours, normalize', [(None, False), (10, False), (10, True)])
+def test_parallel_build_equals_serial(weighted_interactions, n_neighbours, normalize):
+    """ The chunks are built by the worker processes in any order, the index is the same.
+    """
+    recommender = build_recommender(weighted_interactions, n_neighbours, normalize)
+    recommender.build_item_index()
+    expected = recommender.item_index.neighbours
+
+    parallel = ItemIndex(n_neighbours=n_neighbours, normalize=normalize)
+    parallel.build(recommender.users, recommender.items, n_jobs=2, chunk_size=17)
+    assert parallel.neighbours == expected
+    assert parallel.diagonal == recommender.item_index.diagonal
+
+
+def test_incremental_index_equals_rebuild(weighted_interactions):
+    """ Without the pruning, the index updated by put_interaction has the co-occurrences of a rebuilt index.
+    """
+    recommender = build_recommender(weighted_interactions[:1500])
+    recommender.build_item_index()
+    recommender.put_interactions(weighted_interactions[1500:])
+    rebuilt = ItemIndex(n_neighbours=None)
+    rebuilt.build(recommender.users, recommender.items)
+
+    index = recommender.item_index
+    assert index.diagonal == pytest.approx(rebuilt.diagonal)
+    assert set(index.neighbours) == set(rebuilt.neighbours)
+    for item_id, neighbours in rebuilt.neighbours.items():
+        assert index.neighbours[item_id] == pytest.approx(neighbours)
+
+
+def test_incremental_pruned_index_equals_rebuild_up_to_ties(weighted_interactions):
+    """ The pruned index keeps the top co-occurrences, only the neighbours tied at the last place may differ.
+    """
+    n_neighbours = 10
+    recommender = build_recommender(weighted_interactions[:1500], n_neighbours)
+    recommender.build_item_index()
+    recommender.put_interactions(weighted_interactions[1500:])
+    rebuilt = ItemIndex(n_neighbours=n_neighbours)
+    rebuilt.build(recommender.users, recommender.items)
+
+    for item_id, neighbours in rebuilt.neighbours.items():
+        incremental = recommender.item_index.neighbours[item_id]
+        assert sorted(incremental.values()) == pytest.approx(sorted(neighbours.values()))
+        # The kept co-occurrences are exact, the differing neighbours are tied with the weakest one.
+        for neighbour_id, cooccurrence in incremental.items():
+            assert cooccurrence == pytest.approx(ItemIndex.get_cooccurrence(item_id, neighbour_id, recommender.items))
+        weakest = min(neighbours.values())
+        for neighbour_id in set(incremental) ^ set(neighbours):
+            assert ItemIndex.get_cooccurrence(item_id, neighbour_id, recommender.items) == pytest.approx(weakest)
@@ -0,0 +1,73 @@
+import random
+
+from collections import defaultdict
+
+from recommender import user_neighbours_recommender
+from recommender.lsh import MinHashLSH
+from recommender.utils import evaluate_neighbours
+
+
+def get_profiles(interactions):
+    profiles = defaultdict(list)  # {user_id => item ids in the order of the interactions}
+    for interaction in interactions:
+        if interaction['item_id'] not in profiles[interaction['user_id']]:
+            profiles[interaction['user_id']].append(interaction['item_id'])
+    return profiles
+
+
+def test_candidates_include_the_user_and_its_duplicates(interactions):
+    """ A user shares all buckets with itself and with the users of the same items (in any order).
+    """
+    profiles = get_profiles(interactions)
+    index = MinHashLSH()
+    for user_id, item_ids in profiles.items():
+        for item_id in item_ids:
+            index.put_interaction(user_id, item_id)
+            index.put_interaction(user_id + '_copy', item_id)
+        for item_id in reversed(item_ids):
+            index.put_interaction(user_id + '_reversed', item_id)
+
+    for user_id, item_ids in profiles.items():
+        duplicates = {user_id, user_id + '_copy', user_id + '_reversed'}
+        assert duplicates <= set(index.query(user_id=user_id))
+        assert duplicates <= set(index.query(item_ids=item_ids))
+
+
+def test_incremental_buckets_equal_a_rebuild(interactions):
+    """ The buckets updated by each interaction equal the buckets of the signatures of the whole profiles.
+    """
+    index = MinHashLSH()
+    for interaction in interactions:
+        index.put_interaction(interaction['user_id'], interaction['item_id'])
+
+    rebuilt = MinHashLSH()
+    profiles = list(get_profiles(interactions).items())
+    random.Random(42).shuffle(profiles)
+    expected_buckets = defaultdict(set)
+    for user_id, item_ids in profiles:
+        signature = rebuilt.get_signature(item_ids)
+        assert index.signatures[user_id].tolist() == signature.tolist()
+        for key in rebuilt.get_bucket_keys(signature):
+            expected_buckets[key].add(user_id)
+
+    assert {key: set(users) for key, users in index.buckets.items()} == expected_buckets
+
+
+def test_recall_of_the_exhaustive_neighbours(weighted_interactions):
+    """ The recall of the neighbours detected from the LSH candidates grows with the shorter (more permissive) bands.
+    """
+    exact = user_neighbours_recommender.Recommender(sparse=True)
+    exact.put_interactions(weighted_interactions)
+    exact.detect_user_neighbours()
+    user_ids = exact.graph.user_offset2id
+    assert evaluate_neighbours(exact, exact, user_ids) == 1.0
+
+    recalls = []
+    for band_size in (5, 2, 1):
+        approximate = user_neighbours_recommender.Recommender(sparse=True, candidate_generator=MinHashLSH(n_bands=50, band_size=band_size))
+        approximate.put_interactions(weighted_interactions)
+        approximate.detect_user_neighbours()
+        recalls.append(evaluate_neighbours(exact, approximate, user_ids))
+
+    assert 0.0 < recalls[0] < recalls[1] < recalls[2] <= 1.0
+    assert recalls[2] > 0.95
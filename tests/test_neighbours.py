@@ -0,0 +1,77 @@
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+
+from recommender import neighbours
+from recommender.sparse_graph import SparseGraph
+
+
+def build_graph(interactions):
+    graph = SparseGraph()
+    for interaction in interactions:
+        graph.put_interaction(interaction['user_id'], interaction['item_id'], interaction['weight'])
+    graph.compact()
+    return graph
+
+
+@pytest.mark.parametrize('width', [5, 80])
+def test_refresh_uses_the_width_of_the_table(weighted_interactions, width):
+    """ A table of another width than n_neighbours (e.g. built elsewhere) is refreshed, a narrower one is widened.
+    """
+    graph = build_graph(weighted_interactions)
+    neighbours.detect_user_neighbours(graph, n_neighbours=width)
+    expected = build_graph(weighted_interactions)
+    neighbours.detect_user_neighbours(expected)
+
+    graph.put_interaction('user_new', 'item_1', 1.0)
+    expected.put_interaction('user_new', 'item_1', 1.0)
+    neighbours.detect_user_neighbours(expected)
+    neighbours.refresh_user_neighbours(graph, np.arange(graph.n_users))
+
+    assert graph.neighbour_offsets.shape == (graph.n_users, max(width, 50))
+    for user_offset in range(graph.n_users):
+        offsets, similarities = graph.user_neighbours(user_offset)
+        expected_offsets, expected_similarities = expected.user_neighbours(user_offset)
+        assert offsets.tolist() == expected_offsets.tolist()
+        assert similarities.tolist() == expected_similarities.tolist()
+
+
+@pytest.mark.parametrize('measure', ['cosine', 'jaccard'])
+def test_parallel_detection_equals_serial(weighted_interactions, measure):
+    """ The last chunk is shorter (the chunk size does not divide the users), the neighbours do not depend on the chunks.
+    """
+    graph = build_graph(weighted_interactions)
+    assert graph.n_users % 17 != 0
+    neighbours.detect_user_neighbours(graph, measure=measure)
+    expected_offsets, expected_similarities = graph.neighbour_offsets, graph.neighbour_similarities
+
+    neighbours.detect_user_neighbours(graph, n_jobs=2, chunk_size=17, measure=measure)
+    assert graph.neighbour_offsets.tolist() == expected_offsets.tolist()
+    assert graph.neighbour_similarities.tolist() == expected_similarities.tolist()
+
+
+def test_failed_chunk_releases_the_shared_memory(weighted_interactions, monkeypatch):
+    """ A failure in a worker is raised, the shared memory is unlinked and the parent keeps no worker arrays.
+    """
+    created = []
+
+    class RecordedMemory(SharedMemory):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self.name)
+
+    def fail(*args):
+        raise RuntimeError('Failed')
+
+    graph = build_graph(weighted_interactions)
+    monkeypatch.setattr(neighbours, 'SharedMemory', RecordedMemory)
+    monkeypatch.setattr(neighbours, 'detect_neighbours', fail)
+    with pytest.raises(RuntimeError):
+        neighbours.detect_user_neighbours(graph, n_jobs=2, chunk_size=17)
+
+    assert neighbours._worker_arrays is None and graph.neighbour_offsets.shape == (0, 0)
+    assert len(created) == len(neighbours.NETWORK_ARRAYS)
+    for name in created:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=name)
@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from recommender import baseline_recommender, normalized_recommender, recommender_exluded_history, user_neighbours_recommender
+from recommender.nodes import IdTable, ProfileView
+
+RECOMMENDERS = [
+    (baseline_recommender, {}),
+    (recommender_exluded_history, {}),
+    (normalized_recommender, {'online': True}),
+    (user_neighbours_recommender, {'online': True}),
+]
+
+
+def test_profile_view_is_ordered_as_a_dict():
+    """ The profile keeps the order of insertion and the exact weights of a dict, also after removals.
+    """
+    ids = IdTable()
+    for n_id in range(50):
+        ids.intern('id_{}'.format(n_id))
+    profile, expected = ProfileView(ids), dict()
+
+    rng = random.Random(42)
+    for _ in range(500):
+        id_ = 'id_{}'.format(rng.randrange(60))
+        if id_ in expected and rng.random() < 0.3:
+            del profile[id_]
+            del expected[id_]
+        else:
+            profile[id_] = expected[id_] = rng.random() / 3
+        assert list(profile.items()) == list(expected.items())
+
+    assert list(profile) == list(expected) and list(profile.values()) == list(expected.values())
+    assert all(profile[id_] == weight and id_ in profile for id_, weight in expected.items())
+    assert profile['missing'] == 0.0 and profile.get('missing') is None and 'missing' not in profile
+    with pytest.raises(KeyError):
+        del profile['missing']
+
+
+@pytest.mark.parametrize('module, options', RECOMMENDERS)
+def test_compact_nodes_recommend_as_the_dicts(weighted_interactions, module, options):
+    """ The compact nodes keep the profiles in the same order with the same weights, so the recommendations are equal.
+    """
+    recommenders = [module.Recommender(**options), module.Recommender(compact=True, **options)]
+    removed = [dict(interaction, weight=0.0) for interaction in weighted_interactions[::7]]
+    for recommender in recommenders:
+        recommender.put_interactions(weighted_interactions[:2500])
+        recommender.set_interactions(removed)
+        recommender.put_interactions(weighted_interactions[2500:])
+        if module is user_neighbours_recommender:
+            recommender.detect_user_neighbours()
+
+    dict_recommender, compact_recommender = recommenders
+    for user_id, user in dict_recommender.users.items():
+        assert list(compact_recommender.users[user_id].user_profile.items()) == list(user.user_profile.items())
+        assert compact_recommender.recommend(user_id) == dict_recommender.recommend(user_id)
@@ -0,0 +1,53 @@
+import csv
+
+import pytest
+
+from preprocessing import utils
+from recommender.streaming import iter_interactions
+
+
+def write_ratings(path, n_ratings=300):
+    """ Write a CSV of ratings whose item ids contain quoted line breaks, semicolons and escaped quotes.
+    """
+    lines = ['"User-ID";"ISBN";"Book-Rating"']
+    for n_rating in range(n_ratings):
+        item_id = 'item {}\nsecond ""line""; {}'.format(n_rating % 37, n_rating % 3)
+        lines.append('"user {}";"{}";"{}"'.format(n_rating % 23, item_id, n_rating % 5))
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+def get_expected(path):
+    """ The interactions of the CSV parsed at once, anonymized as by anonymize_dataset.
+    """
+    with open(str(path), newline='', encoding='utf-8') as csv_file:
+        records = list(csv.reader(csv_file, delimiter=';'))[1:]
+    return utils.anonymize_dataset({'user_id': user_id, 'item_id': item_id} for user_id, item_id, rating in records if float(rating))
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+@pytest.mark.parametrize('block_size', [1, 100, 1000000])
+def test_quoted_line_breaks(tmp_path, n_jobs, block_size):
+    """ The blocks end at record boundaries, so the result does not depend on the block size or the number of jobs.
+    """
+    filename = tmp_path / 'ratings.csv'
+    write_ratings(filename)
+    for start, end in utils.get_blocks(str(filename), block_size):
+        assert filename.read_bytes()[start:end].count(b'"') % 2 == 0
+
+    output = str(tmp_path / 'dataset.jsonl')
+    n_interactions = utils.preprocess_dataset(str(filename), output, n_jobs=n_jobs, block_size=block_size, encoding='utf-8')
+    expected = get_expected(filename)
+    assert n_interactions == len(expected)
+    assert list(iter_interactions(output)) == expected
+
+
+def test_failing_block_closes_the_pool(tmp_path):
+    """ An invalid rating is raised from the worker processes.
+    """
+    filename = tmp_path / 'ratings.csv'
+    write_ratings(filename)
+    with open(str(filename), 'a') as csv_file:
+        csv_file.write('"user";"item";"not a rating"\n')
+
+    with pytest.raises(ValueError):
+        utils.preprocess_dataset(str(filename), str(tmp_path / 'dataset.jsonl'), n_jobs=2, block_size=100, encoding='utf-8')
@@ -0,0 +1,43 @@
+import pytest
+
+from recommender import baseline_recommender, recommender_exluded_history, normalized_recommender
+from recommender.path_cache import ItemPathsCache
+
+
+@pytest.mark.parametrize('module', [baseline_recommender, recommender_exluded_history, normalized_recommender])
+@pytest.mark.parametrize('max_cached_paths', [1000000, 50, 0])
+def test_recommend_many_is_recommend(module, max_cached_paths, weighted_interactions):
+    """ Batched recommendations are the same as one by one, however small the cache of the item paths is.
+    """
+    recommender = module.Recommender(online=True) if module is normalized_recommender else module.Recommender()
+    recommender.put_interactions(weighted_interactions)
+    recommender.max_cached_paths = max_cached_paths
+
+    user_ids = sorted(set(interaction['user_id'] for interaction in weighted_interactions)) + ['unknown_user']
+    recommendations = recommender.recommend_many(user_ids, block_size=64)
+    for user_id, items in zip(user_ids, recommendations):
+        scores = recommender.get_item_scores(user_id)
+        expected = recommender.recommend(user_id)
+        assert [round(scores[item_id], 9) for item_id in items] == [round(scores[item_id], 9) for item_id in expected]
+
+
+def test_item_paths_cache_is_bounded():
+    calls = []
+
+    def get_item_paths(item_id):
+        calls.append(item_id)
+        return {neighbour_id: 1.0 for neighbour_id in range(item_id)}
+
+    cache = ItemPathsCache(get_item_paths, max_entries=10)
+    assert cache.get(4) == {0: 1.0, 1: 1.0, 2: 1.0, 3: 1.0}
+    cache.get(5)
+    cache.get(4)
+    assert calls == [4, 5]
+    assert cache.n_entries == 9
+
+    # The least recently used item (5) is evicted first.
+    cache.get(3)
+    assert list(cache.paths) == [4, 3] and cache.n_entries == 7
+    # An item larger than the cache is kept alone.
+    cache.get(20)
+    assert list(cache.paths) == [20] and cache.n_entries == 20
@@ -0,0 +1,38 @@
+import pytest
+
+from recommender import baseline_recommender, recommender_exluded_history, normalized_recommender
+from recommender.utils import check_recommendations
+
+
+def train(recommender, interactions):
+    recommender.put_interactions(interactions)
+    for user in recommender.users.values():
+        if hasattr(user, 'update_norm'):
+            user.update_norm()
+    return recommender
+
+
+@pytest.mark.parametrize('module', [baseline_recommender, recommender_exluded_history, normalized_recommender])
+@pytest.mark.parametrize('fixture', ['interactions', 'weighted_interactions'])
+def test_vectorized_scoring_ranks_as_the_loops(module, fixture, request):
+    """ The vectorized scoring must rank the items the same way as the loops in each recommend method.
+    """
+    interactions = request.getfixturevalue(fixture)
+    reference = train(module.Recommender(), interactions)
+    recommender = train(module.Recommender(vectorized=True), interactions)
+
+    user_ids = sorted(set(interaction['user_id'] for interaction in interactions)) + ['unknown_user']
+    assert check_recommendations(reference, recommender, user_ids) == 0
+
+
+def test_check_recommendations_detects_wrong_ranking(interactions):
+    """ A ranking with different scores is reported, the scores are taken from the reference's loops.
+    """
+    reference = train(baseline_recommender.Recommender(), interactions)
+
+    class Reversed(object):
+        def recommend(self, user_id):
+            return list(reversed(reference.recommend(user_id)))
+
+    user_ids = sorted(set(interaction['user_id'] for interaction in interactions))[:20]
+    assert check_recommendations(reference, Reversed(), user_ids) > 0
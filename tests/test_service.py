@@ -0,0 +1,184 @@
+import asyncio
+import json
+import threading
+import time
+
+from recommender import baseline_recommender
+from recommender.cache import CachedRecommender
+from recommender.service import ReadWriteLock, RecommendationService
+
+
+class TracedRecommender(object):
+    """ A recommender checking that no recommendation runs while the interactions are applied.
+    """
+    def __init__(self, recommender):
+        self.recommender = recommender
+        self.graph = recommender.graph
+        self.n_reading = 0
+        self.n_reading_lock = threading.Lock()
+        self.overlaps = 0
+
+    def recommend_many(self, user_ids, k=10):
+        with self.n_reading_lock:
+            self.n_reading += 1
+        try:
+            time.sleep(0.005)
+            return self.recommender.recommend_many(user_ids, k=k)
+        finally:
+            with self.n_reading_lock:
+                self.n_reading -= 1
+
+    def put_interaction(self, user_id, item_id, weight):
+        if self.n_reading:
+            self.overlaps += 1
+        self.recommender.put_interaction(user_id, item_id, weight)
+
+
+async def request_lines(port, requests):
+    """ Send the requests on one connection, return the responses by their ids.
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for request in requests:
+        writer.write(json.dumps(request).encode('utf-8') + b'\n')
+    await writer.drain()
+    writer.write_eof()
+
+    responses = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        response = json.loads(line)
+        responses[response['id']] = response
+    writer.close()
+    return responses
+
+
+def serve(service, client):
+    """ Run the service on an ephemeral port while client(port) is awaited.
+    """
+    async def run():
+        server = await service.serve('127.0.0.1', 0)
+        try:
+            return await client(server.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+            await server.wait_closed()
+            await service.stop()
+    return asyncio.run(run())
+
+
+def test_line_protocol(interactions):
+    recommender = baseline_recommender.Recommender(sparse=True)
+    recommender.put_interactions(interactions)
+    user_ids = sorted(set(interaction['user_id'] for interaction in interactions))[:40]
+    expected = recommender.recommend_many(user_ids, k=5)
+
+    service = RecommendationService(recommender, batch_window=0.01)
+    requests = [{'id': n_user, 'method': 'recommend', 'user_id': user_id, 'k': 5} for n_user, user_id in enumerate(user_ids)]
+    requests += [{'id': 'unknown', 'method': 'unknown'}, {'id': 'unknown_user', 'method': 'recommend', 'user_id': 'user_missing'}]
+
+    async def client(port):
+        responses = await request_lines(port, requests)
+        responses.update(await request_lines(port, [{'id': 'put', 'method': 'put_interaction', 'user_id': 'user_new', 'item_id': 'item_1', 'weight': 2.0}]))
+        return responses
+    responses = serve(service, client)
+
+    assert [responses[n_user]['items'] for n_user in range(len(user_ids))] == expected
+    assert responses['put'] == {'id': 'put', 'ok': True}
+    assert responses['unknown']['error'].startswith('ValueError')
+    assert responses['unknown_user']['items'] == []
+    assert recommender.graph.user_items(recommender.graph.user_id2offset['user_new'])[1].tolist() == [2.0]
+
+
+def test_set_interaction(interactions):
+    """ The writes are applied in order, set_interaction lowers and removes the edges through the cache.
+    """
+    inner = baseline_recommender.Recommender(sparse=True)
+    inner.put_interactions(interactions)
+    recommender = CachedRecommender(inner)
+    service = RecommendationService(recommender, batch_window=0.01)
+    writes = [
+        {'id': 'put', 'method': 'put_interaction', 'user_id': 'user_new', 'item_id': 'item_1', 'weight': 2.0},
+        {'id': 'lower', 'method': 'set_interaction', 'user_id': 'user_new', 'item_id': 'item_1', 'weight': 0.5},
+        {'id': 'add', 'method': 'put_interaction', 'user_id': 'user_new', 'item_id': 'item_2', 'weight': 1.0},
+        {'id': 'remove', 'method': 'set_interaction', 'user_id': 'user_new', 'item_id': 'item_2', 'weight': 0.0},
+    ]
+
+    async def client(port):
+        responses = {}
+        for write in writes:
+            responses.update(await request_lines(port, [write]))
+            responses.update(await request_lines(port, [{'id': write['id'] + '_recommend', 'method': 'recommend', 'user_id': 'user_new'}]))
+        responses.update(await request_lines(port, [{'id': 'stats', 'method': 'stats'}]))
+        return responses
+    responses = serve(service, client)
+
+    assert all(responses[write['id']] == {'id': write['id'], 'ok': True} for write in writes)
+    graph = inner.graph
+    assert graph.user_items(graph.user_id2offset['user_new'])[1].tolist() == [0.5]
+    assert responses['remove_recommend']['items'] == inner.recommend('user_new')
+    assert responses['remove_recommend']['items'] != responses['add_recommend']['items']
+    assert responses['stats']['stats']['set_interaction']['requests'] == 2
+
+
+def test_stats(interactions):
+    recommender = baseline_recommender.Recommender(sparse=True)
+    recommender.put_interactions(interactions)
+    service = RecommendationService(recommender, batch_window=0.01)
+    requests = [{'id': n_request, 'method': 'recommend', 'user_id': 'user_{}'.format(n_request)} for n_request in range(50)]
+
+    async def client(port):
+        await request_lines(port, requests)
+        return (await request_lines(port, [{'id': 'stats', 'method': 'stats'}]))['stats']['stats']
+    stats = serve(service, client)
+
+    assert stats['recommend']['requests'] == 50
+    assert 1 <= stats['recommend']['batches'] < 50  # The requests arriving together share batches.
+    assert stats['recommend']['max_queue_depth'] >= 1 and stats['recommend']['queue_depth'] == 0
+    assert stats['recommend']['latency_p50_ms'] <= stats['recommend']['latency_p99_ms']
+    assert stats['put_interaction']['requests'] == 0 and stats['put_interaction']['latency_p50_ms'] is None
+
+
+def test_writes_exclude_reads(interactions):
+    inner = baseline_recommender.Recommender(sparse=True)
+    inner.put_interactions(interactions)
+    recommender = TracedRecommender(inner)
+    service = RecommendationService(recommender, batch_window=0.001, max_batch_size=4, n_workers=4)
+    requests = []
+    for n_request in range(60):
+        requests.append({'id': 'read_{}'.format(n_request), 'method': 'recommend', 'user_id': 'user_{}'.format(n_request)})
+        requests.append({'id': 'write_{}'.format(n_request), 'method': 'put_interaction', 'user_id': 'user_{}'.format(n_request), 'item_id': 'item_0'})
+    responses = serve(service, lambda port: request_lines(port, requests))
+
+    assert len(responses) == 120 and not any('error' in response for response in responses.values())
+    assert recommender.overlaps == 0
+
+
+def test_waiting_writer_blocks_new_readers():
+    events = []
+
+    async def run():
+        lock = ReadWriteLock()
+
+        async def read(name, seconds):
+            await lock.acquire_read()
+            events.append(name + ' start')
+            await asyncio.sleep(seconds)
+            events.append(name + ' end')
+            await lock.release_read()
+
+        async def write():
+            await lock.acquire_write()
+            events.append('write')
+            await lock.release_write()
+
+        first = asyncio.ensure_future(read('first', 0.02))
+        await asyncio.sleep(0.005)
+        writer = asyncio.ensure_future(write())
+        await asyncio.sleep(0.005)
+        second = asyncio.ensure_future(read('second', 0.0))
+        await asyncio.gather(first, writer, second)
+
+    asyncio.run(run())
+    assert events == ['first start', 'first end', 'write', 'second start', 'second end']
@@ -0,0 +1,47 @@
+import pytest
+
+from recommender import baseline_recommender, normalized_recommender, recommender_exluded_history
+from recommender.sharding import ShardedRecommender
+from recommender.utils import check_sharded_recommendations
+
+# (the single-process reference, options of the sharded recommender)
+VARIANTS = [
+    (baseline_recommender.Recommender, {}),
+    (recommender_exluded_history.Recommender, {'exclude_history': True}),
+    (lambda: normalized_recommender.Recommender(online=True), {'exclude_history': True, 'normalize': True}),
+]
+
+
+@pytest.fixture(params=[2, 3])
+def n_shards(request):
+    return request.param
+
+
+@pytest.mark.parametrize('get_reference, options', VARIANTS)
+def test_sharded_recommendations(weighted_interactions, n_shards, get_reference, options):
+    """ The shard processes score the items as the single-process recommender.
+    """
+    reference = get_reference()
+    reference.put_interactions(weighted_interactions)
+    sharded = ShardedRecommender(n_shards=n_shards, **options)
+    try:
+        sharded.put_interactions(weighted_interactions[:1000])
+        for interaction in weighted_interactions[1000:1100]:
+            sharded.put_interaction(interaction['user_id'], interaction['item_id'], interaction['weight'])
+        sharded.put_interactions(weighted_interactions[1100:], chunk_size=333)
+
+        user_ids = sorted(reference.users)[:60] + ['user_missing']
+        assert check_sharded_recommendations(reference, sharded, user_ids) == 0
+    finally:
+        sharded.close()
+
+
+def test_different_networks_are_detected(weighted_interactions):
+    reference = baseline_recommender.Recommender()
+    reference.put_interactions(weighted_interactions)
+    sharded = ShardedRecommender(n_shards=2)
+    try:
+        sharded.put_interactions(weighted_interactions[:len(weighted_interactions) // 2])
+        assert check_sharded_recommendations(reference, sharded, sorted(reference.users)[:60]) > 0
+    finally:
+        sharded.close()
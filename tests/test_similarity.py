@@ -0,0 +1,65 @@
+from math import sqrt
+
+import pytest
+
+from recommender import user_neighbours_recommender
+from recommender.similarity import MEASURES, get_similarities
+
+
+def get_reference(user_a, user_b, measure):
+    """ The similarity of two users computed from its definition (see recommender.similarity).
+    """
+    profile_a, profile_b = dict(user_a.user_profile.items()), dict(user_b.user_profile.items())
+    common = [item_id for item_id in profile_a if item_id in profile_b]
+    if measure == 'cosine':
+        denominator = user_a.norm * user_b.norm
+        numerator = sum(profile_a[item_id] * profile_b[item_id] for item_id in common)
+    elif measure == 'jaccard':
+        denominator = len(profile_a) + len(profile_b) - len(common)
+        numerator = len(common)
+    else:
+        mean_a, mean_b = sum(profile_a.values()) / len(profile_a), sum(profile_b.values()) / len(profile_b)
+        denominator = (sqrt(sum((weight - mean_a) ** 2 for weight in profile_a.values())) *
+                       sqrt(sum((weight - mean_b) ** 2 for weight in profile_b.values())))
+        numerator = sum((profile_a[item_id] - mean_a) * (profile_b[item_id] - mean_b) for item_id in common)
+    return numerator / denominator if denominator > 0 else 0.0
+
+
+@pytest.mark.parametrize('measure', MEASURES)
+@pytest.mark.parametrize('compact', [False, True])
+def test_similarities_by_definition(weighted_interactions, measure, compact):
+    """ The similarities of the dict network equal the definition, the profiles are not modified by the lookups.
+    """
+    recommender = user_neighbours_recommender.Recommender(online=True, compact=compact, similarity=measure)
+    recommender.put_interactions(weighted_interactions)
+    profile_sizes = {user_id: len(user.user_profile) for user_id, user in recommender.users.items()}
+
+    user_ids = list(recommender.users)
+    for user_id in user_ids[:20]:
+        similarities = get_similarities(user_id, user_ids, recommender.users, measure)
+        expected = [get_reference(recommender.users[user_id], recommender.users[candidate_id], measure) for candidate_id in user_ids]
+        assert similarities.tolist() == pytest.approx(expected)
+    assert profile_sizes == {user_id: len(user.user_profile) for user_id, user in recommender.users.items()}
+
+
+@pytest.mark.parametrize('measure', MEASURES)
+def test_array_network_detects_the_same_neighbours(weighted_interactions, measure):
+    """ The neighbours detected by the dict and the array-backed networks are the same, with the same similarities.
+    """
+    recommenders = [user_neighbours_recommender.Recommender(online=True, similarity=measure),
+                    user_neighbours_recommender.Recommender(sparse=True, similarity=measure)]
+    for recommender in recommenders:
+        recommender.put_interactions(weighted_interactions)
+        recommender.detect_user_neighbours()
+
+    dict_recommender, sparse_recommender = recommenders
+    graph = sparse_recommender.graph
+    for user_id, user in dict_recommender.users.items():
+        offsets, similarities = graph.user_neighbours(graph.user_id2offset[user_id])
+        assert [graph.user_offset2id[offset] for offset in offsets.tolist()] == [neighbour['neighbour_id'] for neighbour in user.neighbours]
+        assert similarities.tolist() == pytest.approx([neighbour['similarity'] for neighbour in user.neighbours])
+
+
+def test_unknown_measure():
+    with pytest.raises(ValueError):
+        user_neighbours_recommender.Recommender(similarity='euclidean')
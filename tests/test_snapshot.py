@@ -0,0 +1,88 @@
+import pytest
+
+from recommender import baseline_recommender, user_neighbours_recommender
+from recommender.sparse_graph import SparseGraph
+
+
+def test_int_ids_round_trip(tmp_path, interactions):
+    """ Int ids are loaded as ints, so they are found by the original ids.
+    """
+    reference = baseline_recommender.Recommender()
+    for interaction in interactions:
+        reference.put_interaction(int(interaction['user_id'][5:]), int(interaction['item_id'][5:]), 1.0)
+    reference.save(str(tmp_path / 'snapshot'))
+    loaded = baseline_recommender.Recommender.load(str(tmp_path / 'snapshot'))
+
+    assert list(loaded.graph.user_offset2id) == list(reference.users)
+    assert all(isinstance(user_id, int) for user_id in loaded.graph.user_offset2id)
+    assert 'user_1' not in loaded.graph.user_id2offset
+    for user_id in list(reference.users)[:20]:
+        assert loaded.recommend(user_id) == reference.recommend(user_id)
+
+
+def test_mixed_ids_are_refused(tmp_path):
+    graph = SparseGraph()
+    graph.put_interaction('user_1', 1, 1.0)
+    graph.put_interaction(2, 1, 1.0)
+    with pytest.raises(ValueError):
+        graph.save(str(tmp_path / 'snapshot'))
+
+
+def test_all_neighbours_are_kept(tmp_path, interactions):
+    reference = user_neighbours_recommender.Recommender()
+    reference.put_interactions(interactions)
+    user_ids = list(reference.users)
+    for n_user, user_id in enumerate(user_ids):
+        reference.users[user_id].neighbours = [{'neighbour_id': user_ids[(n_user + shift) % len(user_ids)], 'similarity': 1.0 / shift}
+                                               for shift in range(1, 81 - n_user % 7)]
+    graph = SparseGraph.from_nodes(reference.users, reference.items)
+
+    assert graph.neighbour_offsets.shape == (len(user_ids), 80)
+    for user_offset, user_id in enumerate(user_ids):
+        neighbours = reference.users[user_id].neighbours
+        assert graph.neighbour_offsets[user_offset, :len(neighbours)].tolist() == [graph.user_id2offset[neighbour['neighbour_id']] for neighbour in neighbours]
+        assert (graph.neighbour_offsets[user_offset, len(neighbours):] == -1).all()
+
+
+def test_profiles_order_after_compaction(interactions):
+    """ A graph built from the dict nodes keeps the order of the dict profiles after further interactions.
+    """
+    reference = baseline_recommender.Recommender()
+    reference.put_interactions(interactions[:2000])
+    graph = SparseGraph.from_nodes(reference.users, reference.items)
+    for interaction in interactions[2000:]:
+        reference.put_interaction(interaction['user_id'], interaction['item_id'], 1.0)
+        graph.put_interaction(interaction['user_id'], interaction['item_id'], 1.0)
+    graph.compact()
+
+    for item_offset, item_id in enumerate(graph.item_offset2id):
+        users = graph.item_indices[graph.item_indptr[item_offset]:graph.item_indptr[item_offset + 1]]
+        assert [graph.user_offset2id[user_offset] for user_offset in users] == list(reference.items[item_id].item_profile)
+    for user_offset, user_id in enumerate(graph.user_offset2id):
+        items = graph.user_indices[graph.user_indptr[user_offset]:graph.user_indptr[user_offset + 1]]
+        assert [graph.item_offset2id[item_offset] for item_offset in items] == list(reference.users[user_id].user_profile)
+
+
+def test_refresh_after_loading_short_neighbour_lists(tmp_path, small_interactions):
+    """
+    A snapshot of a dict recommender with fewer neighbours than the detector keeps (the table is padded to its width)
+    is refreshed online, for the existing and for new users, as the dict recommender.
+    """
+    reference = user_neighbours_recommender.Recommender(online=True)
+    reference.put_interactions(small_interactions)
+    reference.detect_user_neighbours()
+    assert max(len(user.neighbours) for user in reference.users.values()) < 50
+    reference.save(str(tmp_path / 'snapshot'))
+    loaded = user_neighbours_recommender.Recommender.load(str(tmp_path / 'snapshot'), online=True)
+
+    for changes in ([('user_1', 'item_2', 3.0)], [('user_new', 'item_1', 1.0), ('user_new', 'item_3', 2.0)]):
+        for recommender in (reference, loaded):
+            for user_id, item_id, weight in changes:
+                recommender.put_interaction(user_id, item_id, weight)
+            recommender.refresh_neighbours()
+
+        graph = loaded.graph
+        for user_id, user in reference.users.items():
+            offsets, similarities = graph.user_neighbours(graph.user_id2offset[user_id])
+            assert [graph.user_offset2id[offset] for offset in offsets.tolist()] == [neighbour['neighbour_id'] for neighbour in user.neighbours]
+            assert similarities.tolist() == pytest.approx([neighbour['similarity'] for neighbour in user.neighbours])
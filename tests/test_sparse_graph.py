@@ -0,0 +1,114 @@
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from recommender import baseline_recommender, normalized_recommender, recommender_exluded_history, user_neighbours_recommender
+from recommender.sparse_graph import SparseGraph
+
+
+def test_compaction_updates_norms_by_changed_edges(weighted_interactions):
+    """ The norms updated by each compaction (only by the merged edges) are the norms of the whole profiles.
+    """
+    graph = SparseGraph(buffer_size=97)
+    reference = normalized_recommender.Recommender()
+    for interaction in weighted_interactions + weighted_interactions[::3]:
+        graph.put_interaction(interaction['user_id'], interaction['item_id'], interaction['weight'] * 1.1)
+        reference.put_interaction(interaction['user_id'], interaction['item_id'], interaction['weight'] * 1.1)
+    graph.put_interaction('user_0', 'item_0', -1.0)
+    reference.put_interaction('user_0', 'item_0', -1.0)
+    graph.compact()
+
+    user_norms, item_norms = graph.user_norms.copy(), graph.item_norms.copy()
+    graph.update_norms()
+    assert np.allclose(user_norms, graph.user_norms) and np.allclose(item_norms, graph.item_norms)
+
+    for node in list(reference.users.values()) + list(reference.items.values()):
+        node.update_norm()
+    assert np.allclose(user_norms, [reference.users[user_id].norm for user_id in graph.user_offset2id])
+    assert np.allclose(item_norms, [reference.items[item_id].norm for item_id in graph.item_offset2id])
+
+
+def test_find_edges_clamps_the_keys_past_the_end():
+    """ Keys greater than all edge keys are searched at the last position, they are not found.
+    """
+    positions, found = SparseGraph.find_edges(np.array([30, 10, 20]), np.array([10, 20, 30, 40, 5, 15]))
+    assert positions.tolist()[:3] == [1, 2, 0]
+    assert found.tolist() == [True, True, True, False, False, False]
+
+    positions, found = SparseGraph.find_edges(np.zeros(0, dtype=np.int64), np.array([1, 2]))
+    assert not found.any() and len(positions) == 2
+
+
+@pytest.mark.parametrize('module, options', [
+    (baseline_recommender, {}),
+    (recommender_exluded_history, {}),
+    (normalized_recommender, {'online': True}),
+    (user_neighbours_recommender, {'online': True}),
+])
+def test_set_interactions_as_the_dict_network(weighted_interactions, module, options):
+    """
+    Lowered, removed, repeated and new edges are set by the graph as by the dict network (the last weight of
+    a repeated edge is used), a removal of an unknown edge assigns no offsets. The norms are updated.
+    """
+    dict_recommender, sparse_recommender = module.Recommender(**options), module.Recommender(sparse=True)
+    changed = [dict(interaction, weight=[0.0, 0.3, 5.0][n_interaction % 3]) for n_interaction, interaction in enumerate(weighted_interactions[:600])]
+    changed += [{'user_id': 'user_0', 'item_id': 'item_new', 'weight': 2.0}, {'user_id': 'user_0', 'item_id': 'item_new', 'weight': 1.0},
+                {'user_id': 'user_missing', 'item_id': 'item_missing', 'weight': 0.0}]
+    for recommender in (dict_recommender, sparse_recommender):
+        recommender.put_interactions(weighted_interactions[:2000])
+        # The last changes are still in the append buffer of the graph.
+        recommender.put_interactions(weighted_interactions[2000:])
+        assert recommender.set_interactions(changed) == len(changed)
+
+    graph = sparse_recommender.graph
+    assert 'user_missing' not in graph.user_id2offset and 'item_missing' not in graph.item_id2offset
+    assert len(graph.buffer_users) == 0
+    for user_id, user in dict_recommender.users.items():
+        items, weights = graph.user_items(graph.user_id2offset[user_id])
+        assert dict(zip([graph.item_offset2id[item] for item in items.tolist()], weights.tolist())) == dict(user.user_profile)
+        if options:
+            assert graph.user_norms[graph.user_id2offset[user_id]] == pytest.approx(user.norm)
+    assert dict_recommender.users['user_0'].user_profile['item_new'] == 1.0
+
+
+def get_scores(recommender, user_id):
+    """ The item scores of the dict network, the neighbours recommender scores the items of the detected neighbours.
+    """
+    if hasattr(recommender, 'get_item_scores'):
+        return recommender.get_item_scores(user_id)
+
+    user = recommender.users[user_id]
+    scores = defaultdict(float)
+    for neighbour in user.neighbours:
+        for item_id, weight in recommender.users[neighbour['neighbour_id']].user_profile.items():
+            if item_id not in user.user_profile:
+                scores[item_id] += neighbour['similarity'] * weight
+    return scores
+
+
+@pytest.mark.parametrize('module, options', [
+    (baseline_recommender, {}),
+    (recommender_exluded_history, {}),
+    (normalized_recommender, {'online': True}),
+    (user_neighbours_recommender, {'online': True}),
+])
+def test_sparse_recommends_as_the_dict_network(weighted_interactions, module, options):
+    """ recommend and recommend_many of the array-backed network rank the items as the dicts, up to the tied scores.
+    """
+    dict_recommender, sparse_recommender = module.Recommender(**options), module.Recommender(sparse=True)
+    for recommender in (dict_recommender, sparse_recommender):
+        recommender.put_interactions(weighted_interactions)
+        if module is user_neighbours_recommender:
+            recommender.detect_user_neighbours()
+
+    user_ids = sorted(dict_recommender.users) + ['user_unknown']
+    expected = dict_recommender.recommend_many(user_ids)
+    for user_id, sparse_many, expected_items in zip(user_ids, sparse_recommender.recommend_many(user_ids), expected):
+        assert dict_recommender.recommend(user_id) == expected_items
+        for actual in (sparse_recommender.recommend(user_id), sparse_many):
+            if actual == expected_items:
+                continue
+            scores = get_scores(dict_recommender, user_id)
+            assert len(actual) == len(expected_items) and all(item_id in scores for item_id in actual)
+            assert [scores[item_id] for item_id in actual] == pytest.approx([scores[item_id] for item_id in expected_items])
@@ -0,0 +1,52 @@
+import json
+import zlib
+
+import pytest
+
+from recommender.streaming import is_test_interaction, iter_interactions, iter_json_array, split_interactions
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 1024 * 1024])
+@pytest.mark.parametrize('indent', [None, 2])
+def test_json_array_is_decoded_across_chunk_boundaries(tmp_path, interactions, chunk_size, indent):
+    """ Objects (and separators) split by the chunk boundaries are decoded the same as by json.load.
+    """
+    dataset = interactions[:50] + [{'user_id': 'u "quoted", [bracket]', 'item_id': 'i\\u00e9', 'weight': 1.5}]
+    filename = str(tmp_path / 'dataset.json')
+    with open(filename, 'w') as dataset_file:
+        json.dump(dataset, dataset_file, indent=indent)
+
+    assert list(iter_json_array(filename, chunk_size=chunk_size)) == dataset
+    assert list(iter_interactions(filename)) == dataset
+
+
+def test_json_array_errors(tmp_path):
+    for content in ['{"user_id": "a"}', '[{"user_id": "a"}, {"user_id": ']:
+        filename = str(tmp_path / 'broken.json')
+        with open(filename, 'w') as dataset_file:
+            dataset_file.write(content)
+        with pytest.raises(ValueError):
+            list(iter_json_array(filename, chunk_size=4))
+
+    filename = str(tmp_path / 'empty.json')
+    with open(filename, 'w') as dataset_file:
+        dataset_file.write(' [ ] ')
+    assert list(iter_json_array(filename, chunk_size=1)) == []
+
+
+def test_split_is_deterministic_and_disjoint(interactions):
+    """ The split depends only on the (user, item) pair, not on the order, the weight or the process.
+    """
+    train = list(split_interactions(interactions))
+    test = list(split_interactions(interactions, test=True))
+    assert len(train) + len(test) == len(interactions)
+    assert 0.05 < len(test) / len(interactions) < 0.15
+
+    pairs = set((interaction['user_id'], interaction['item_id']) for interaction in test)
+    assert not pairs & set((interaction['user_id'], interaction['item_id']) for interaction in train)
+    assert list(split_interactions(reversed(interactions), test=True)) == test[::-1]
+    assert all(is_test_interaction(dict(interaction, weight=7.0)) for interaction in test)
+
+    # The hash is CRC32 of "user_id<TAB>item_id", it does not change between runs (unlike hash()).
+    assert zlib.crc32(b'user_1\titem_2') % 10000 == 2509
+    assert is_test_interaction({'user_id': 'user_1', 'item_id': 'item_2'}) is False